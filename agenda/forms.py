@@ -1,5 +1,7 @@
 from django import forms
+from django.utils.translation import gettext as _
 from agenda.models import Event
+from users.models import TeamArea
 
 
 class EventForm(forms.ModelForm):
@@ -41,3 +43,44 @@ class EventForm(forms.ModelForm):
 
         for field, initial in initials.items():
             self.fields[field].initial = initial
+
+
+class EventFeedForm(forms.Form):
+    """
+    Filters of the calendar feed, read from the query string.
+
+    Fields:
+        - area: Only the events under the responsibility of this area
+        - involved: Only the events involving this area
+        - start: Only the events ending on or after this day
+        - end: Only the events beginning on or before this day
+    """
+    area = forms.ModelChoiceField(queryset=TeamArea.objects.all(), required=False)
+    involved = forms.ModelChoiceField(queryset=TeamArea.objects.all(), required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get("start"), cleaned_data.get("end")
+        if start and end and start > end:
+            raise forms.ValidationError(_("The beginning of the range must come before its end"))
+        return cleaned_data
+
+    def filter(self, events):
+        """
+        Applies the filters to a queryset of events.
+
+        :param events: Queryset of events.
+        :return: Queryset of the events matching the filters.
+        """
+        data = self.cleaned_data
+        if data["area"]:
+            events = events.filter(area_responsible=data["area"])
+        if data["involved"]:
+            events = events.filter(area_involved=data["involved"])
+        if data["start"]:
+            events = events.filter(end_date__gte=data["start"])
+        if data["end"]:
+            events = events.filter(initial_date__lte=data["end"])
+        return events
@@ -0,0 +1,88 @@
+import datetime
+from django.utils import timezone
+
+PRODUCT_ID = "-//SARA//Agenda//PT"
+
+
+def escape_text(text):
+    """
+    Escapes a text value of iCalendar (RFC 5545, section 3.3.11).
+
+    :param text: Text to escape.
+    :return: Escaped text.
+    """
+    text = text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+    return text.replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n")
+
+
+def fold_line(line):
+    """
+    Folds a content line in lines of at most 75 octets, the following ones starting with a space.
+
+    :param line: Content line, without its line break.
+    :return: Bytes of the folded line, with its line break.
+    """
+    data = line.encode("utf-8")
+    chunks = []
+    limit = 75
+    while len(data) > limit:
+        # A multibyte character is never split between two lines
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        chunks.append(data[:cut])
+        data = data[cut:]
+        limit = 74
+    chunks.append(data)
+    return b"\r\n ".join(chunks) + b"\r\n"
+
+
+def format_date(date):
+    return date.strftime("%Y%m%d")
+
+
+def format_datetime(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def event_lines(event, uid, url):
+    """
+    Content lines of an event of the agenda. The events take whole days, so the end is the day after the last one.
+
+    :param event: Event, with its area responsible.
+    :param uid: Identifier of the event, unique among every calendar.
+    :param url: Address of the page of the event.
+    :return: List of content lines.
+    """
+    return [
+        "BEGIN:VEVENT",
+        "UID:" + uid,
+        "DTSTAMP:" + format_datetime(event.updated_at),
+        "LAST-MODIFIED:" + format_datetime(event.updated_at),
+        "DTSTART;VALUE=DATE:" + format_date(event.initial_date),
+        "DTEND;VALUE=DATE:" + format_date(event.end_date + datetime.timedelta(days=1)),
+        "SUMMARY:" + escape_text(event.name),
+        "CATEGORIES:" + escape_text(event.area_responsible.text),
+        "URL:" + url,
+        "END:VEVENT",
+    ]
+
+
+def iter_calendar(events, name, uid, url):
+    """
+    Writes a calendar one event at a time.
+
+    :param events: Iterable of events, such as the iterator of a queryset.
+    :param name: Name of the calendar.
+    :param uid: Function receiving an event and returning its identifier.
+    :param url: Function receiving an event and returning the address of its page.
+    :return: Generator of bytes.
+    """
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:" + PRODUCT_ID, "CALSCALE:GREGORIAN",
+              "X-WR-CALNAME:" + escape_text(name)]
+    yield b"".join(fold_line(line) for line in header)
+    for event in events:
+        yield b"".join(fold_line(line) for line in event_lines(event, uid(event), url(event)))
+    yield fold_line("END:VCALENDAR")
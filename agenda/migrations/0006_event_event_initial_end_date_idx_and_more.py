@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0005_event_activity_associated'),
+        ('metrics', '0018_project_project_current_poa_idx_and_more'),
+        ('users', '0012_alter_userprofile_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['initial_date', 'end_date'], name='event_initial_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['area_responsible', 'initial_date'], name='event_area_initial_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['area_responsible', 'end_date'], name='event_area_end_date_idx'),
+        ),
+    ]
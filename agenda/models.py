@@ -16,6 +16,7 @@ class Event(models.Model):
         - end_date: Date of the ending of the event
         - area_responsible: Area responsible for the event
         - area_involved: Areas involved in/activated for the event
+        - updated_at: Date of the last change of the event, used by the calendar feed
 
     Meta:
         - verbose_name: A human-readable name for the model (singular).
@@ -32,10 +33,17 @@ class Event(models.Model):
     area_involved = models.ManyToManyField(TeamArea, related_name="area_involved", blank=True)
     metric_associated = models.ManyToManyField(Metric, related_name="event_metrics", blank=True)
     activity_associated = models.ForeignKey(Activity, on_delete=models.RESTRICT, related_name="event_activity", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = _("Event")
         verbose_name_plural = _("Events")
+        indexes = [
+            # The calendar looks for the events overlapping a range and the reminders for those of an area
+            models.Index(fields=["initial_date", "end_date"], name="event_initial_end_date_idx"),
+            models.Index(fields=["area_responsible", "initial_date"], name="event_area_initial_date_idx"),
+            models.Index(fields=["area_responsible", "end_date"], name="event_area_end_date_idx"),
+        ]
 
     def __str__(self):
         if self.end_date == self.initial_date:
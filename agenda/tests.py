@@ -1,5 +1,8 @@
 import datetime
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from metrics.testing import QueryBudgetMixin
+from django.db import connection
 from django.urls import reverse
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -49,7 +52,7 @@ class EventModelTests(TestCase):
             event.full_clean()
 
 
-class EventViewTests(TestCase):
+class EventViewTests(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.username = "testuser"
         self.password = "testpass"
@@ -81,6 +84,95 @@ class EventViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'agenda/calendar.html')
 
+    def test_show_specific_calendar_queries_the_events_once_for_the_whole_month(self):
+        self.client.login(username=self.username, password=self.password)
+        Event.objects.create(name="Overlapping the month", initial_date=datetime.date(2023, 3, 28),
+                             end_date=datetime.date(2023, 4, 2), area_responsible=self.team_area)
+        Event.objects.create(name="Next month", initial_date=datetime.date(2023, 5, 1),
+                             end_date=datetime.date(2023, 5, 1), area_responsible=self.team_area)
+        url = reverse('agenda:show_specific_calendar', kwargs={"year": self.year, "month": self.month})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few_events:
+            self.client.get(url)
+
+        for day in range(1, 31):
+            Event.objects.create(name="Event {}".format(day), initial_date=datetime.date(2023, 4, day),
+                                 end_date=datetime.date(2023, 4, day), area_responsible=self.team_area)
+        with CaptureQueriesContext(connection) as many_events:
+            response = self.client.get(url)
+
+        self.assertEqual(len(many_events), len(few_events))
+        self.assertWithinQueryBudget(response)
+        days = response.context["events_by_day"]
+        self.assertEqual([event.name for event in days[datetime.date(2023, 4, 2)]],
+                         ["Overlapping the month", "Event 2"])
+        self.assertEqual([event.name for event in days[datetime.date(2023, 4, 3)]], ["Event 3"])
+        self.assertNotIn(datetime.date(2023, 3, 31), days)
+        self.assertContains(response, "Overlapping the month", count=4)
+
+    def test_events_feed_lists_the_events_matching_the_filters(self):
+        other_area = TeamArea.objects.create(text="Other area", code="Other")
+        event = Event.objects.create(name="Meeting, with; commas", initial_date=datetime.date(2023, 4, 10),
+                                     end_date=datetime.date(2023, 4, 11), area_responsible=self.team_area)
+        event.area_involved.add(other_area)
+        Event.objects.create(name="Other meeting", initial_date=datetime.date(2023, 5, 10),
+                             end_date=datetime.date(2023, 5, 10), area_responsible=other_area)
+
+        response = self.client.get(reverse("agenda:events_feed"), {"involved": other_area.pk, "end": "2023-04-30"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertTrue(content.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertTrue(content.endswith("END:VCALENDAR\r\n"))
+        self.assertEqual(content.count("BEGIN:VEVENT"), 1)
+        self.assertIn("SUMMARY:Meeting\\, with\\; commas\r\n", content)
+        self.assertIn("DTSTART;VALUE=DATE:20230410\r\nDTEND;VALUE=DATE:20230412\r\n", content)
+        self.assertIn("UID:event-{}@testserver\r\n".format(event.pk), content)
+
+        response = self.client.get(reverse("agenda:events_feed"), {"area": other_area.pk})
+        self.assertEqual(b"".join(response.streaming_content).count(b"BEGIN:VEVENT"), 1)
+
+    def test_events_feed_with_invalid_filters_returns_bad_request(self):
+        response = self.client.get(reverse("agenda:events_feed"), {"start": "2023-05-01", "end": "2023-04-01"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_events_feed_is_revalidated_until_an_event_changes(self):
+        url = reverse("agenda:events_feed")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertWithinQueryBudget(response)
+
+        self.event.name = "Renamed"
+        self.event.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        Event.objects.create(name="New", initial_date=datetime.date(2023, 4, 10), end_date=datetime.date(2023, 4, 10),
+                             area_responsible=self.team_area).delete()
+        self.event.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        self.team_area.text = "Renamed area"
+        self.team_area.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_events_feed_folds_long_lines_without_splitting_characters(self):
+        Event.objects.create(name="Edit-a-thon " + "çã" * 60, initial_date=datetime.date(2023, 4, 10),
+                             end_date=datetime.date(2023, 4, 10), area_responsible=self.team_area)
+        content = b"".join(self.client.get(reverse("agenda:events_feed")).streaming_content)
+
+        self.assertTrue(all(len(line) <= 75 for line in content.split(b"\r\n")))
+        self.assertIn("SUMMARY:Edit-a-thon " + "çã" * 60, content.decode("utf-8").replace("\r\n ", ""))
+
     def test_show_calendar_day_for_logged_user(self):
         self.client.login(username=self.username, password=self.password)
         response = self.client.get(reverse('agenda:show_calendar_day'))
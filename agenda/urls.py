@@ -7,6 +7,7 @@ app_name = 'agenda'
 urlpatterns = [
     path('', views.show_calendar, name='show_calendar'),
     path('day', views.show_calendar_day, name='show_calendar_day'),
+    path('feed.ics', views.events_feed, name='events_feed'),
     path('add', views.add_event, name="create_event"),
     path('list', views.list_events, name="list_events"),
     path('activity/<int:event_id>', views.detail_event, name="detail_event"),
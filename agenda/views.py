@@ -1,5 +1,7 @@
 import calendar
 import datetime
+import hashlib
+import json
 from django.db import transaction
 from django.contrib import messages
 from django.shortcuts import render, redirect, reverse, get_object_or_404
@@ -7,11 +9,15 @@ from django.contrib.auth.decorators import login_required
 from django.utils.translation import gettext as _
 from django.core.mail import EmailMessage
 from django.template.loader import get_template
-from django.db.models import Q
+from django.db.models import Q, Count, Max
 from django.conf import settings
-from agenda.forms import EventForm
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import condition
+from agenda.forms import EventForm, EventFeedForm
+from agenda.ics import iter_calendar
 from agenda.models import Event
 from users.models import TeamArea, UserProfile
+from users.idempotency import idempotent
 
 
 # MONTH CALENDAR
@@ -39,8 +45,10 @@ def show_specific_calendar(request, year, month):
     """
     days_month = days_of_the_month(int(year), int(month))
     month_name = _(calendar.month_name[int(month)])
+    last_day = calendar.monthrange(int(year), int(month))[1]
+    events = events_by_day(datetime.date(int(year), int(month), 1), datetime.date(int(year), int(month), last_day))
 
-    context = {"calendar": days_month, "month": month, "month_name": month_name, "year": year, "title": _("Calendar %(month_name)s/%(year)s") % {"month_name": month_name, "year": year}}
+    context = {"calendar": days_month, "events_by_day": events, "month": month, "month_name": month_name, "year": year, "title": _("Calendar %(month_name)s/%(year)s") % {"month_name": month_name, "year": year}}
     return render(request, "agenda/calendar.html", context)
 
 
@@ -73,8 +81,9 @@ def show_specific_calendar_day(request, year, month, day):
     month_aux = month
     year_aux = year
     month_name = _(calendar.month_name[int(month)])
+    date = datetime.date(int(year), int(month), int(day))
 
-    context = {"month_name": month_name, "year": year_aux, "month": month_aux, "day": day_aux, "title": _("Calendar %(day)s/%(month_name)s/%(year)s") % {"day": day_aux, "month_name": month_name, "year": year}}
+    context = {"events_by_day": events_by_day(date, date), "month_name": month_name, "year": year_aux, "month": month_aux, "day": day_aux, "title": _("Calendar %(day)s/%(month_name)s/%(year)s") % {"day": day_aux, "month_name": month_name, "year": year}}
     return render(request, "agenda/calendar_day.html", context)
 
 
@@ -89,8 +98,95 @@ def days_of_the_month(year, month):
     return calendar.monthcalendar(int(year), int(month))
 
 
+def events_by_day(first_day, last_day):
+    """
+    Indexes the events happening in a range of days by day, with a single query.
+
+    :param first_day: First day shown.
+    :param last_day: Last day shown.
+    :return: Dictionary of date to the list of events happening that day, ordered by their beginning.
+    """
+    events = Event.objects.filter(initial_date__lte=last_day, end_date__gte=first_day).select_related(
+        "area_responsible").order_by("initial_date", "pk")
+
+    days = {}
+    for event in events:
+        day = max(event.initial_date, first_day)
+        while day <= min(event.end_date, last_day):
+            days.setdefault(day, []).append(event)
+            day += datetime.timedelta(days=1)
+    return days
+
+
+# FEED
+FEED_CHUNK_SIZE = 500
+
+
+def event_feed_form(request):
+    if not hasattr(request, "event_feed_form"):
+        request.event_feed_form = EventFeedForm(request.GET)
+    return request.event_feed_form
+
+
+def event_feed_summary(request):
+    """
+    Number of events in the feed, date of the latest change among them and names of the areas, computed once per
+    request.
+
+    :param request: The HTTP request object, with the filters in its query string.
+    :return: Dictionary with the count, the latest change and the areas, or None if the filters are not valid.
+    """
+    if not hasattr(request, "event_feed_summary"):
+        form = event_feed_form(request)
+        summary = None
+        if form.is_valid():
+            summary = form.filter(Event.objects.all()).aggregate(count=Count("pk"), latest=Max("updated_at"))
+            # The events show the name of their area, which can change without changing the events
+            summary["areas"] = list(TeamArea.objects.order_by("pk").values_list("pk", "text"))
+        request.event_feed_summary = summary
+    return request.event_feed_summary
+
+
+def event_feed_etag(request, *args, **kwargs):
+    # The count changes when an event is deleted, which leaves the latest change untouched. There is no Last-Modified,
+    # since no date changes with a deletion or with the name of an area
+    summary = event_feed_summary(request)
+    if summary is None:
+        return None
+    data = [request.GET.urlencode(), summary["count"], str(summary["latest"]), summary["areas"]]
+    return hashlib.sha256(json.dumps(data).encode("utf-8")).hexdigest()
+
+
+@condition(etag_func=event_feed_etag)
+def events_feed(request):
+    """
+    Serves the events of the agenda as an iCalendar feed, written while the events are read from the database.
+
+    Calendar clients revalidate the feed with its ETag, and receive a 304 response while no event matching the
+    filters or area changed.
+
+    :param request: The HTTP request object, with the optional filters area, involved, start and end.
+    :return: StreamingHttpResponse: The feed, or a 400 response if the filters are not valid.
+    """
+    form = event_feed_form(request)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type="text/plain; charset=utf-8")
+
+    events = form.filter(Event.objects.select_related("area_responsible")).order_by("initial_date", "pk")
+    host = request.get_host().split(":")[0]
+    calendar_content = iter_calendar(
+        events.iterator(chunk_size=FEED_CHUNK_SIZE), _("Calendar"),
+        uid=lambda event: "event-{}@{}".format(event.pk, host),
+        url=lambda event: request.build_absolute_uri(reverse("agenda:detail_event", kwargs={"event_id": event.pk})))
+
+    response = StreamingHttpResponse(calendar_content, content_type="text/calendar; charset=utf-8")
+    response["Content-Disposition"] = 'inline; filename="agenda.ics"'
+    return response
+
+
 # CREATE
 @login_required
+@idempotent
 @transaction.atomic
 def add_event(request):
     form_valid_message = _("Changes done successfully!")
@@ -1,18 +1,19 @@
 import csv
 import datetime
-import pandas as pd
 from django.contrib.auth.decorators import permission_required, user_passes_test
 from django.shortcuts import render, redirect, reverse, get_object_or_404, HttpResponse
 from django.utils.translation import gettext as _
 from django.contrib import messages
 from .forms import BugForm, ObservationForm, BugUpdateForm
 from .models import Bug, Observation
+from users.idempotency import idempotent
 import zipfile
 from django.contrib.auth.models import Permission
 from io import BytesIO
 
 
 @permission_required("bug.add_bug")
+@idempotent
 def add_bug(request):
     if request.method == "POST":
         bug_form = BugForm(request.POST)
@@ -41,6 +42,23 @@ def list_bugs(request):
 
 @permission_required("bug.view_bug")
 def export_bugs(request):
+    file_name, content = build_bugs_export()
+    response = HttpResponse(content)
+    response['Content-Type'] = 'application/x-zip-compressed'
+    response['Content-Disposition'] = 'attachment; filename=' + file_name
+
+    return response
+
+
+def build_bugs_export():
+    """
+    Name and content of the zip file exporting the bugs, as CSV and Excel files.
+
+    :return: (file name, bytes) tuple.
+    """
+    # pandas is only needed for this export, so it is not loaded with the views
+    import pandas as pd
+
     buffer = BytesIO()
     zip_file = zipfile.ZipFile(buffer, mode="w")
     posfix = " - {}".format(datetime.datetime.today().strftime('%Y-%m-%d %H-%M-%S'))
@@ -78,11 +96,7 @@ def export_bugs(request):
     zip_file.writestr("{}.xlsx".format("Bug report" + posfix), excel_file.getvalue())
 
     zip_file.close()
-    response = HttpResponse(buffer.getvalue())
-    response['Content-Type'] = 'application/x-zip-compressed'
-    response['Content-Disposition'] = 'attachment; filename=' + zip_name + posfix + '.zip'
-
-    return response
+    return zip_name + posfix + '.zip', buffer.getvalue()
 
 
 @permission_required("bug.view_bug")
@@ -0,0 +1,432 @@
+import datetime
+from django.db.models import Q, F, Sum, Count, Max, Case, When, Value, Exists, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+from report.models import Report, Editor, Organizer, Partner, OperationReport
+
+# Join table between reports and the metrics they are related to
+MetricRelation = Report.metrics_related.through
+
+
+# Content and community metrics that are the sum of columns of the reports
+REPORT_FIELDS = {
+    "Wikipedia": ["wikipedia_created", "wikipedia_edited"],
+    "Wikimedia Commons": ["commons_created", "commons_edited"],
+    "Wikidata": ["wikidata_created", "wikidata_edited"],
+    "Wikiversity": ["wikiversity_created", "wikiversity_edited"],
+    "Wikibooks": ["wikibooks_created", "wikibooks_edited"],
+    "Wikisource": ["wikisource_created", "wikisource_edited"],
+    "Wikinews": ["wikinews_created", "wikinews_edited"],
+    "Wikiquote": ["wikiquote_created", "wikiquote_edited"],
+    "Wiktionary": ["wiktionary_created", "wiktionary_edited"],
+    "Wikivoyage": ["wikivoyage_created", "wikivoyage_edited"],
+    "Wikispecies": ["wikispecies_created", "wikispecies_edited"],
+    "MetaWiki": ["metawiki_created", "metawiki_edited"],
+    "MediaWiki": ["mediawiki_created", "mediawiki_edited"],
+    "Number of participants": ["participants"],
+    "Number of feedbacks": ["feedbacks"],
+}
+
+# Metrics stored on the operation reports. The boolean tells whether the value falls back to the operation
+# reports of every metric of the reports when nothing was registered for the metric itself
+OPERATION_FIELDS = {
+    "Number of new partnerships": ("number_of_new_partnerships", False),
+    "Number of resources": ("number_of_resources", True),
+    "Number of events": ("number_of_events", True),
+    "Number of new followers": ("number_of_new_followers", True),
+    "Number of mentions": ("number_of_mentions", True),
+    "Number of community communications": ("number_of_community_communications", True),
+    "Number of people reached through social media": ("number_of_people_reached_through_social_media", True),
+}
+
+# Metrics that count distinct people or institutions related to the reports
+PEOPLE_FIELDS = {
+    "Number of editors": ("editors", "total"),
+    "Number of editors retained": ("editors", "retained"),
+    "Number of partnerships activated": ("partners", "total"),
+    "Number of organizers": ("organizers", "total"),
+    "Number of organizers retained": ("organizers", "retained"),
+}
+
+# Same order as metrics.views.get_goal_for_metric
+DONE_KEYS = [
+    "Wikipedia", "Wikimedia Commons", "Wikidata", "Wikiversity", "Wikibooks", "Wikisource", "Wikinews", "Wikiquote",
+    "Wiktionary", "Wikivoyage", "Wikispecies", "MetaWiki", "MediaWiki",
+    "Number of editors", "Number of editors retained", "Number of new editors", "Number of participants",
+    "Number of partnerships activated", "Number of new partnerships", "Number of organizers",
+    "Number of organizers retained", "Number of resources", "Number of feedbacks", "Number of events",
+    "Number of new followers", "Number of mentions", "Number of community communications",
+    "Number of people reached through social media", "Occurrence",
+]
+
+
+def trimester_timespans(year):
+    """
+    Timespans of the four trimesters of the reports, followed by the whole year.
+
+    :param year: Year of the timespans.
+    :return: List of (initial date, end date) tuples.
+    """
+    return [
+        (datetime.date(year, 1, 1), datetime.date(year, 3, 31)),
+        (datetime.date(year, 4, 1), datetime.date(year, 6, 18)),
+        (datetime.date(year, 6, 19), datetime.date(year, 9, 20)),
+        (datetime.date(year, 9, 21), datetime.date(year, 12, 31)),
+        (datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+    ]
+
+
+def get_done_for_reports(reports, metric):
+    """
+    Computes what was done for a metric by a queryset of reports.
+
+    It replaces the per-key aggregates with three grouped queries: one over the columns of the reports, one over the
+    operation reports and one counting the distinct editors, organizers and partners.
+
+    :param reports: Queryset of reports.
+    :param metric: Metric whose operation reports must be considered.
+    :return: Dictionary with the same keys as get_goal_for_metric.
+    """
+    totals = aggregate_report_fields(reports)
+    operations = aggregate_operation_fields(reports, metric)
+    people = count_people(reports)
+
+    return build_done(totals, operations, people)
+
+
+def build_done(totals, operations, people):
+    """
+    Assembles the "done" dictionary from the raw aggregates.
+
+    :param totals: Dictionary with the sums of REPORT_FIELDS (aliased by their first field), "new_editors" and
+                   "occurrence".
+    :param operations: Dictionary of operation report fields to a (metric total, all metrics total) tuple.
+    :param people: Dictionary of relation name to a {"total": int, "retained": int} dictionary.
+    :return: Dictionary with the same keys as get_goal_for_metric.
+    """
+    done = {}
+    for key in DONE_KEYS:
+        if key in REPORT_FIELDS:
+            done[key] = totals.get(REPORT_FIELDS[key][0]) or 0
+        elif key == "Number of new editors":
+            done[key] = totals.get("new_editors") or 0
+        elif key in OPERATION_FIELDS:
+            field, fallback = OPERATION_FIELDS[key]
+            metric_total, all_total = operations.get(field, (0, 0))
+            done[key] = (metric_total or all_total or 0) if fallback else (metric_total or 0)
+        elif key in PEOPLE_FIELDS:
+            relation, kind = PEOPLE_FIELDS[key]
+            done[key] = people.get(relation, {}).get(kind) or 0
+        else:
+            done[key] = bool(totals.get("occurrence"))
+    return done
+
+
+def report_totals_expressions(prefix=""):
+    """
+    Aggregate expressions for the columns of the reports, aliased by the first field of each "done" key.
+
+    :param prefix: Path from the queried model to the report, e.g. "report__".
+    :return: Dictionary of key to Sum expression.
+    """
+    expressions = {}
+    for fields in REPORT_FIELDS.values():
+        expression = F(prefix + fields[0])
+        for field in fields[1:]:
+            expression += F(prefix + field)
+        expressions[fields[0]] = Sum(expression)
+    return expressions
+
+
+def new_editors_subquery(report_ref="pk", initial_date_ref="initial_date"):
+    """
+    Number of editors of a report whose account was created on or after the beginning of the activity.
+
+    :param report_ref: Name of the outer field holding the report id.
+    :param initial_date_ref: Name of the outer field holding the initial date of the report.
+    """
+    new_editors = Editor.objects.filter(
+        editors=OuterRef(report_ref), account_creation_date__gte=OuterRef(initial_date_ref)
+    ).order_by().values("editors").annotate(total=Count("pk")).values("total")
+    return Coalesce(Subquery(new_editors, output_field=IntegerField()), 0)
+
+
+def occurrence_expression(report_ref="pk"):
+    """
+    1 if the report is related to any boolean metric, 0 otherwise.
+
+    :param report_ref: Name of the outer field holding the report id.
+    """
+    boolean_metrics = MetricRelation.objects.filter(report=OuterRef(report_ref), metric__boolean_type=True)
+    return Case(When(Exists(boolean_metrics), then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def aggregate_report_fields(reports):
+    """
+    Sums the columns of the reports, the new editors and the occurrences in a single query.
+
+    :param reports: Queryset of reports.
+    :return: Dictionary of aliases to totals.
+    """
+    annotated = reports.annotate(report_new_editors=new_editors_subquery(),
+                                 report_occurrence=occurrence_expression())
+    return annotated.aggregate(**report_totals_expressions(),
+                               new_editors=Sum("report_new_editors"),
+                               occurrence=Max("report_occurrence"))
+
+
+def aggregate_operation_fields(reports, metric):
+    """
+    Sums the operation reports of the reports, both for the metric and for every metric, in a single query.
+
+    :param reports: Queryset of reports.
+    :param metric: Metric of the operation reports.
+    :return: Dictionary of field to a (metric total, all metrics total) tuple.
+    """
+    expressions = {}
+    for field, fallback in OPERATION_FIELDS.values():
+        expressions["metric_" + field] = Sum(field, filter=Q(metric=metric))
+        expressions["all_" + field] = Sum(field)
+    totals = OperationReport.objects.filter(report__in=reports).aggregate(**expressions)
+
+    return {field: (totals["metric_" + field], totals["all_" + field]) for field, fallback in OPERATION_FIELDS.values()}
+
+
+def count_people(reports):
+    """
+    Counts the distinct editors, organizers and partners of the reports in a single query.
+
+    :param reports: Queryset of reports.
+    :return: Dictionary of relation name to a {"total": int, "retained": int} dictionary.
+    """
+    editors = Editor.objects.filter(editors__in=reports).order_by().values(relation=Value("editors")).annotate(
+        total=Count("pk", distinct=True), retained=Count("pk", distinct=True, filter=Q(retained=True)))
+    organizers = Organizer.objects.filter(organizers__in=reports).order_by().values(
+        relation=Value("organizers")).annotate(total=Count("pk", distinct=True),
+                                               retained=Count("pk", distinct=True, filter=Q(retained=True)))
+    partners = Partner.objects.filter(partners__in=reports).order_by().values(relation=Value("partners")).annotate(
+        total=Count("pk", distinct=True), retained=Value(0))
+
+    return {row["relation"]: row for row in editors.union(organizers, partners, all=True)}
+
+
+def get_done_for_metrics(metrics, report_query=Q(), timespans=None, group_by=None, groups=()):
+    """
+    Computes what was done for many metrics at once, optionally for many timespans.
+
+    Timespans that do not overlap are computed together: a CASE on the end date of the reports puts each report in
+    the bucket of its timespan, and three queries grouped by metric and bucket compute every bucket. Timespans
+    exactly covered by consecutive other timespans, such as a year and its trimesters, add up the totals of their
+    parts and only count the distinct editors, organizers and partners again, in one query.
+
+    With group_by, the reports are also grouped by one of their fields, so every group is computed by the same
+    queries instead of one call per group.
+
+    :param metrics: Iterable of metrics.
+    :param report_query: Q object applied to the reports of every metric.
+    :param timespans: List of (initial date, end date) tuples compared against the end date of the reports. If None,
+                      the reports are not filtered by date.
+    :param group_by: Name of a field of the reports, such as "area_responsible", to group the reports by.
+    :param groups: Values of group_by to return, including the ones without reports.
+    :return: Dictionary of metric id to a list, aligned with the timespans, of (done, final) tuples, where done has
+             the same keys as get_goal_for_metric and final tells if there is a final report among the reports.
+             With group_by, a dictionary of group to such a dictionary.
+    """
+    metric_ids = [metric.id for metric in metrics]
+    windows = timespans if timespans is not None else [None]
+    parts = split_timespans(windows)
+    groups = list(groups) if group_by else [None]
+
+    buckets = {index: window for index, window in enumerate(windows) if index not in parts}
+    if are_disjoint(buckets.values()):
+        passes = [buckets]
+    else:
+        passes = [{index: window} for index, window in buckets.items()]
+
+    totals, operations, people = {}, {}, {}
+    for windows_of_pass in passes:
+        relations = bucket_relations(metric_ids, report_query, windows_of_pass, group_by)
+        totals.update(aggregate_report_fields_per_metric(relations))
+        operations.update(aggregate_operation_fields_per_metric(relations))
+        people.update(count_people_per_metric(relations))
+
+    for index in sorted(parts, key=lambda index: windows[index][1] - windows[index][0]):
+        for metric_id in metric_ids:
+            for group in groups:
+                totals[(metric_id, group, index)] = combine_totals([totals.get((metric_id, group, part), {})
+                                                                    for part in parts[index]])
+                operations[(metric_id, group, index)] = combine_operations([
+                    operations.get((metric_id, group, part), {}) for part in parts[index]])
+        people.update(count_people_per_metric(bucket_relations(metric_ids, report_query, {index: windows[index]},
+                                                               group_by)))
+
+    matrices = {}
+    for group in groups:
+        matrix = matrices[group] = {metric_id: [] for metric_id in metric_ids}
+        for index in range(len(windows)):
+            for metric_id in metric_ids:
+                cell = (metric_id, group, index)
+                metric_totals = totals.get(cell, {})
+                done = build_done(metric_totals, operations.get(cell, {}), people.get(cell, {}))
+                matrix[metric_id].append((done, bool(metric_totals.get("final"))))
+
+    return matrices if group_by else matrices[None]
+
+
+def split_timespans(timespans):
+    """
+    Finds the timespans exactly covered by consecutive other timespans of the list.
+
+    :param timespans: List of (initial date, end date) tuples or None.
+    :return: Dictionary of index of a covered timespan to the indexes of the timespans covering it.
+    """
+    one_day = datetime.timedelta(days=1)
+    parts = {}
+    for index, window in enumerate(timespans):
+        if window is None:
+            continue
+        inside = sorted((other for other, other_window in enumerate(timespans)
+                         if other_window and tuple(other_window) != tuple(window)
+                         and window[0] <= other_window[0] and other_window[1] <= window[1]),
+                        key=lambda other: timespans[other][0])
+        chain, day = [], window[0]
+        for other in inside:
+            if timespans[other][0] == day:
+                chain.append(other)
+                day = timespans[other][1] + one_day
+        if chain and day == window[1] + one_day:
+            parts[index] = chain
+    return parts
+
+
+def are_disjoint(timespans):
+    timespans = sorted(timespans, key=lambda window: window[0] if window else datetime.date.min)
+    if len(timespans) > 1 and None in timespans:
+        return False
+    return all(previous[1] < window[0] for previous, window in zip(timespans, timespans[1:]))
+
+
+def bucket_relations(metric_ids, report_query, windows, group_by=None):
+    """
+    Relations between the metrics and their reports, annotated with the bucket of the timespan of each report and
+    with the group of the report.
+
+    :param metric_ids: List of metric ids.
+    :param report_query: Q object applied to the reports.
+    :param windows: Dictionary of bucket to a timespan. Timespans must not overlap and None, meaning no date filter,
+                    is only allowed alone.
+    :param group_by: Name of a field of the reports to group them by. If None, every report is in the group None.
+    :return: Queryset of the join table between reports and metrics.
+    """
+    relations = MetricRelation.objects.filter(metric__in=metric_ids)
+    if group_by:
+        relations = relations.annotate(group=F("report__" + group_by))
+    else:
+        relations = relations.annotate(group=Value(None, output_field=IntegerField()))
+
+    if None in windows.values():
+        bucket, = windows
+        return relations.filter(report__in=Report.objects.filter(report_query)).annotate(bucket=Value(bucket))
+
+    dates = Q()
+    cases = []
+    for bucket, (time_ini, time_end) in windows.items():
+        dates |= Q(end_date__gte=time_ini) & Q(end_date__lte=time_end)
+        cases.append(When(report__end_date__gte=time_ini, report__end_date__lte=time_end, then=Value(bucket)))
+    return relations.filter(report__in=Report.objects.filter(dates & report_query)).annotate(
+        bucket=Case(*cases, output_field=IntegerField()))
+
+
+# Fields of the annotated relations identifying a cell of the results
+CELL_FIELDS = ("metric_id", "group", "bucket")
+
+
+def cell_of(row):
+    return row["metric_id"], row["group"], row["bucket"]
+
+
+def combine_totals(parts):
+    """
+    Totals of the reports of consecutive timespans, from the totals of each timespan.
+    """
+    combined = {}
+    for alias in [fields[0] for fields in REPORT_FIELDS.values()] + ["new_editors"]:
+        combined[alias] = sum(part.get(alias) or 0 for part in parts)
+    for alias in ["occurrence", "final"]:
+        combined[alias] = max([part.get(alias) or 0 for part in parts], default=0)
+    return combined
+
+
+def combine_operations(parts):
+    """
+    Totals of the operation reports of consecutive timespans, from the totals of each timespan.
+    """
+    combined = {}
+    for field, fallback in OPERATION_FIELDS.values():
+        totals = [part.get(field, (0, 0)) for part in parts]
+        combined[field] = (sum(metric_total or 0 for metric_total, all_total in totals),
+                           sum(all_total or 0 for metric_total, all_total in totals))
+    return combined
+
+
+def aggregate_report_fields_per_metric(relations):
+    """
+    Sums the columns of the reports, the new editors and the occurrences grouped by metric, group and bucket.
+
+    :param relations: Queryset of the join table between reports and metrics, annotated with a bucket and a group.
+    :return: Dictionary of (metric id, group, bucket) to a dictionary of aliases to totals, including whether there is a
+             final report.
+    """
+    occurrence = occurrence_expression("report_id")
+    rows = relations.order_by().values(*CELL_FIELDS).annotate(
+        **report_totals_expressions("report__"),
+        new_editors=Sum(new_editors_subquery("report_id", "report__initial_date")),
+        occurrence=Max(occurrence),
+        final=Max(Case(When(report__partial_report=False, then=occurrence), default=Value(0),
+                       output_field=IntegerField())),
+    )
+    return {cell_of(row): row for row in rows}
+
+
+def aggregate_operation_fields_per_metric(relations):
+    """
+    Sums the operation reports grouped by metric, group and bucket, both for the metric itself and for every metric
+    of the reports.
+
+    :param relations: Queryset of the join table between reports and metrics, annotated with a bucket and a group.
+    :return: Dictionary of (metric id, group, bucket) to a dictionary of field to a (metric total, all metrics total)
+             tuple.
+    """
+    expressions = {}
+    for field, fallback in OPERATION_FIELDS.values():
+        expressions["metric_" + field] = Sum("report__operation_report__" + field,
+                                             filter=Q(report__operation_report__metric=F("metric")))
+        expressions["all_" + field] = Sum("report__operation_report__" + field)
+    rows = relations.order_by().values(*CELL_FIELDS).annotate(**expressions)
+
+    return {cell_of(row): {field: (row["metric_" + field], row["all_" + field])
+                           for field, fallback in OPERATION_FIELDS.values()} for row in rows}
+
+
+def count_people_per_metric(relations):
+    """
+    Counts the distinct editors, organizers and partners grouped by metric, group and bucket, in a single query.
+
+    :param relations: Queryset of the join table between reports and metrics, annotated with a bucket and a group.
+    :return: Dictionary of (metric id, group, bucket) to a dictionary of relation name to a {"total": int,
+             "retained": int} dictionary.
+    """
+    relations = relations.order_by()
+    editors = relations.values(*CELL_FIELDS, relation=Value("editors")).annotate(
+        total=Count("report__editors", distinct=True),
+        retained=Count("report__editors", distinct=True, filter=Q(report__editors__retained=True)))
+    organizers = relations.values(*CELL_FIELDS, relation=Value("organizers")).annotate(
+        total=Count("report__organizers", distinct=True),
+        retained=Count("report__organizers", distinct=True, filter=Q(report__organizers__retained=True)))
+    partners = relations.values(*CELL_FIELDS, relation=Value("partners")).annotate(
+        total=Count("report__partners_activated", distinct=True), retained=Value(0))
+
+    people = {}
+    for row in editors.union(organizers, partners, all=True):
+        people.setdefault(cell_of(row), {})[row["relation"]] = row
+    return people
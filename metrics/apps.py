@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MetricsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'metrics'
+
+    def ready(self):
+        from metrics import rollups
+
+        post_migrate.connect(rollups.backfill_rollups, sender=self)
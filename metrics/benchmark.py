@@ -0,0 +1,464 @@
+import datetime
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import django
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from io import StringIO
+
+from agenda.models import Event
+from metrics.caching import invalidate_all_projects
+from metrics.instrumentation import count_queries, describe, QUERY_BUCKETS, TIME_BUCKETS
+from metrics.models import Project, Area, Activity, Metric
+from metrics.rollups import rebuild_rollups
+from metrics.views import get_metrics_and_aggregate_per_project, get_results_divided_by_trimester, \
+    wmf_report_version, wmf_report_path
+from report.choices import invalidate_choice_trees
+from report.persistence import OPERATION_FIELDS
+from report.models import Report, OperationReport, Editor, Organizer, Partner, Funding, LearningArea, \
+    StrategicLearningQuestion
+from strategy.models import StrategicAxis, Direction
+from users.models import TeamArea, UserProfile, Position
+
+BATCH_SIZE = 1000
+GOAL_FIELDS = ["wikipedia_created", "wikipedia_edited", "commons_created", "wikidata_edited", "number_of_editors",
+               "number_of_participants", "number_of_organizers", "number_of_partnerships_activated"]
+WIKI_PROJECTS = ["wikipedia", "commons", "wikidata", "wikiversity", "wikibooks", "wikisource", "wikinews", "wikiquote",
+                 "wiktionary", "wikivoyage", "wikispecies", "metawiki", "mediawiki"]
+DATASET_MODELS = [Project, Area, Activity, Metric, TeamArea, Report, OperationReport, Editor, Organizer, Partner,
+                  Event, Report.editors.through, Report.organizers.through, Report.partners_activated.through,
+                  Report.metrics_related.through]
+
+
+# DATASET
+def fan_out(rng, population, mean):
+    """
+    Random sample of a population whose size follows an exponential distribution, so most reports link a few rows
+    and some link many.
+
+    :param rng: random.Random instance.
+    :param population: List of rows to choose from.
+    :param mean: Mean size of the sample.
+    :return: List of distinct rows.
+    """
+    if not population or mean <= 0:
+        return []
+    size = min(len(population), int(rng.expovariate(1 / mean)))
+    return rng.sample(population, size)
+
+
+def random_date(rng, first_day, last_day):
+    return first_day + datetime.timedelta(days=rng.randint(0, (last_day - first_day).days))
+
+
+def generate_dataset(projects=4, areas=3, activities=4, metrics=3, team_areas=6, reports=5000, editors=2000,
+                     organizers=300, partners=100, events=500, editors_per_report=8, organizers_per_report=2,
+                     partners_per_report=1, metrics_per_report=3, seed=0):
+    """
+    Creates a synthetic dataset for the benchmarks, with the rows named after the seed.
+
+    The first project is the main funding and the second the current plan of activities, unless the database
+    already has them. The reports and events are spread between the beginning of the previous year and today. The
+    rows are bulk created, so the rollups are rebuilt at the end.
+
+    :param projects: Number of projects.
+    :param areas: Number of areas of each project.
+    :param activities: Number of activities of each area.
+    :param metrics: Number of metrics of each activity. The first metric of each activity of the plan of activities
+                    is an operation metric.
+    :param team_areas: Number of team areas responsible for the reports and events.
+    :param reports: Number of reports.
+    :param editors: Number of editors.
+    :param organizers: Number of organizers, each from one or two partners.
+    :param partners: Number of partners.
+    :param events: Number of events.
+    :param editors_per_report: Mean number of editors of a report.
+    :param organizers_per_report: Mean number of organizers of a report.
+    :param partners_per_report: Mean number of partners activated by a report.
+    :param metrics_per_report: Mean number of metrics of its activity a report is related to.
+    :param seed: Seed of the random choices, also used in the names of the rows.
+    :return: Dictionary of model name to number of rows created.
+    """
+    rng = random.Random(seed)
+    prefix = "Benchmark {}".format(seed)
+    today = datetime.date.today()
+    first_day = datetime.date(today.year - 1, 1, 1)
+
+    with transaction.atomic():
+        user, _ = User.objects.get_or_create(username="benchmark_data")
+        user_profile = UserProfile.objects.get(user=user)
+
+        # Strategy and learning questions every report points to
+        axis = StrategicAxis.objects.create(text="{} axis".format(prefix))
+        directions = Direction.objects.bulk_create([Direction(text="{} direction {}".format(prefix, index),
+                                                              strategic_axis=axis) for index in range(5)])
+        learning_area = LearningArea.objects.create(text="{} learning area".format(prefix))
+        questions = StrategicLearningQuestion.objects.bulk_create([
+            StrategicLearningQuestion(text="{} question {}".format(prefix, index), learning_area=learning_area)
+            for index in range(5)])
+        # Created one at a time, so each gets its area activated
+        teams = [TeamArea.objects.create(text="{} team {}".format(prefix, index), code="bench{}".format(index),
+                                         color_code="{:02d}".format(index % 100)) for index in range(team_areas)]
+
+        # Projects, areas, activities and metrics
+        has_main = Project.objects.filter(main_funding=True).exists()
+        has_poa = Project.objects.filter(current_poa=True).exists()
+        project_rows = Project.objects.bulk_create([
+            Project(text="{} project {}".format(prefix, index), main_funding=index == 0 and not has_main,
+                    current_poa=index == 1 and not has_poa) for index in range(projects)])
+        Funding.objects.bulk_create([Funding(name="{} funding {}".format(prefix, index), project=project,
+                                             value=rng.randint(1, 100) * 1000)
+                                     for index, project in enumerate(project_rows)])
+
+        area_rows = Area.objects.bulk_create([Area(text="{} area {}-{}".format(prefix, project_index, index))
+                                              for project_index in range(projects) for index in range(areas)])
+        Area.project.through.objects.bulk_create([
+            Area.project.through(area_id=area.id, project_id=project_rows[index // areas].id)
+            for index, area in enumerate(area_rows)])
+        Area.related_axis.through.objects.bulk_create([
+            Area.related_axis.through(area_id=area.id, strategicaxis_id=axis.id) for area in area_rows])
+
+        activity_rows = Activity.objects.bulk_create([
+            Activity(text="{} activity {}-{}".format(prefix, area_index, index), code="B{}.{}".format(area_index, index),
+                     area=area, area_responsible=rng.choice(teams))
+            for area_index, area in enumerate(area_rows) for index in range(activities)])
+
+        metric_rows = []
+        for activity_index, activity in enumerate(activity_rows):
+            project = project_rows[activity_index // (areas * activities)]
+            for index in range(metrics):
+                # Each metric measures one thing, the field of its goal
+                goals = {rng.choice(GOAL_FIELDS): rng.randint(1, 500)}
+                metric_rows.append(Metric(text="{} metric {}-{}".format(prefix, activity_index, index),
+                                          text_en="Metric {}-{}".format(activity_index, index), activity=activity,
+                                          is_operation=index == 0 and project.current_poa, **goals))
+        metric_rows = Metric.objects.bulk_create(metric_rows, batch_size=BATCH_SIZE)
+        Metric.project.through.objects.bulk_create([
+            Metric.project.through(metric_id=metric.id,
+                                   project_id=project_rows[index // (areas * activities * metrics)].id)
+            for index, metric in enumerate(metric_rows)], batch_size=BATCH_SIZE)
+        metrics_of_activity = {}
+        for metric in metric_rows:
+            metrics_of_activity.setdefault(metric.activity_id, []).append(metric)
+
+        # People and institutions
+        partner_rows = Partner.objects.bulk_create([Partner(name="{} partner {}".format(prefix, index))
+                                                    for index in range(partners)], batch_size=BATCH_SIZE)
+        organizer_rows = Organizer.objects.bulk_create([
+            Organizer(name="{} organizer {}".format(prefix, index), retained=rng.random() < 0.3)
+            for index in range(organizers)], batch_size=BATCH_SIZE)
+        Organizer.institution.through.objects.bulk_create([
+            Organizer.institution.through(organizer_id=organizer.id, partner_id=partner.id)
+            for organizer in organizer_rows for partner in fan_out(rng, partner_rows, 1.5)], batch_size=BATCH_SIZE)
+        editor_rows = Editor.objects.bulk_create([
+            Editor(username="{} editor {}".format(prefix, index), retained=rng.random() < 0.2,
+                   account_creation_date=datetime.datetime.combine(random_date(rng, first_day, today),
+                                                                   datetime.time()))
+            for index in range(editors)], batch_size=BATCH_SIZE)
+
+        # Reports and what they link to
+        report_rows = []
+        for index in range(reports):
+            activity = rng.choice(activity_rows)
+            initial_date = random_date(rng, first_day, today)
+            report_rows.append(Report(
+                created_by=user_profile, modified_by=user_profile, activity_associated=activity,
+                area_responsible=rng.choice(teams), initial_date=initial_date,
+                end_date=initial_date + datetime.timedelta(days=rng.randint(0, 30)),
+                description="{} report {}".format(prefix, index),
+                links="https://pt.wikipedia.org/wiki/Benchmark_{}\r\nhttps://example.com/{}".format(index, index),
+                learning="Learning " * 60, participants=rng.randint(0, 100), feedbacks=rng.randint(0, 10),
+                wikipedia_created=rng.randint(0, 20), wikipedia_edited=rng.randint(0, 200),
+                commons_created=rng.randint(0, 50), wikidata_edited=rng.randint(0, 100)))
+        report_rows = Report.objects.bulk_create(report_rows, batch_size=BATCH_SIZE)
+
+        through_rows = {Report.editors.through: [], Report.organizers.through: [],
+                        Report.partners_activated.through: [], Report.metrics_related.through: [],
+                        Report.directions_related.through: [], Report.learning_questions_related.through: []}
+        operation_rows = []
+        for report in report_rows:
+            activity_metrics = metrics_of_activity[report.activity_associated_id]
+            related = set(fan_out(rng, activity_metrics, metrics_per_report) or activity_metrics[:1])
+            for metric in activity_metrics:
+                if metric.is_operation:
+                    related.add(metric)
+                    operation_rows.append(OperationReport(report=report, metric=metric, **{
+                        field: rng.randint(0, 10) for field in OPERATION_FIELDS}))
+
+            through_rows[Report.editors.through] += [
+                Report.editors.through(report_id=report.id, editor_id=editor.id)
+                for editor in fan_out(rng, editor_rows, editors_per_report)]
+            through_rows[Report.organizers.through] += [
+                Report.organizers.through(report_id=report.id, organizer_id=organizer.id)
+                for organizer in fan_out(rng, organizer_rows, organizers_per_report)]
+            through_rows[Report.partners_activated.through] += [
+                Report.partners_activated.through(report_id=report.id, partner_id=partner.id)
+                for partner in fan_out(rng, partner_rows, partners_per_report)]
+            through_rows[Report.metrics_related.through] += [
+                Report.metrics_related.through(report_id=report.id, metric_id=metric.id) for metric in related]
+            through_rows[Report.directions_related.through].append(
+                Report.directions_related.through(report_id=report.id, direction_id=rng.choice(directions).id))
+            through_rows[Report.learning_questions_related.through].append(
+                Report.learning_questions_related.through(report_id=report.id,
+                                                          strategiclearningquestion_id=rng.choice(questions).id))
+        for through, rows in through_rows.items():
+            through.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        OperationReport.objects.bulk_create(operation_rows, batch_size=BATCH_SIZE)
+
+        # Agenda
+        event_rows = []
+        for index in range(events):
+            initial_date = random_date(rng, first_day, today)
+            activity = rng.choice(activity_rows)
+            event_rows.append(Event(name="{} event {}".format(prefix, index), initial_date=initial_date,
+                                    end_date=initial_date + datetime.timedelta(days=rng.choice([0, 0, 0, 1, 2, 6])),
+                                    area_responsible=rng.choice(teams), activity_associated=activity))
+        event_rows = Event.objects.bulk_create(event_rows, batch_size=BATCH_SIZE)
+        Event.area_involved.through.objects.bulk_create([
+            Event.area_involved.through(event_id=event.id, teamarea_id=team.id)
+            for event in event_rows for team in fan_out(rng, teams, 1)], batch_size=BATCH_SIZE)
+        Event.metric_associated.through.objects.bulk_create([
+            Event.metric_associated.through(event_id=event.id, metric_id=metric.id)
+            for event in event_rows for metric in metrics_of_activity[event.activity_associated_id][:1]],
+            batch_size=BATCH_SIZE)
+
+        rebuild_rollups()
+    invalidate_all_projects()
+    invalidate_choice_trees()
+
+    return {"Projects": len(project_rows), "Areas": len(area_rows), "Activities": len(activity_rows),
+            "Metrics": len(metric_rows), "Reports": len(report_rows), "Operation reports": len(operation_rows),
+            "Editors": len(editor_rows), "Organizers": len(organizer_rows), "Partners": len(partner_rows),
+            "Events": len(event_rows), "Report editors": len(through_rows[Report.editors.through]),
+            "Report organizers": len(through_rows[Report.organizers.through]),
+            "Report partners": len(through_rows[Report.partners_activated.through])}
+
+
+def dataset_size():
+    return {model._meta.label: model.objects.count() for model in DATASET_MODELS}
+
+
+# BENCHMARKS
+class BenchmarkContext:
+    """
+    What the benchmarks need from the database, looked up once before they run.
+
+    :param client: Test client logged in as a superuser.
+    """
+    def __init__(self, client, user):
+        self.client = client
+        self.user = user
+        self.runs = 0
+        self.report = Report.objects.order_by("-end_date", "-pk").first()
+        self.event = Event.objects.order_by("-initial_date", "-pk").first()
+        self.metric = (Metric.objects.filter(project__main_funding=True, activity__isnull=False)
+                       .select_related("activity").order_by("pk").first())
+        self.operation_metrics = list(Metric.objects.filter(is_operation=True).order_by("pk"))
+        self.editors = list(Editor.objects.order_by("pk").values_list("username", flat=True)[:20])
+        self.organizers = list(Organizer.objects.order_by("pk").values_list("name", flat=True)[:3])
+        self.direction = Direction.objects.order_by("pk").first()
+        self.question = StrategicLearningQuestion.objects.order_by("pk").first()
+        self.team = TeamArea.objects.order_by("pk").first()
+
+    def report_data(self):
+        """
+        Data of a new report, with some existing editors and organizers and some new ones.
+
+        :return: Dictionary of the fields of the report and of its operation formset.
+        """
+        self.runs += 1
+        new_editors = ["Benchmark new editor {}-{}".format(self.runs, index) for index in range(5)]
+        new_organizers = ["Benchmark new organizer {};Benchmark institution {}".format(self.runs, self.runs)]
+        data = {"{}_{}".format(project, action): 0 for project in WIKI_PROJECTS for action in ("created", "edited")}
+        data.update({field: 0 for field in ["participants", "resources", "feedbacks", "donors", "submissions",
+                                            "number_of_people_reached_through_social_media"]})
+        data.update({
+            "wikipedia_edited": 10,
+            "description": "Benchmark added report {} {}".format(time.time(), self.runs),
+            "initial_date": datetime.date.today().strftime("%Y-%m-%d"),
+            "directions_related": [self.direction.id],
+            "learning_questions_related": [self.question.id],
+            "activity_associated": self.metric.activity_id,
+            "area_responsible": self.team.id,
+            "metrics_related": [self.metric.id],
+            "links": "https://pt.wikipedia.org/wiki/Benchmark",
+            "learning": "Learning " * 60,
+            "editors_string": "\r\n".join(self.editors + new_editors),
+            "organizers_string": "\r\n".join(self.organizers + new_organizers),
+            "Operation-TOTAL_FORMS": len(self.operation_metrics),
+            "Operation-INITIAL_FORMS": 0,
+            "Operation-MIN_NUM_FORMS": 0,
+            "Operation-MAX_NUM_FORMS": 1000,
+        })
+        for index, metric in enumerate(self.operation_metrics):
+            data["Operation-{}-metric".format(index)] = metric.id
+            for field in OPERATION_FIELDS:
+                data["Operation-{}-{}".format(index, field)] = 1
+        return data
+
+
+def get_content(response):
+    """
+    Reads the whole response, so the content of streaming responses is measured too.
+
+    :raises AssertionError: If the response is not the expected one.
+    """
+    if response.status_code not in (200, 302):
+        raise AssertionError("{} answered {}".format(response.request["PATH_INFO"], response.status_code))
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
+def benchmark_metrics_per_project(context):
+    get_metrics_and_aggregate_per_project()
+
+
+def benchmark_results_by_trimester(context):
+    get_results_divided_by_trimester(StringIO(), with_goal=True)
+
+
+def benchmark_export_report(context):
+    get_content(context.client.get(reverse("report:export_report", kwargs={"report_id": context.report.id})))
+
+
+def benchmark_export_year_reports(context):
+    get_content(context.client.get(reverse("report:export_year_reports",
+                                           kwargs={"year": context.report.end_date.year})))
+
+
+def benchmark_prepare_pdf(context):
+    # The file is removed first from the export directory of the run, so the report is rendered and not read from it
+    path = wmf_report_path(wmf_report_version())
+    if os.path.exists(path):
+        os.remove(path)
+    get_content(context.client.get(reverse("metrics:wmf_report")))
+
+
+def benchmark_calendar_month(context):
+    get_content(context.client.get(reverse("agenda:show_specific_calendar", kwargs={
+        "year": context.event.initial_date.year, "month": context.event.initial_date.month})))
+
+
+def benchmark_add_report(context):
+    response = context.client.post(reverse("report:add_report"), data=context.report_data())
+    if response.status_code != 302:
+        raise AssertionError("The report was not added: {}".format(response.context["report_form"].errors))
+
+
+BENCHMARKS = {
+    "get_metrics_and_aggregate_per_project": benchmark_metrics_per_project,
+    "get_results_divided_by_trimester": benchmark_results_by_trimester,
+    "export_report": benchmark_export_report,
+    "export_year_reports": benchmark_export_year_reports,
+    "prepare_pdf": benchmark_prepare_pdf,
+    "calendar_month": benchmark_calendar_month,
+    "add_report": benchmark_add_report,
+}
+
+
+def measure(function, context, repeat):
+    """
+    Runs a benchmark several times, measuring each run.
+
+    :param function: Benchmark function, receiving the context.
+    :param context: BenchmarkContext.
+    :param repeat: Number of runs.
+    :return: Dictionary with the summaries of the time in milliseconds and of the number of queries of the runs.
+    """
+    times = []
+    queries = []
+    for run in range(repeat):
+        # The cached datasets of the projects are dropped from the cache of the run, so every run computes them
+        invalidate_all_projects()
+        start = time.perf_counter()
+        with count_queries() as counter:
+            function(context)
+        times.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count)
+    return {"ms": describe(times, TIME_BUCKETS), "queries": describe(queries, QUERY_BUCKETS)}
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+BENCHMARK_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "benchmarks",
+    }
+}
+
+
+def run_benchmarks(names=None, repeat=5):
+    """
+    Times and counts the queries of the entry points of the benchmarks on the data in the database.
+
+    The views are called through the test client, logged in as a superuser created for the run. Everything the
+    benchmarks write to the database is rolled back at the end, and the files and cache entries go to an export
+    directory and a cache of their own, so the files and cache of the site are left untouched.
+
+    :param names: Names of the benchmarks to run, in BENCHMARKS. By default, all of them.
+    :param repeat: Number of runs of each benchmark.
+    :return: Dictionary with the commit, the environment, the size of the dataset and the results of each benchmark.
+    """
+    if not Project.objects.filter(main_funding=True).exists() or not Project.objects.filter(current_poa=True).exists():
+        raise ValueError("The benchmarks need a main funding project and a current plan of activities")
+    if not Report.objects.exists() or not Event.objects.exists():
+        raise ValueError("The benchmarks need reports and events")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as export_root, transaction.atomic(), override_settings(
+            ALLOWED_HOSTS=["testserver"], EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            EXPORT_ROOT=export_root, CACHES=BENCHMARK_CACHES):
+        user = User.objects.create_superuser(username="benchmark_runner_{}".format(int(time.time())))
+        # Like the staff, the runner holds a position in a team area
+        group, _ = Group.objects.get_or_create(name="Benchmark")
+        user.userprofile.position = Position.objects.create(text="Benchmark runner", type=group,
+                                                            area_associated=TeamArea.objects.order_by("pk").first())
+        user.userprofile.save()
+        client = Client()
+        client.force_login(user)
+        context = BenchmarkContext(client, user)
+        for name in names or BENCHMARKS:
+            results[name] = measure(BENCHMARKS[name], context, repeat)
+        transaction.set_rollback(True)
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "repeat": repeat,
+        "dataset": dataset_size(),
+        "results": results,
+    }
+
+
+def compare_results(results, baseline):
+    """
+    Compares the medians of two runs of the benchmarks.
+
+    :param results: Output of run_benchmarks.
+    :param baseline: Output of an earlier run_benchmarks.
+    :return: List of (name, median ms, baseline median ms, queries, baseline queries) tuples, the baseline values
+             being None for benchmarks it did not run.
+    """
+    rows = []
+    for name, result in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        rows.append((name, result["ms"]["p50"], previous["ms"]["p50"] if previous else None,
+                     result["queries"]["p50"], previous["queries"]["p50"] if previous else None))
+    return rows
@@ -0,0 +1,160 @@
+import hashlib
+import threading
+import uuid
+from django.core.cache import cache
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from metrics.models import Project, Area, Activity, Metric
+
+CACHE_PREFIX = "metrics_per_project"
+CACHE_TIMEOUT = 60 * 60 * 24
+GLOBAL_VERSION = "all"
+EMPTY = "empty"
+
+
+# VERSIONS
+def version_key(name):
+    return "{}:version:{}".format(CACHE_PREFIX, name)
+
+
+def get_versions(names):
+    """
+    Data versions of some projects, or of everything with GLOBAL_VERSION.
+
+    A version that is not in the cache, because it was never set or was evicted, gets a new random value, so
+    entries stored under an older version can never be read again.
+
+    :param names: Iterable of project ids or GLOBAL_VERSION.
+    :return: Dictionary of name to version.
+    """
+    keys = {version_key(name): name for name in names}
+    versions = cache.get_many(keys)
+    for key, name in keys.items():
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return {name: versions[key] for key, name in keys.items()}
+
+
+def invalidate_projects(project_ids):
+    """
+    Bumps the data version of some projects, so their cached datasets are computed again.
+
+    :param project_ids: Iterable of project ids.
+    :return: None
+    """
+    cache.set_many({version_key(project_id): uuid.uuid4().hex for project_id in set(project_ids)}, None)
+
+
+def invalidate_all_projects():
+    cache.set(version_key(GLOBAL_VERSION), uuid.uuid4().hex, None)
+
+
+def invalidate_projects_of_metrics(metric_ids):
+    invalidate_projects(Metric.project.through.objects.filter(metric_id__in=set(metric_ids)).values_list(
+        "project_id", flat=True))
+
+
+# STATISTICS
+# Kept by each process, so counting does not write to the cache on every request
+stats = {"hits": 0, "misses": 0}
+stats_lock = threading.Lock()
+
+
+def count(event, number=1):
+    with stats_lock:
+        stats[event] += number
+
+
+def get_cache_stats():
+    """
+    Hits and misses of the per-project datasets in this process since the statistics were last reset.
+
+    :return: Dictionary with the number of hits, the number of misses and the hit ratio.
+    """
+    with stats_lock:
+        hits, misses = stats["hits"], stats["misses"]
+    return {"hits": hits, "misses": misses, "ratio": hits / (hits + misses) if hits + misses else 0}
+
+
+def reset_cache_stats():
+    with stats_lock:
+        stats.update(hits=0, misses=0)
+
+
+# DATASETS
+def get_cached_datasets(project_ids, parameters, compute):
+    """
+    Datasets of some projects, read from the cache when their data version did not change.
+
+    :param project_ids: Ordered list of project ids.
+    :param parameters: Tuple with everything else the datasets depend on, such as the metric filter and language.
+    :param compute: Function receiving the ids of the projects not found in the cache and returning a dictionary
+    of project id to dataset. Projects without a dataset may be left out.
+    :return: Dictionary of project id to dataset, in the order of project_ids.
+    """
+    digest = hashlib.md5(repr(parameters).encode("utf-8")).hexdigest()
+    versions = get_versions(list(project_ids) + [GLOBAL_VERSION])
+    keys = {project_id: "{}:{}:{}:{}:{}".format(CACHE_PREFIX, project_id, digest, versions[GLOBAL_VERSION],
+                                                versions[project_id]) for project_id in project_ids}
+
+    cached = cache.get_many(keys.values())
+    datasets = {project_id: cached[key] for project_id, key in keys.items() if key in cached}
+    missing = [project_id for project_id in project_ids if project_id not in datasets]
+    count("hits", len(datasets))
+
+    if missing:
+        count("misses", len(missing))
+        computed = compute(missing)
+        values = {}
+        for project_id in missing:
+            datasets[project_id] = computed.get(project_id, EMPTY)
+            values[keys[project_id]] = datasets[project_id]
+        cache.set_many(values, CACHE_TIMEOUT)
+
+    return {project_id: datasets[project_id] for project_id in project_ids if datasets[project_id] != EMPTY}
+
+
+# SIGNALS
+@receiver(post_save, sender=Metric)
+def invalidate_projects_of_metric(sender, instance, **kwargs):
+    invalidate_projects_of_metrics([instance.pk])
+
+
+@receiver(pre_delete, sender=Metric)
+def remember_projects_of_metric(sender, instance, **kwargs):
+    # The links to the projects are gone by post_delete
+    instance._cached_project_ids = list(instance.project.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Metric)
+def invalidate_projects_of_deleted_metric(sender, instance, **kwargs):
+    invalidate_projects(getattr(instance, "_cached_project_ids", []))
+
+
+@receiver(m2m_changed, sender=Metric.project.through)
+def invalidate_projects_of_metric_relation(sender, instance, action, pk_set, **kwargs):
+    if action in ("pre_clear", "post_add", "post_remove"):
+        if isinstance(instance, Project):
+            invalidate_projects([instance.pk])
+        elif action == "pre_clear":
+            invalidate_projects_of_metrics([instance.pk])
+        else:
+            invalidate_projects(pk_set)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project(sender, instance, **kwargs):
+    invalidate_projects([instance.pk])
+
+
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(m2m_changed, sender=Area.project.through)
+def invalidate_structure_of_projects(sender, **kwargs):
+    # Activities and areas decide how the metrics of every project are grouped
+    invalidate_all_projects()
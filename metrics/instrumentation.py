@@ -0,0 +1,150 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the buckets of the histograms, the last bucket holding everything above them
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+TIME_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+DEFAULT_WINDOW = 1000
+
+
+# COUNTING
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries run and the time spent running them.
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the queries run on every database by the current thread while the context is open.
+
+    :return: QueryCounter, updated as the queries run.
+    """
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+# STATISTICS
+class Sample:
+    def __init__(self, queries, sql_time, python_time):
+        self.queries = queries
+        self.sql_time = sql_time
+        self.python_time = python_time
+
+
+def describe(values, buckets):
+    """
+    Summary of a series of measures.
+
+    :param values: List of numbers.
+    :param buckets: Upper bounds of the buckets of the histogram.
+    :return: Dictionary with the minimum, mean, median, 95th percentile, maximum and histogram of the values.
+    """
+    ordered = sorted(values)
+    histogram = [0] * (len(buckets) + 1)
+    for value in ordered:
+        histogram[bisect.bisect_left(buckets, value)] += 1
+    return {
+        "min": ordered[0],
+        "mean": sum(ordered) / len(ordered),
+        "p50": ordered[(len(ordered) - 1) // 2],
+        "p95": ordered[int((len(ordered) - 1) * 0.95)],
+        "max": ordered[-1],
+        "histogram": histogram,
+    }
+
+
+class ViewStats:
+    """
+    Rolling window of the latest requests of each view, kept in the memory of the process.
+    """
+    def __init__(self, window=None):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, view_name, sample):
+        window = self.window or getattr(settings, "VIEW_STATS_WINDOW", DEFAULT_WINDOW)
+        with self.lock:
+            self.samples.setdefault(view_name, deque(maxlen=window)).append(sample)
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+
+    def summary(self):
+        """
+        Statistics of the requests in the window of each view.
+
+        :return: Dictionary of view name to the number of requests, their query budget, and the summaries of their
+                 query counts, SQL time and Python time, the times in milliseconds.
+        """
+        with self.lock:
+            samples = {view_name: list(view_samples) for view_name, view_samples in self.samples.items()}
+
+        budgets = getattr(settings, "QUERY_BUDGETS", {})
+        return {view_name: {
+            "requests": len(view_samples),
+            "budget": budgets.get(view_name),
+            "queries": describe([sample.queries for sample in view_samples], QUERY_BUCKETS),
+            "sql_ms": describe([sample.sql_time for sample in view_samples], TIME_BUCKETS),
+            "python_ms": describe([sample.python_time for sample in view_samples], TIME_BUCKETS),
+        } for view_name, view_samples in sorted(samples.items())}
+
+
+view_stats = ViewStats()
+
+
+# MIDDLEWARE
+class ViewStatsMiddleware:
+    """
+    Records the number of queries, the SQL time and the Python time of each request under the name of its view.
+
+    Requests that do not resolve to a view, such as static files, are not recorded. The content of streaming
+    responses is produced after the response leaves the middleware, so it is not measured. The sample is also kept
+    in the view_stats attribute of the response, for the tests.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with count_queries() as counter:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return response
+
+        sample = Sample(counter.count, counter.time * 1000, (total - counter.time) * 1000)
+        view_stats.record(match.view_name, sample)
+        response.view_stats = sample
+
+        budget = getattr(settings, "QUERY_BUDGETS", {}).get(match.view_name)
+        if budget is not None and counter.count > budget:
+            logger.warning("%s ran %d queries, over its budget of %d", match.view_name, counter.count, budget)
+        return response
@@ -0,0 +1,105 @@
+import re
+import urllib.parse as ur
+from functools import lru_cache
+
+LINKS_CACHE_SIZE = 8192
+
+# Interwiki prefixes of the projects with a wiki per language, linked as [[prefix:language:page]]
+LANGUAGE_PROJECTS = {
+    "wikibooks": "b",
+    "wikinews": "n",
+    "wikipedia": "w",
+    "wikiquote": "q",
+    "wikisource": "s",
+    "wikiversity": "v",
+    "wikivoyage": "voy",
+    "wiktionary": "wikt",
+}
+
+# Interwiki prefixes of single sites, linked as [[prefix:page]]. Meta-Wiki has no prefix
+SITE_PROJECTS = {
+    "commons.wikimedia.org/wiki/": "c",
+    "outreach.wikimedia.org/wiki/": "outreach",
+    "species.wikimedia.org/wiki/": "species",
+    "wikitech.wikimedia.org/wiki/": "wikitech",
+    "www.mediawiki.org/wiki/": "mw",
+    "www.wikidata.org/wiki/": "d",
+    "br.wikimedia.org/wiki/": "wmbr",
+    "meta.wikimedia.org/wiki/": "",
+    "phabricator.wikimedia.org/": "phab",
+}
+
+LANGUAGE_PREFIXES = {prefix: project for project, prefix in LANGUAGE_PROJECTS.items()}
+SITE_PREFIXES = {prefix: site for site, prefix in SITE_PROJECTS.items()}
+
+# Every kind of wiki URL in a single expression, so a link is matched once instead of once per project
+WIKI_URL = re.compile(
+    r"https://(?:"
+    r"(?P<tool>[^/]*)\.toolforge\.org/(?P<tool_page>.*)"
+    r"|(?P<language>[^/]*)\.(?P<project>" + "|".join(LANGUAGE_PROJECTS) + r")\.org/wiki/(?P<language_page>.*)"
+    r"|(?P<site>" + "|".join(re.escape(site) for site in SITE_PROJECTS) + r")(?P<site_page>.*)"
+    r")"
+)
+
+
+def clean_title(page):
+    page = ur.unquote(page)
+    clean_page = page.replace("_", " ")
+    return page, clean_page[:-1] if clean_page.endswith("/") else clean_page
+
+
+@lru_cache(maxsize=LINKS_CACHE_SIZE)
+def wikifi_link(link):
+    """
+    Turns the URL of a wiki page into an interwiki link, or into an external link if it is not a wiki URL.
+
+    :param link: URL.
+    :return: Wikitext of the link.
+    """
+    match = WIKI_URL.match(link)
+    if not match:
+        # The link is not a proper Wiki link
+        return f"[{link}]" if link != "-" else ""
+
+    if match["tool"] is not None:
+        target, page = "toolforge:{}/".format(match["tool"]), match["tool_page"]
+    elif match["project"] is not None:
+        target, page = "{}:{}:".format(LANGUAGE_PROJECTS[match["project"]], match["language"]), match["language_page"]
+    else:
+        target, page = SITE_PROJECTS[match["site"]] + ":", match["site_page"]
+
+    page, clean_page = clean_title(page)
+    return f"[[{target}{page}|{clean_page}]]"
+
+
+@lru_cache(maxsize=LINKS_CACHE_SIZE)
+def dewikify_url(link, meta=False):
+    """
+    Turns the target of an interwiki link back into the URL of the wiki page.
+
+    :param link: Target of the interwiki link, such as "w:pt:Page".
+    :param meta: Whether a target without a known prefix is a page of Meta-Wiki.
+    :return: URL.
+    """
+    prefix, colon, rest = link.partition(":")
+    base = None
+    if prefix == "toolforge":
+        tool, slash, page = rest.partition("/")
+        if tool and page:
+            base = f"https://{tool}.toolforge.org/"
+    elif prefix in LANGUAGE_PREFIXES:
+        language, colon, page = rest.partition(":")
+        if colon:
+            base = f"https://{language}.{LANGUAGE_PREFIXES[prefix]}.org/wiki/"
+    elif colon and prefix in SITE_PREFIXES:
+        base, page = "https://" + SITE_PREFIXES[prefix], rest
+
+    if base is not None:
+        page, clean_page = clean_title(page)
+        return base + clean_page
+
+    # The link is a meta link, so no prefix
+    if meta:
+        return f"https://meta.wikimedia.org/wiki/{link}"
+    else:  # The link is not a proper Wiki link
+        return f"{link}" if link != "-" else ""
@@ -0,0 +1,39 @@
+import itertools
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from metrics.links import wikifi_link, dewikify_url
+from report.models import Report
+
+
+class Command(BaseCommand):
+    help = "Measures how many report links per second are turned into wikitext and back"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=100000, help="Number of links of the corpus")
+
+    def handle(self, *args, **options):
+        links = [link for text in Report.objects.values_list("links", flat=True)
+                 for link in text.replace("\\r\\n", "\r\n").splitlines() if link]
+        if not links:
+            raise CommandError("There are no report links to build the corpus from")
+
+        corpus = list(itertools.islice(itertools.cycle(links), options["size"]))
+        targets = [wikified[2:-2].split("|")[0] for wikified in map(wikifi_link.__wrapped__, corpus)
+                   if wikified.startswith("[[")]
+        self.stdout.write("{} links, {} distinct, {} wiki links".format(len(corpus), len(set(corpus)), len(targets)))
+
+        self.measure("wikifi_link without cache", wikifi_link.__wrapped__, corpus)
+        wikifi_link.cache_clear()
+        self.measure("wikifi_link", wikifi_link, corpus)
+        self.measure("dewikify_url without cache", dewikify_url.__wrapped__, targets)
+        dewikify_url.cache_clear()
+        self.measure("dewikify_url", dewikify_url, targets)
+
+    def measure(self, name, function, corpus):
+        start = time.perf_counter()
+        for link in corpus:
+            function(link)
+        elapsed = time.perf_counter() - start
+        rate = len(corpus) / elapsed if elapsed else float("inf")
+        self.stdout.write("{}: {:.3f}s, {:,.0f} links/s".format(name, elapsed, rate))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from metrics.benchmark import generate_dataset
+from report.models import Editor
+
+SIZES = {
+    "projects": (4, "Number of projects"),
+    "areas": (3, "Number of areas of each project"),
+    "activities": (4, "Number of activities of each area"),
+    "metrics": (3, "Number of metrics of each activity"),
+    "team_areas": (6, "Number of team areas"),
+    "reports": (5000, "Number of reports"),
+    "editors": (2000, "Number of editors"),
+    "organizers": (300, "Number of organizers"),
+    "partners": (100, "Number of partners"),
+    "events": (500, "Number of events"),
+    "editors_per_report": (8, "Mean number of editors of a report"),
+    "organizers_per_report": (2, "Mean number of organizers of a report"),
+    "partners_per_report": (1, "Mean number of partners activated by a report"),
+    "metrics_per_report": (3, "Mean number of metrics a report is related to"),
+}
+
+
+class Command(BaseCommand):
+    help = ("Creates a synthetic dataset of projects, metrics, reports, editors, organizers, partners and events for "
+            "the benchmarks. Only run it on a database made for them")
+
+    def add_arguments(self, parser):
+        for name, (default, help_text) in SIZES.items():
+            parser.add_argument("--" + name.replace("_", "-"), type=int, default=default, help=help_text)
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random choices and of the names")
+
+    def handle(self, *args, **options):
+        if Editor.objects.filter(username__startswith="Benchmark {} ".format(options["seed"])).exists():
+            raise CommandError("The dataset of seed {} was already generated, use another --seed".format(
+                options["seed"]))
+
+        created = generate_dataset(seed=options["seed"], **{name: options[name] for name in SIZES})
+        for name, total in created.items():
+            self.stdout.write("{}: {}".format(name, total))
+        self.stdout.write(self.style.SUCCESS("Benchmark dataset of seed {} created".format(options["seed"])))
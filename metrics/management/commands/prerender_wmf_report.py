@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from metrics.views import get_wmf_report_file
+
+
+class Command(BaseCommand):
+    help = ("Renders the WMF report PDF if its data changed since it was last rendered, so the next download is "
+            "served from the cache")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Render the report even if it is in the cache")
+
+    def handle(self, *args, **options):
+        path, failed_response = get_wmf_report_file(force=options["force"])
+        if failed_response:
+            raise CommandError(failed_response.content.decode("utf-8"))
+        self.stdout.write(self.style.SUCCESS("WMF report ready at {}".format(path)))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from metrics.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the rollups of what was done for every metric from the reports. Migrating builds them only "
+            "when there are none, so run it after changing the reports outside of the site")
+
+    def handle(self, *args, **options):
+        total = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS("{} metric rollups rebuilt".format(total)))
@@ -0,0 +1,44 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from metrics.benchmark import BENCHMARKS, run_benchmarks, compare_results
+
+
+class Command(BaseCommand):
+    help = ("Times and counts the queries of the metrics, exports, PDF report, calendar and report form on the data "
+            "in the database, and writes the results as JSON to compare them across commits")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--benchmark", action="append", choices=list(BENCHMARKS), help="Benchmarks to run")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of runs of each benchmark")
+        parser.add_argument("--output", help="File the JSON results are written to")
+        parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        try:
+            results = run_benchmarks(options["benchmark"], max(options["repeat"], 1))
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(results, output_file, indent=2)
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        for name, result in results["results"].items():
+            self.stderr.write("{}: {:.1f} ms, {} queries (median of {} runs)".format(
+                name, result["ms"]["p50"], result["queries"]["p50"], results["repeat"]))
+        if baseline:
+            self.stderr.write("Compared with {}:".format(baseline.get("commit")))
+            for name, median, previous, queries, previous_queries in compare_results(results, baseline):
+                if previous is None:
+                    self.stderr.write("{}: not in the baseline".format(name))
+                else:
+                    self.stderr.write("{}: {:+.1f}% time, {:+d} queries".format(
+                        name, (median / previous - 1) * 100 if previous else 0, queries - previous_queries))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0016_metric_number_of_donors_metric_number_of_submissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.IntegerField(default=0)),
+                ('metric', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='metrics.metric')),
+            ],
+            options={
+                'verbose_name': 'Metric rollup',
+                'verbose_name_plural': 'Metric rollups',
+                'constraints': [models.UniqueConstraint(fields=('metric', 'bucket', 'key'), name='unique_metric_rollup')],
+            },
+        ),
+    ]
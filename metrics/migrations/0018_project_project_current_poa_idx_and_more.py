@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0017_metricrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('current_poa', True)), fields=['current_poa'], name='project_current_poa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('main_funding', True)), fields=['main_funding'], name='project_main_funding_idx'),
+        ),
+    ]
@@ -15,6 +15,13 @@ class Project(models.Model):
     class Meta:
         verbose_name = _("Project")
         verbose_name_plural = _("Projects")
+        indexes = [
+            # Only one project is the plan of activities and one the main funding, and both are looked up often. MySQL
+            # ignores the condition of an index and does not create these, so they only help on the other databases
+            models.Index(fields=["current_poa"], condition=models.Q(current_poa=True), name="project_current_poa_idx"),
+            models.Index(fields=["main_funding"], condition=models.Q(main_funding=True),
+                         name="project_main_funding_idx"),
+        ]
 
     def __str__(self):
         return self.text
@@ -150,3 +157,20 @@ class Metric(models.Model):
     def clean(self):
         if not self.text:
             raise ValidationError(_("You need to fill the text field"))
+
+
+class MetricRollup(models.Model):
+    metric = models.ForeignKey(Metric, on_delete=models.CASCADE, related_name="rollups")
+    bucket = models.CharField(max_length=20)
+    key = models.CharField(max_length=100)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Metric rollup")
+        verbose_name_plural = _("Metric rollups")
+        constraints = [
+            models.UniqueConstraint(fields=["metric", "bucket", "key"], name="unique_metric_rollup"),
+        ]
+
+    def __str__(self):
+        return self.metric.text + " - " + self.bucket + " - " + self.key
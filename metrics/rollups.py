@@ -0,0 +1,325 @@
+import threading
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from metrics.models import Metric, MetricRollup
+from metrics.caching import invalidate_projects_of_metrics
+from metrics.aggregation import DONE_KEYS, MetricRelation, get_done_for_metrics, trimester_timespans
+from report.models import Report, OperationReport, Editor, Organizer, Partner
+
+TOTAL_BUCKET = "total"
+FINAL_KEY = "Final report"
+# Relation of the reports to each kind of participant counted in the rollups
+PARTICIPANT_RELATIONS = {Editor: "editors", Organizer: "organizers", Partner: "partners_activated"}
+
+_pending = threading.local()
+
+
+# BUCKETS
+def buckets_of_date(date):
+    """
+    Buckets a report ending on a date is counted in: the total, its year and its trimester.
+
+    :param date: End date of the report.
+    :return: List of bucket names.
+    """
+    if not date:
+        return [TOTAL_BUCKET]
+
+    buckets = [TOTAL_BUCKET, str(date.year)]
+    for trimester, (time_ini, time_end) in enumerate(trimester_timespans(date.year)[:4], start=1):
+        if time_ini <= date <= time_end:
+            buckets.append("{}-Q{}".format(date.year, trimester))
+    return buckets
+
+
+def timespan_of_bucket(bucket):
+    """
+    Timespan covered by a bucket, or None for the total.
+
+    :param bucket: Bucket name.
+    :return: (initial date, end date) tuple or None.
+    """
+    if bucket == TOTAL_BUCKET:
+        return None
+
+    year, _, trimester = bucket.partition("-Q")
+    timespans = trimester_timespans(int(year))
+    return timespans[int(trimester) - 1] if trimester else timespans[-1]
+
+
+def bucket_of_timespan(timespan):
+    """
+    Bucket whose timespan is exactly the one given, or None if there is no such bucket.
+
+    :param timespan: (initial date, end date) tuple or None for the total.
+    :return: Bucket name or None.
+    """
+    if timespan is None:
+        return TOTAL_BUCKET
+
+    year = timespan[0].year
+    buckets = ["{}-Q{}".format(year, trimester) for trimester in range(1, 5)] + [str(year)]
+    for bucket, bucket_timespan in zip(buckets, trimester_timespans(year)):
+        if tuple(timespan) == bucket_timespan:
+            return bucket
+    return None
+
+
+# READ
+def get_done_from_rollups(metrics, timespans=None):
+    """
+    Reads what was done for many metrics from the rollups, with the same output as get_done_for_metrics.
+
+    Timespans that do not match a bucket are computed from the reports.
+
+    :param metrics: Iterable of metrics.
+    :param timespans: List of (initial date, end date) tuples. If None, the total is returned.
+    :return: Dictionary of metric id to a list, aligned with the timespans, of (done, final) tuples.
+    """
+    metrics = list(metrics)
+    windows = timespans if timespans is not None else [None]
+    buckets = [bucket_of_timespan(window) for window in windows]
+
+    values = {}
+    rows = MetricRollup.objects.filter(metric__in=metrics, bucket__in=[bucket for bucket in buckets if bucket])
+    for metric_id, bucket, key, value in rows.values_list("metric_id", "bucket", "key", "value"):
+        values[(metric_id, bucket, key)] = value
+
+    missing = [window for window, bucket in zip(windows, buckets) if not bucket]
+    computed = get_done_for_metrics(metrics, timespans=missing) if missing else {}
+
+    matrix = {}
+    for metric in metrics:
+        row = []
+        computed_row = iter(computed.get(metric.id, []))
+        for bucket in buckets:
+            if not bucket:
+                row.append(next(computed_row))
+                continue
+            done = {}
+            for key in DONE_KEYS:
+                value = values.get((metric.id, bucket, key), 0)
+                done[key] = bool(value) if key == "Occurrence" else value
+            row.append((done, bool(values.get((metric.id, bucket, FINAL_KEY)))))
+        matrix[metric.id] = row
+    return matrix
+
+
+# WRITE
+def refresh_rollups(metric_ids, buckets):
+    """
+    Recomputes the rollups of some metrics in some buckets.
+
+    :param metric_ids: Iterable of metric ids.
+    :param buckets: Iterable of bucket names.
+    :return: None
+    """
+    metrics = list(Metric.objects.filter(pk__in=set(metric_ids)).only("id"))
+    if not metrics:
+        return
+
+    with transaction.atomic():
+        for bucket in set(buckets):
+            timespan = timespan_of_bucket(bucket)
+            matrix = get_done_for_metrics(metrics, timespans=None if timespan is None else [timespan])
+
+            rollups = []
+            for metric in metrics:
+                done, final = matrix[metric.id][0]
+                for key, value in done.items():
+                    if value:
+                        rollups.append(MetricRollup(metric=metric, bucket=bucket, key=key, value=int(value)))
+                if final:
+                    rollups.append(MetricRollup(metric=metric, bucket=bucket, key=FINAL_KEY, value=1))
+
+            MetricRollup.objects.filter(metric__in=metrics, bucket=bucket).delete()
+            MetricRollup.objects.bulk_create(rollups)
+
+    # The cached pages of the projects of these metrics show the values just refreshed
+    invalidate_projects_of_metrics(metric.id for metric in metrics)
+
+
+def rebuild_rollups():
+    """
+    Recomputes every rollup from the reports.
+
+    :return: Number of rollups created.
+    """
+    years = Report.objects.filter(end_date__isnull=False).dates("end_date", "year")
+    buckets = [TOTAL_BUCKET]
+    for year in years:
+        buckets += [str(year.year)] + ["{}-Q{}".format(year.year, trimester) for trimester in range(1, 5)]
+
+    with transaction.atomic():
+        MetricRollup.objects.all().delete()
+        refresh_rollups(Metric.objects.values_list("id", flat=True), buckets)
+    return MetricRollup.objects.count()
+
+
+def backfill_rollups(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Builds the rollups once a database with reports related to metrics but without rollups has been migrated, as
+    after the rollups were introduced or dropped by a migration.
+
+    Connected to post_migrate, so the models match the tables when the rollups are computed.
+    """
+    if using == DEFAULT_DB_ALIAS and not MetricRollup.objects.exists() and MetricRelation.objects.exists():
+        rebuild_rollups()
+
+
+def cells_of_reports(report_ids, extra_metric_ids=(), extra_dates=()):
+    """
+    Metrics and buckets whose rollups depend on some reports.
+
+    :param report_ids: Iterable of report ids.
+    :param extra_metric_ids: Metrics that must be refreshed even if they are no longer related to the reports.
+    :param extra_dates: End dates the reports had before being changed.
+    :return: (set of metric ids, set of buckets) tuple.
+    """
+    report_ids = set(report_ids)
+    metric_ids = set(extra_metric_ids)
+    buckets = set()
+    if report_ids:
+        metric_ids.update(MetricRelation.objects.filter(report_id__in=report_ids).values_list("metric_id", flat=True))
+        dates = set(Report.objects.filter(pk__in=report_ids).values_list("end_date", flat=True))
+    else:
+        dates = set()
+    for date in dates.union(extra_dates):
+        buckets.update(buckets_of_date(date))
+    return metric_ids, buckets
+
+
+def mark_cells(metric_ids, buckets):
+    """
+    Refreshes the rollups of some metrics and buckets, or queues them if the updates are deferred.
+    """
+    if not metric_ids or not buckets:
+        return
+
+    pending = getattr(_pending, "cells", None)
+    if pending is None:
+        refresh_rollups(metric_ids, buckets)
+    else:
+        pending[0].update(metric_ids)
+        pending[1].update(buckets)
+
+
+def mark_reports(report_ids, extra_metric_ids=(), extra_dates=()):
+    mark_cells(*cells_of_reports(report_ids, extra_metric_ids, extra_dates))
+
+
+@contextmanager
+def defer_rollup_updates():
+    """
+    Collects the rollups changed inside the block and refreshes them once at its end.
+
+    Saving a report changes many relations, each one sending its own signals, so the views that write reports
+    use this to refresh every affected rollup a single time.
+    """
+    if getattr(_pending, "cells", None) is not None:
+        yield
+        return
+
+    _pending.cells = (set(), set())
+    try:
+        yield
+    finally:
+        # Whatever was saved before an error is still in the database, so the rollups are refreshed anyway
+        metric_ids, buckets = _pending.cells
+        _pending.cells = None
+        mark_cells(metric_ids, buckets)
+
+
+# SIGNALS
+@receiver(pre_save, sender=Report)
+def remember_report_end_date(sender, instance, **kwargs):
+    instance._rollup_previous_end_date = None
+    if instance.pk:
+        instance._rollup_previous_end_date = Report.objects.filter(pk=instance.pk).values_list(
+            "end_date", flat=True).first()
+
+
+@receiver(post_save, sender=Report)
+def update_rollups_of_report(sender, instance, **kwargs):
+    mark_reports([instance.pk], extra_dates=[getattr(instance, "_rollup_previous_end_date", None)])
+
+
+@receiver(pre_delete, sender=Report)
+def remember_rollups_of_report(sender, instance, **kwargs):
+    instance._rollup_cells = cells_of_reports([instance.pk])
+
+
+@receiver(pre_delete, sender=Editor)
+@receiver(pre_delete, sender=Organizer)
+@receiver(pre_delete, sender=Partner)
+def remember_rollups_of_participant(sender, instance, **kwargs):
+    # Deleting a participant deletes its links to the reports without sending m2m_changed
+    related_name = PARTICIPANT_RELATIONS[sender]
+    instance._rollup_cells = cells_of_reports(Report.objects.filter(**{related_name: instance}).values_list("pk",
+                                                                                                            flat=True))
+
+
+@receiver(pre_delete, sender=Metric)
+def remember_rollups_of_metric(sender, instance, **kwargs):
+    # A boolean metric counts as an occurrence for the other metrics of its reports until it is deleted
+    instance._rollup_cells = cells_of_reports(MetricRelation.objects.filter(metric=instance).values_list("report_id",
+                                                                                                         flat=True))
+
+
+@receiver(post_delete, sender=Report)
+@receiver(post_delete, sender=Editor)
+@receiver(post_delete, sender=Organizer)
+@receiver(post_delete, sender=Partner)
+@receiver(post_delete, sender=Metric)
+def update_rollups_of_deleted_row(sender, instance, **kwargs):
+    # The cells are refreshed once the links of the row are gone
+    mark_cells(*getattr(instance, "_rollup_cells", (set(), set())))
+
+
+@receiver(post_save, sender=OperationReport)
+@receiver(post_delete, sender=OperationReport)
+def update_rollups_of_operation_report(sender, instance, **kwargs):
+    mark_reports([instance.report_id])
+
+
+@receiver(post_save, sender=Editor)
+@receiver(post_save, sender=Organizer)
+def update_rollups_of_participant(sender, instance, created, **kwargs):
+    if not created:
+        related_name = PARTICIPANT_RELATIONS[sender]
+        mark_reports(Report.objects.filter(**{related_name: instance}).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Metric)
+def update_rollups_of_metric(sender, instance, **kwargs):
+    # Whether a metric is boolean changes the occurrences of every metric of its reports
+    mark_reports(MetricRelation.objects.filter(metric=instance).values_list("report_id", flat=True))
+
+
+@receiver(m2m_changed, sender=Report.metrics_related.through)
+@receiver(m2m_changed, sender=Report.editors.through)
+@receiver(m2m_changed, sender=Report.organizers.through)
+@receiver(m2m_changed, sender=Report.partners_activated.through)
+def update_rollups_of_relation(sender, instance, action, pk_set, **kwargs):
+    """
+    Refreshes the rollups when the metrics, editors, organizers or partners of reports change.
+    """
+    metric_relation = sender is MetricRelation
+    if isinstance(instance, Report):
+        report_ids = [instance.pk]
+        metric_ids = pk_set if metric_relation else ()
+    else:
+        related = {sender._meta.get_field(instance._meta.model_name).name: instance.pk}
+        report_ids = pk_set if pk_set is not None else sender.objects.filter(**related).values_list(
+            "report_id", flat=True)
+        metric_ids = [instance.pk] if metric_relation else ()
+
+    if action == "pre_clear":
+        instance._rollup_cells = cells_of_reports(report_ids, metric_ids)
+    elif action == "post_clear":
+        mark_cells(*getattr(instance, "_rollup_cells", (set(), set())))
+    elif action in ("post_add", "post_remove"):
+        mark_reports(report_ids, metric_ids or ())
@@ -8,9 +8,13 @@ register = template.Library()
 
 
 @register.simple_tag
-def date_tag(year, month, day):
+def date_tag(year, month, day, events_by_day=None):
     if int(day) != 0:
         date = datetime.date(year=int(year), month=int(month), day=int(day))
+        # The calendar views index the events of the days shown with a single query. Without the index, each day is
+        # queried on its own
+        if events_by_day is not None:
+            return events_by_day.get(date, "")
         filtered_events = Event.objects.filter(initial_date__lte=date, end_date__gte=date)
         if filtered_events.count() > 0:
             return filtered_events
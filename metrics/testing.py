@@ -0,0 +1,27 @@
+from django.conf import settings
+
+
+class QueryBudgetMixin:
+    """
+    Test case mixin checking the responses of the views against the query budgets set in QUERY_BUDGETS.
+    """
+    def assertWithinQueryBudget(self, response, budget=None):
+        """
+        Fails if the request behind a response ran more queries than the budget of its view.
+
+        :param response: Response of the test client.
+        :param budget: Maximum number of queries. By default, the budget of the view in QUERY_BUDGETS.
+        :return: Number of queries the request ran.
+        """
+        view_name = response.resolver_match.view_name
+        if budget is None:
+            budget = getattr(settings, "QUERY_BUDGETS", {}).get(view_name)
+        if budget is None:
+            self.fail("{} has no query budget in QUERY_BUDGETS".format(view_name))
+        if not hasattr(response, "view_stats"):
+            self.fail("The queries are only counted with metrics.instrumentation.ViewStatsMiddleware installed")
+
+        queries = response.view_stats.queries
+        self.assertLessEqual(queries, budget, "{} ran {} queries, over its budget of {}. Use assertNumQueries to "
+                                              "list them".format(view_name, queries, budget))
+        return queries
@@ -1,3 +1,7 @@
+import json
+import os
+import tempfile
+from django.template.loader import get_template
 from django.test import TestCase
 from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
@@ -5,12 +9,29 @@ from .models import Objective, Area, Metric, Activity, Project
 from report.models import Report, Editor, OperationReport, Direction, LearningArea, StrategicLearningQuestion
 from users.models import User, UserProfile, TeamArea
 from strategy.models import StrategicAxis
-from .views import get_metrics_and_aggregate_per_project, build_wiki_ref_for_reports, dewikify_url
+from .views import get_metrics_and_aggregate_per_project, build_wiki_ref_for_reports, dewikify_url, get_done_for_report, \
+    get_goal_for_metric, get_goal_and_done_for_metric, get_cached_metrics_per_project, build_wiki_refs_for_metrics, wikifi_link, \
+    build_wmf_report, wmf_report_path, wmf_report_version, build_trimester_report, get_results_divided_by_trimester, \
+    get_wmf_report_file, template_sources, WMF_REPORT_GRACE
+from .aggregation import get_done_for_metrics, trimester_timespans
+from .rollups import get_done_from_rollups, defer_rollup_updates
+from .models import MetricRollup
+from .caching import get_cache_stats, reset_cache_stats, get_versions, GLOBAL_VERSION
+from .benchmark import run_benchmarks
+from .instrumentation import view_stats
+from .testing import QueryBudgetMixin
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.core.management.sql import emit_post_migrate_signal
+from django.db.models import Q
+from django.test import override_settings
 from django.urls import reverse
 from django.contrib.auth.models import Permission
 from datetime import datetime, timedelta, date
 from metrics.templatetags.metricstags import categorize, perc, bool_yesno, is_yesno
 from django.utils.translation import gettext_lazy as _
+from io import StringIO
+from unittest.mock import patch
 
 
 class AreaModelTests(TestCase):
@@ -173,6 +194,17 @@ class MetricViewsTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "metrics/list_metrics_per_project.html")
 
+    def test_show_metrics_cache_stats(self):
+        permission = Permission.objects.get(codename="delete_logentry")
+        self.user.user_permissions.add(permission)
+        self.client.login(username=self.username, password=self.password)
+        url = reverse("metrics:cache_stats")
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json().keys()), {"hits", "misses", "ratio"})
+
     def test_show_plan_of_activities_and_its_operational_metrics_if_they_exist(self):
         self.client.login(username=self.username, password=self.password)
         project = Project.objects.create(text="Plan of activities", current_poa=True)
@@ -442,6 +474,44 @@ class MetricFunctionsTests(TestCase):
         self.assertEqual(aggregated_metrics[1]["project_metrics"][0]["activity_metrics"][2]["metrics"]["Wikipedia"]["goal"], 500)
         self.assertEqual(aggregated_metrics[1]["project_metrics"][0]["activity_metrics"][2]["metrics"]["Wikipedia"]["done"], 200)
 
+    def test_get_cached_metrics_per_project_is_invalidated_when_reports_change(self):
+        cache.clear()
+        project = Project.objects.create(text="Project")
+        self.metric_2.project.add(project)
+        self.metric_2.wikipedia_created = 500
+        self.metric_2.save()
+        area = Area.objects.create(text="Area")
+        area.project.add(project)
+        self.activity_1.area = area
+        self.activity_1.save()
+        self.report_3.metrics_related.add(self.metric_2.id)
+        self.report_3.wikipedia_edited = 200
+        self.report_3.save()
+
+        reset_cache_stats()
+        self.assertEqual(get_cached_metrics_per_project(), get_metrics_and_aggregate_per_project())
+        self.assertEqual(get_cached_metrics_per_project(), get_metrics_and_aggregate_per_project())
+        self.assertEqual(get_cache_stats()["hits"], 1)
+        self.assertEqual(get_cache_stats()["misses"], 1)
+
+        self.report_3.wikipedia_edited = 300
+        self.report_3.save()
+        aggregated_metrics = get_cached_metrics_per_project()
+        metrics = aggregated_metrics[project.id]["project_metrics"][0]["activity_metrics"][self.metric_2.id]["metrics"]
+        self.assertEqual(metrics["Wikipedia"]["done"], 300)
+        self.assertEqual(get_cache_stats()["misses"], 2)
+
+    def test_deleting_a_metric_invalidates_its_projects(self):
+        project = Project.objects.create(text="Project")
+        other_project = Project.objects.create(text="Other project")
+        self.metric_2.project.add(project)
+        versions = get_versions([project.id, other_project.id])
+
+        self.metric_2.delete()
+        new_versions = get_versions([project.id, other_project.id])
+        self.assertNotEqual(new_versions[project.id], versions[project.id])
+        self.assertEqual(new_versions[other_project.id], versions[other_project.id])
+
     def test_get_metrics_and_aggregate_per_project_without_data(self):
         aggregated_metrics = get_metrics_and_aggregate_per_project()
         self.assertEqual(aggregated_metrics, {})
@@ -470,6 +540,215 @@ class MetricFunctionsTests(TestCase):
         response = build_wiki_ref_for_reports(self.metric_1)
         self.assertEqual(response, reference_text)
 
+    def test_build_wiki_refs_for_metrics_wikifies_each_report_once(self):
+        self.report_1.metrics_related.add(self.metric_1, self.metric_2)
+        self.report_2.metrics_related.add(self.metric_2)
+        reference = "<ref name=\"sara-{}\">[https://testlink.com]</ref>"
+
+        with patch("metrics.views.wikifi_link", return_value="[https://testlink.com]") as wikifi_link:
+            with self.assertNumQueries(1):
+                refs = build_wiki_refs_for_metrics([self.metric_1, self.metric_2, self.metric_3])
+        self.assertEqual(wikifi_link.call_count, 2)
+        self.assertEqual(refs[self.metric_1.id], reference.format(self.report_1.id))
+        self.assertEqual(refs[self.metric_2.id], reference.format(self.report_1.id) + reference.format(self.report_2.id))
+        self.assertEqual(refs[self.metric_3.id], "")
+
+    def test_get_done_for_report_has_the_same_keys_as_the_goal(self):
+        reports = Report.objects.filter(metrics_related__in=[self.metric_1])
+        done = get_done_for_report(reports, self.metric_1)
+        self.assertEqual(list(done.keys()), list(get_goal_for_metric(self.metric_1).keys()))
+
+    def test_get_done_for_report_aggregates_reports_and_operations(self):
+        self.editor_1.retained = True
+        self.editor_1.save()
+        self.report_1.metrics_related.add(self.metric_1)
+        self.report_1.editors.add(self.editor_1, self.editor_2)
+        self.report_1.wikipedia_created = 3
+        self.report_1.participants = 10
+        self.report_1.save()
+        self.report_2.metrics_related.add(self.metric_1)
+        self.report_2.editors.add(self.editor_1)
+        self.report_2.wikipedia_edited = 4
+        self.report_2.save()
+        OperationReport.objects.create(report=self.report_1, metric=self.metric_1, number_of_events=2)
+        OperationReport.objects.create(report=self.report_2, metric=self.metric_2, number_of_events=5,
+                                       number_of_resources=7)
+
+        reports = Report.objects.filter(metrics_related__in=[self.metric_1])
+        with self.assertNumQueries(3):
+            done = get_done_for_report(reports, self.metric_1)
+        self.assertEqual(done["Wikipedia"], 7)
+        self.assertEqual(done["Number of participants"], 10)
+        self.assertEqual(done["Number of editors"], 2)
+        self.assertEqual(done["Number of editors retained"], 1)
+        self.assertEqual(done["Number of events"], 2)
+        self.assertEqual(done["Number of resources"], 7)
+        self.assertEqual(done["Occurrence"], False)
+
+    def test_get_done_for_report_without_reports(self):
+        done = get_done_for_report(Report.objects.none(), self.metric_1)
+        self.assertTrue(all(not value for value in done.values()))
+
+    def test_get_done_for_metrics_matches_get_goal_and_done_for_metric(self):
+        self.report_1.metrics_related.add(self.metric_1, self.metric_2)
+        self.report_1.editors.add(self.editor_1)
+        self.report_1.wikipedia_created = 2
+        self.report_1.save()
+        self.report_2.metrics_related.add(self.metric_2)
+        self.report_2.editors.add(self.editor_1, self.editor_3)
+        self.report_2.commons_edited = 5
+        self.report_2.save()
+        OperationReport.objects.create(report=self.report_2, metric=self.metric_2, number_of_mentions=4)
+        timespans = [(self.report_1.end_date, self.report_1.end_date), (self.report_2.end_date, self.report_2.end_date)]
+        metrics = [self.metric_1, self.metric_2, self.metric_3]
+
+        with self.assertNumQueries(3):
+            matrix = get_done_for_metrics(metrics, timespans=timespans)
+        for metric in metrics:
+            for index, (time_ini, time_end) in enumerate(timespans):
+                query = Q(end_date__gte=time_ini) & Q(end_date__lte=time_end)
+                goal, done, final = get_goal_and_done_for_metric(metric, supplementary_query=query)
+                self.assertEqual(matrix[metric.id][index], (done, final))
+
+    def test_get_done_for_metrics_derives_the_year_from_the_trimesters(self):
+        self.report_1.metrics_related.add(self.metric_1)
+        self.report_1.editors.add(self.editor_1, self.editor_2)
+        self.report_1.wikipedia_created = 2
+        self.report_1.save()
+        self.report_2.end_date = self.report_1.end_date.replace(month=1, day=15)
+        self.report_2.metrics_related.add(self.metric_1)
+        self.report_2.editors.add(self.editor_1)
+        self.report_2.wikipedia_created = 3
+        self.report_2.save()
+        self.report_3.end_date = self.report_1.end_date.replace(month=12, day=15)
+        self.report_3.save()
+        OperationReport.objects.create(report=self.report_2, metric=self.metric_1, number_of_events=4)
+        OperationReport.objects.create(report=self.report_3, metric=self.metric_1, number_of_events=1)
+        timespans = trimester_timespans(self.report_1.end_date.year)
+
+        with self.assertNumQueries(4):
+            matrix = get_done_for_metrics([self.metric_1], timespans=timespans)
+        for index, (time_ini, time_end) in enumerate(timespans):
+            query = Q(end_date__gte=time_ini) & Q(end_date__lte=time_end)
+            goal, done, final = get_goal_and_done_for_metric(self.metric_1, supplementary_query=query)
+            self.assertEqual(matrix[self.metric_1.id][index], (done, final))
+        self.assertEqual(matrix[self.metric_1.id][-1][0]["Wikipedia"], 5)
+        self.assertEqual(matrix[self.metric_1.id][-1][0]["Number of editors"], 2)
+
+    def test_get_done_for_metrics_grouped_by_area_matches_one_call_per_area(self):
+        other_area = TeamArea.objects.create(text="Other area")
+        empty_area = TeamArea.objects.create(text="Empty area")
+        self.report_1.metrics_related.add(self.metric_1, self.metric_2)
+        self.report_1.editors.add(self.editor_1, self.editor_2)
+        self.report_1.wikipedia_created = 2
+        self.report_1.save()
+        self.report_2.area_responsible = other_area
+        self.report_2.metrics_related.add(self.metric_1)
+        self.report_2.editors.add(self.editor_1)
+        self.report_2.participants = 4
+        self.report_2.save()
+        OperationReport.objects.create(report=self.report_2, metric=self.metric_1, number_of_events=3)
+        timespans = trimester_timespans(self.report_1.end_date.year)
+        metrics = [self.metric_1, self.metric_2]
+        areas = [self.team_area, other_area, empty_area]
+
+        with self.assertNumQueries(4):
+            matrices = get_done_for_metrics(metrics, timespans=timespans, group_by="area_responsible",
+                                            groups=[area.id for area in areas])
+        for area in areas:
+            self.assertEqual(matrices[area.id],
+                             get_done_for_metrics(metrics, Q(area_responsible=area), timespans=timespans))
+
+    def test_export_trimester_report_per_area_matches_one_table_per_area(self):
+        poa_project = Project.objects.create(text="POA", current_poa=True)
+        main_project = Project.objects.create(text="Main", main_funding=True)
+        self.metric_1.is_operation = True
+        self.metric_1.save()
+        self.metric_1.project.add(poa_project)
+        self.metric_2.project.add(main_project)
+        other_area = TeamArea.objects.create(text="Other area", color_code="re")
+        self.report_1.metrics_related.add(self.metric_1, self.metric_2)
+        self.report_2.area_responsible = other_area
+        self.report_2.metrics_related.add(self.metric_1)
+        self.report_2.save()
+        OperationReport.objects.create(report=self.report_2, metric=self.metric_1, number_of_events=3)
+
+        buffer = StringIO()
+        for area in TeamArea.objects.all():
+            get_results_divided_by_trimester(buffer, area)
+        self.assertEqual(build_trimester_report(per_area=True), buffer.getvalue())
+
+    def test_get_done_for_metrics_without_timespans(self):
+        self.report_1.metrics_related.add(self.metric_1)
+        self.report_1.participants = 8
+        self.report_1.save()
+
+        matrix = get_done_for_metrics([self.metric_1, self.metric_2])
+        self.assertEqual(matrix[self.metric_1.id][0][0]["Number of participants"], 8)
+        self.assertEqual(matrix[self.metric_2.id][0][0]["Number of participants"], 0)
+
+    def test_rollups_follow_changes_on_reports(self):
+        metrics = [self.metric_1, self.metric_2, self.metric_3]
+        timespans = trimester_timespans(self.report_1.end_date.year)
+        self.report_1.metrics_related.add(self.metric_1, self.metric_2)
+        self.report_1.editors.add(self.editor_1)
+        self.report_1.participants = 3
+        self.report_1.save()
+        self.report_2.metrics_related.add(self.metric_2)
+        OperationReport.objects.create(report=self.report_2, metric=self.metric_2, number_of_events=6)
+        self.assertEqual(get_done_from_rollups(metrics), get_done_for_metrics(metrics))
+        self.assertEqual(get_done_from_rollups(metrics, timespans), get_done_for_metrics(metrics, timespans=timespans))
+
+        self.report_1.metrics_related.remove(self.metric_1)
+        self.report_2.delete()
+        self.assertEqual(get_done_from_rollups(metrics), get_done_for_metrics(metrics))
+        self.assertEqual(get_done_from_rollups(metrics, timespans), get_done_for_metrics(metrics, timespans=timespans))
+
+    def test_rollup_updates_are_deferred_until_the_end_of_the_block(self):
+        with defer_rollup_updates():
+            self.report_1.metrics_related.add(self.metric_1)
+            self.report_1.participants = 3
+            self.report_1.save()
+            self.assertFalse(MetricRollup.objects.exists())
+        done, final = get_done_from_rollups([self.metric_1])[self.metric_1.id][0]
+        self.assertEqual(done["Number of participants"], 3)
+
+    def test_rollups_follow_deleted_participants_and_metrics(self):
+        metric_2_id = self.metric_2.id
+        self.metric_2.boolean_type = True
+        self.metric_2.save()
+        self.report_1.metrics_related.add(self.metric_1, self.metric_2)
+        self.report_1.editors.add(self.editor_1, self.editor_2)
+        self.assertEqual(get_done_from_rollups([self.metric_1])[self.metric_1.id][0][0]["Number of editors"], 2)
+        self.assertTrue(get_done_from_rollups([self.metric_1])[self.metric_1.id][0][0]["Occurrence"])
+
+        self.editor_1.delete()
+        self.metric_2.delete()
+        done, final = get_done_from_rollups([self.metric_1])[self.metric_1.id][0]
+        self.assertEqual(done["Number of editors"], 1)
+        self.assertFalse(done["Occurrence"])
+        self.assertFalse(MetricRollup.objects.filter(metric_id=metric_2_id).exists())
+
+    def test_rollups_are_built_after_migrating_a_database_without_them(self):
+        self.report_1.metrics_related.add(self.metric_1)
+        self.report_1.participants = 3
+        self.report_1.save()
+        MetricRollup.objects.all().delete()
+
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+        done, final = get_done_from_rollups([self.metric_1])[self.metric_1.id][0]
+        self.assertEqual(done["Number of participants"], 3)
+
+    def test_rebuild_metric_rollups_command(self):
+        self.report_1.metrics_related.add(self.metric_1)
+        self.report_1.participants = 3
+        self.report_1.save()
+        MetricRollup.objects.all().delete()
+
+        call_command("rebuild_metric_rollups", stdout=StringIO())
+        done, final = get_done_from_rollups([self.metric_1])[self.metric_1.id][0]
+        self.assertEqual(done["Number of participants"], 3)
+
 
 class TagsTests(TestCase):
     def test_categorize_for_0(self):
@@ -836,6 +1115,104 @@ class MetricsExportTests(TestCase):
         expected_content = b"{| class='wikitable wmb_report_table'\n!Activity !! Metrics !! Q1 !! Q2 !! Q3 !! Q4 !! Total !! References\n|-\n| rowspan='2' | - || " + bytes(metric.text, 'utf-8') + b" || " + bytes(str(operation_report.number_of_events), 'utf-8') + b" || - || - || - || " + bytes(str(operation_report.number_of_events), 'utf-8') + b" || <ref name=\"sara-" + bytes(str(report.id), 'utf-8') + b"\">[[toolforge:sara-wmb/calendar|calendar]], [[w:pt:Wikipedia:Pagina_inicial|Wikipedia:Pagina inicial]], [[c:Main_Page|Main Page]], [https://example.com]</ref>\n|-\n| " + bytes(metric_2.text, 'utf-8') + b" || " + bytes(str(operation_report_2.number_of_events), 'utf-8') + b" || - || - || - || " + bytes(str(operation_report_2.number_of_events), 'utf-8') + b" || <ref name=\"sara-" + bytes(str(report.id), 'utf-8') + b"\"/><ref name=\"sara-" + bytes(str(report_2.id), 'utf-8') + b"\">[[w:pt:Wikipedia:Pagina_inicial|Wikipedia:Pagina inicial]]</ref>\n|-\n|}\n"
         self.assertEqual(response.content.decode('utf-8'), expected_content.decode('utf-8'))
 
+    def test_wmf_report_is_rendered_once_per_data_version(self):
+        self.client.login(username=self.username, password=self.password)
+        url = reverse("metrics:wmf_report")
+        metric = Metric.objects.create(text="Metric", text_en="Metric", activity=self.activity, number_of_events=5)
+        metric.project.add(self.main_project)
+        report = Report.objects.create(description="Report 1",
+                                       created_by=self.user_profile,
+                                       modified_by=self.user_profile,
+                                       initial_date=datetime.today().date(),
+                                       learning="Learnings!" * 51,
+                                       activity_associated=self.activity,
+                                       area_responsible=TeamArea.objects.create(text="Area"),
+                                       links="https://example.com")
+        report.metrics_related.add(metric)
+        OperationReport.objects.create(metric=metric, report=report, number_of_events=3)
+
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root), \
+                patch("metrics.views.build_wmf_report", wraps=build_wmf_report) as build:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/pdf")
+            content = b"".join(response.streaming_content)
+            self.assertTrue(content.startswith(b"%PDF"))
+            etag = response["ETag"]
+            self.assertIn("Last-Modified", response)
+
+            response = self.client.get(url)
+            self.assertEqual(b"".join(response.streaming_content), content)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(build.call_count, 1)
+
+            OperationReport.objects.filter(report=report).update(number_of_events=4)
+            report.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+            self.assertEqual(build.call_count, 2)
+            self.assertEqual(len(os.listdir(os.path.join(export_root, "wmf_report"))), 2)
+
+    def test_wmf_report_version_follows_the_texts_of_the_activities_and_of_the_main_funding(self):
+        metric = Metric.objects.create(text="Metric", text_en="Metric", activity=self.activity, number_of_events=5)
+        metric.project.add(self.main_project)
+        with self.assertNumQueries(1):
+            version = wmf_report_version()
+
+        self.activity.text = "Renamed activity"
+        self.activity.save()
+        self.assertNotEqual(wmf_report_version(), version)
+        version = wmf_report_version()
+
+        self.main_project.text = "Renamed funding"
+        self.main_project.save()
+        self.assertNotEqual(wmf_report_version(), version)
+
+    def test_template_sources_follow_the_templates_extended_and_included(self):
+        sources = template_sources("report/detail_report.html")
+        self.assertEqual(sources[0], get_template("report/detail_report.html").template.source)
+        self.assertIn(get_template("base.html").template.source, sources)
+        self.assertIn(get_template("navbar.html").template.source, sources)
+        self.assertIn(get_template("export_jobs.html").template.source, sources)
+
+    def test_wmf_report_files_of_older_versions_are_removed_after_a_while(self):
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root):
+            directory = os.path.join(export_root, "wmf_report")
+            os.makedirs(directory)
+            for name, age in (("old.pdf", WMF_REPORT_GRACE + 60), ("recent.pdf", 60), ("rendering.tmp", 0)):
+                with open(os.path.join(directory, name), "wb"):
+                    pass
+                modified = datetime.now().timestamp() - age
+                os.utime(os.path.join(directory, name), (modified, modified))
+
+            path, failed_response = get_wmf_report_file()
+            self.assertIsNone(failed_response)
+            self.assertEqual(sorted(os.listdir(directory)), sorted([os.path.basename(path), "recent.pdf",
+                                                                    "rendering.tmp"]))
+
+    def test_wmf_report_removed_before_it_is_served_is_rendered_again(self):
+        self.client.login(username=self.username, password=self.password)
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root):
+            removed = os.path.join(export_root, "removed.pdf")
+            with patch("metrics.views.get_wmf_report_file", side_effect=[(removed, None), get_wmf_report_file()]):
+                response = self.client.get(reverse("metrics:wmf_report"))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    def test_prerender_wmf_report_command_warms_the_cache(self):
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root):
+            call_command("prerender_wmf_report", stdout=StringIO())
+            path = wmf_report_path(wmf_report_version())
+            self.assertTrue(os.path.exists(path))
+
+            self.client.login(username=self.username, password=self.password)
+            with patch("metrics.views.build_wmf_report") as build:
+                response = self.client.get(reverse("metrics:wmf_report"))
+            self.assertEqual(response.status_code, 200)
+            build.assert_not_called()
+
     def test_dewikify_url_with_language_wiki_link(self):
         link = "w:pt:Página_inicial"
         dewikified_url = "https://pt.wikipedia.org/wiki/Página inicial"
@@ -856,4 +1233,157 @@ class MetricsExportTests(TestCase):
     def test_dewikify_url_with_hiphen_link(self):
         link = dewikified_url = "-"
         response = dewikify_url(link)
-        self.assertEqual(response, "")
\ No newline at end of file
+        self.assertEqual(response, "")
+    def test_dewikify_url_with_namespaced_language_wiki_link(self):
+        link = "w:pt:Wikipedia:Página_inicial"
+        dewikified_url = "https://pt.wikipedia.org/wiki/Wikipedia:Página inicial"
+        response = dewikify_url(link)
+        self.assertEqual(response, dewikified_url)
+
+    def test_wikifi_link_and_dewikify_url_round_trip(self):
+        urls = [
+            "https://sara-wmb.toolforge.org/calendar",
+            "https://pt.wikipedia.org/wiki/Wikipedia:Página_inicial",
+            "https://en.wiktionary.org/wiki/wiki",
+            "https://commons.wikimedia.org/wiki/Category:SARA-WMB",
+            "https://www.wikidata.org/wiki/Q42",
+            "https://meta.wikimedia.org/wiki/Wikimedia_Brasil",
+            "https://phabricator.wikimedia.org/T1234",
+        ]
+        for url in urls:
+            wikified = wikifi_link(url)
+            self.assertTrue(wikified.startswith("[["), wikified)
+            target = wikified[2:-2].split("|")[0]
+            self.assertEqual(dewikify_url(target), url.replace("_", " "))
+            self.assertEqual(wikifi_link(dewikify_url(target)), wikified.replace("_", " "))
+
+    def test_wikifi_link_with_non_wiki_link(self):
+        self.assertEqual(wikifi_link("https://example.com/wiki/Page"), "[https://example.com/wiki/Page]")
+        self.assertEqual(wikifi_link("https://pt.wikipedia.org.example.com/wiki/Page"),
+                         "[https://pt.wikipedia.org.example.com/wiki/Page]")
+        self.assertEqual(wikifi_link("-"), "")
+
+    def test_benchmark_links_command(self):
+        Report.objects.create(
+            created_by=self.user_profile,
+            modified_by=self.user_profile,
+            activity_associated=self.activity,
+            area_responsible=TeamArea.objects.create(text="Area"),
+            initial_date=datetime.now().date(),
+            end_date=datetime.now().date(),
+            description="Report",
+            links="https://pt.wikipedia.org/wiki/Página_inicial\r\nhttps://example.com",
+            learning="Learning" * 60,
+        )
+        out = StringIO()
+        call_command("benchmark_links", size=100, stdout=out)
+        self.assertIn("100 links, 2 distinct, 50 wiki links", out.getvalue())
+
+
+class ViewStatsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.username = "testuser"
+        self.password = "testpass"
+        self.user = User.objects.create_user(username=self.username, password=self.password)
+        self.user.user_permissions.add(Permission.objects.get(codename="delete_logentry"))
+        view_stats.reset()
+
+    def test_middleware_records_the_queries_of_each_view(self):
+        self.client.login(username=self.username, password=self.password)
+        self.client.get(reverse("metrics:index"))
+        response = self.client.get(reverse("metrics:index"))
+
+        stats = view_stats.summary()
+        self.assertEqual(stats["metrics:index"]["requests"], 2)
+        self.assertEqual(stats["metrics:index"]["queries"]["max"], response.view_stats.queries)
+        self.assertEqual(sum(stats["metrics:index"]["queries"]["histogram"]), 2)
+        self.assertGreaterEqual(stats["metrics:index"]["python_ms"]["min"], 0)
+
+    def test_view_stats_are_only_shown_to_users_with_permission(self):
+        self.user.user_permissions.clear()
+        self.client.login(username=self.username, password=self.password)
+
+        for url in [reverse("metrics:view_stats"), reverse("metrics:view_stats_json")]:
+            response = self.client.get(url)
+            self.assertRedirects(response, f"{reverse('login')}?next={url}")
+
+    @override_settings(QUERY_BUDGETS={"metrics:index": 1})
+    def test_view_stats_page_and_json(self):
+        self.client.login(username=self.username, password=self.password)
+        self.client.get(reverse("metrics:index"))
+
+        response = self.client.get(reverse("metrics:view_stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "metrics/view_stats.html")
+        self.assertEqual(response.context["over_budget"], ["metrics:index"])
+
+        data = self.client.get(reverse("metrics:view_stats_json")).json()
+        self.assertEqual(data["views"]["metrics:index"]["budget"], 1)
+        self.assertIn("metrics:view_stats", data["views"])
+
+    @override_settings(QUERY_BUDGETS={"metrics:index": 100})
+    def test_query_budget_helper_fails_when_a_view_is_over_its_budget(self):
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.get(reverse("metrics:index"))
+
+        self.assertWithinQueryBudget(response)
+        with self.assertRaises(self.failureException):
+            self.assertWithinQueryBudget(response, budget=0)
+        with self.assertRaises(self.failureException):
+            self.assertWithinQueryBudget(self.client.get(reverse("metrics:about")))
+
+
+class BenchmarkTests(TestCase):
+    def test_generate_benchmark_data_creates_the_dataset(self):
+        out = StringIO()
+        call_command("generate_benchmark_data", "--reports", "40", "--editors", "30", "--organizers", "10",
+                     "--partners", "5", "--events", "10", stdout=out)
+
+        self.assertEqual(Report.objects.count(), 40)
+        self.assertEqual(Editor.objects.count(), 30)
+        self.assertEqual(Project.objects.filter(main_funding=True).count(), 1)
+        self.assertEqual(Project.objects.filter(current_poa=True).count(), 1)
+        self.assertTrue(OperationReport.objects.exists())
+        self.assertTrue(MetricRollup.objects.exists())
+        self.assertIn("Benchmark dataset of seed 0 created", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command("generate_benchmark_data", "--reports", "1", stdout=StringIO())
+
+    def test_run_benchmarks_writes_the_results_and_rolls_back(self):
+        call_command("generate_benchmark_data", "--reports", "40", "--editors", "30", "--organizers", "10",
+                     "--partners", "5", "--events", "10", stdout=StringIO())
+        reports = Report.objects.count()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            call_command("run_benchmarks", "--repeat", "2", "--benchmark", "get_results_divided_by_trimester",
+                         "--benchmark", "calendar_month", "--benchmark", "add_report", "--output", path,
+                         stderr=StringIO())
+            with open(path) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(list(results["results"]), ["get_results_divided_by_trimester", "calendar_month",
+                                                    "add_report"])
+        self.assertEqual(results["dataset"]["report.Report"], reports)
+        self.assertEqual(len(results["results"]["calendar_month"]["ms"]["histogram"]), 12)
+        self.assertGreater(results["results"]["add_report"]["queries"]["min"], 0)
+        self.assertEqual(Report.objects.count(), reports)
+
+    def test_run_benchmarks_leaves_the_cache_and_the_files_of_the_site_untouched(self):
+        call_command("generate_benchmark_data", "--reports", "20", "--editors", "10", "--organizers", "5",
+                     "--partners", "5", "--events", "5", stdout=StringIO())
+        # A cache outside of the database, whose entries are not rolled back
+        site_caches = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "site"}}
+
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root, CACHES=site_caches):
+            versions = get_versions([GLOBAL_VERSION])
+            path = wmf_report_path(wmf_report_version())
+            os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as pdf_file:
+                pdf_file.write(b"%PDF cached")
+            run_benchmarks(["get_metrics_and_aggregate_per_project", "prepare_pdf"], repeat=1)
+
+            with open(path, "rb") as pdf_file:
+                self.assertEqual(pdf_file.read(), b"%PDF cached")
+            self.assertEqual(get_versions([GLOBAL_VERSION]), versions)
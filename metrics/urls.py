@@ -11,6 +11,9 @@ urlpatterns = [
     path('metrics_per_project', views.show_metrics_per_project, name='per_project'),
     path('metrics_per_project/<int:project_id>', views.show_metrics_for_specific_project, name='specific_project'),
     path('detailed_metrics_per_project', views.show_detailed_metrics_per_project, name='detailed_per_project'),
+    path('metrics_cache_stats', views.show_metrics_cache_stats, name='cache_stats'),
+    path('view_stats', views.show_view_stats, name='view_stats'),
+    path('view_stats/json', views.show_view_stats_json, name='view_stats_json'),
     path('update_metrics', views.update_metrics_relations, name='update_metrics'),
     path('metrics_reports/<int:metric_id>', views.metrics_reports, name='metrics_reports'),
     path("trimester", views.export_trimester_report, name="export_reports_per_trimester"),
@@ -1,13 +1,26 @@
 import calendar
 import datetime
+import hashlib
+import os
+import tempfile
 from django.shortcuts import render, redirect, reverse, HttpResponse
+from django.http import JsonResponse, FileResponse
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q, Sum, F
+from django.db.models import Q, F, Value, IntegerField
 from metrics.models import Activity, Metric
+from metrics.aggregation import MetricRelation, get_done_for_reports, get_done_for_metrics, trimester_timespans
+from metrics.rollups import get_done_from_rollups
+from metrics.caching import get_cached_datasets, get_cache_stats, get_versions, GLOBAL_VERSION
+from metrics.instrumentation import view_stats, QUERY_BUCKETS, TIME_BUCKETS
 from metrics.utils import render_to_pdf
-from report.models import Report, Editor, Organizer, Partner, Project, OperationReport
+from metrics.links import wikifi_link, dewikify_url
+from report.models import Report, Project
 from users.models import TeamArea
 from django import template
 from django.conf import settings
@@ -19,26 +32,11 @@ import urllib.parse as ur
 register = template.Library()
 calendar.setfirstweekday(calendar.SUNDAY)
 
-PATTERNS = {
-    r"https://(.*).(toolforge).org/(.*)": "toolforge:",
-    r"https://(.*).wikibooks.org/wiki/(.*)": "b:",
-    r"https://(.*).wikinews.org/wiki/(.*)": "n:",
-    r"https://(.*).wikipedia.org/wiki/(.*)": "w:",
-    r"https://(.*).wikiquote.org/wiki/(.*)": "q:",
-    r"https://(.*).wikisource.org/wiki/(.*)": "s:",
-    r"https://(.*).wikiversity.org/wiki/(.*)": "v:",
-    r"https://(.*).wikivoyage.org/wiki/(.*)": "voy:",
-    r"https://(.*).wiktionary.org/wiki/(.*)": "wikt:",
-    r"https://commons.wikimedia.org/wiki/(.*)": "c",
-    r"https://outreach.wikimedia.org/wiki/(.*)": "outreach",
-    r"https://species.wikimedia.org/wiki/(.*)": "species",
-    r"https://wikitech.wikimedia.org/wiki/(.*)": "wikitech",
-    r"https://www.mediawiki.org/wiki/(.*)": "mw",
-    r"https://www.wikidata.org/wiki/(.*)": "d",
-    r"https://br.wikimedia.org/wiki/(.*)": "wmbr",
-    r"https://meta.wikimedia.org/wiki/(.*)": "",
-    r"https://phabricator.wikimedia.org/(.*)": "phab",
-}
+WMF_REPORT_TEMPLATE = "metrics/wmf_report.html"
+# Directory of EXPORT_ROOT keeping the rendered WMF report of the latest data version
+WMF_REPORT_DIRECTORY = "wmf_report"
+# Seconds the files of older versions are kept, so the requests still serving them can finish
+WMF_REPORT_GRACE = 60 * 60
 
 
 def index(request):
@@ -55,16 +53,143 @@ def show_activities_plan(request):
     return redirect(settings.POA_URL)
 
 
+def wmf_report_version():
+    """
+    Hash of everything the WMF report is rendered from in the current year: the data version of the main funding,
+    which changes with its text, its metrics and the reports of these, the global data version, which changes with
+    the activities and areas, and the templates.
+
+    The data versions are read from the cache instead of the reports, so computing the hash takes no query but the
+    main funding.
+
+    :return: Hexadecimal string.
+    """
+    main_project = Project.objects.get(main_funding=True)
+    versions = get_versions([main_project.pk, GLOBAL_VERSION])
+    data = (
+        datetime.datetime.today().year,
+        main_project.pk,
+        versions[main_project.pk],
+        versions[GLOBAL_VERSION],
+        template_sources(WMF_REPORT_TEMPLATE),
+    )
+    return hashlib.sha256(repr(data).encode("utf-8")).hexdigest()
+
+
+def template_sources(name, seen=None):
+    """
+    Sources of a template and of the templates it extends or includes by a constant name.
+
+    :param name: Name of the template.
+    :param seen: Set of the names already read, so a template is read once.
+    :return: List of sources.
+    """
+    seen = set() if seen is None else seen
+    seen.add(name)
+    template = get_template(name).template
+    sources = [template.source]
+    for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+        expression = node.parent_name if isinstance(node, ExtendsNode) else node.template
+        if isinstance(expression.var, str) and expression.var not in seen:
+            sources += template_sources(expression.var, seen)
+    return sources
+
+
+def wmf_report_path(version):
+    return os.path.join(settings.EXPORT_ROOT, WMF_REPORT_DIRECTORY, version + ".pdf")
+
+
+def get_wmf_report_file(version=None, force=False):
+    """
+    Path of the WMF report PDF of a data version, rendering it only if it is not in the cache yet.
+
+    The files of older versions, or left by a rendering that failed, are removed once the new one is written if they
+    were not written in the last WMF_REPORT_GRACE seconds.
+
+    :param version: Data version returned by wmf_report_version. If None, it is computed.
+    :param force: Whether to render the file even if it is already in the cache.
+    :return: (path, response) tuple. The response is None unless the rendering failed.
+    """
+    version = version or wmf_report_version()
+    path = wmf_report_path(version)
+    if os.path.exists(path) and not force:
+        return path, None
+
+    response = build_wmf_report()
+    if response.status_code != 200:
+        return path, response
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as pdf_file:
+        pdf_file.write(response.content)
+    os.replace(pdf_file.name, path)
+    remove_old_wmf_reports(os.path.dirname(path), keep=os.path.basename(path))
+    return path, None
+
+
+def remove_old_wmf_reports(directory, keep):
+    """
+    Removes the files of the WMF report directory not written in the last WMF_REPORT_GRACE seconds.
+
+    Another request may be rendering or serving a file at the same time, so the recent files are kept and a file
+    already removed by someone else is ignored.
+
+    :param directory: Directory of the rendered reports.
+    :param keep: Name of the file of the current version.
+    :return: None
+    """
+    oldest = datetime.datetime.now().timestamp() - WMF_REPORT_GRACE
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name != keep and os.path.getmtime(path) < oldest:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def wmf_report_etag(request, *args, **kwargs):
+    if not hasattr(request, "wmf_report_version"):
+        request.wmf_report_version = wmf_report_version()
+    return request.wmf_report_version
+
+
+def wmf_report_last_modified(request, *args, **kwargs):
+    path = wmf_report_path(wmf_report_etag(request))
+    if os.path.exists(path):
+        return datetime.datetime.fromtimestamp(os.path.getmtime(path), tz=datetime.timezone.utc)
+    return None
+
+
 @login_required
 @permission_required("metrics.view_metric")
+@condition(etag_func=wmf_report_etag, last_modified_func=wmf_report_last_modified)
 def prepare_pdf(request, *args, **kwargs):
-    timespan_array = [
-        (datetime.date(datetime.datetime.today().year, 1, 1), datetime.date(datetime.datetime.today().year, 3, 31)),
-        (datetime.date(datetime.datetime.today().year, 4, 1), datetime.date(datetime.datetime.today().year, 6, 18)),
-        (datetime.date(datetime.datetime.today().year, 6, 19), datetime.date(datetime.datetime.today().year, 9, 20)),
-        (datetime.date(datetime.datetime.today().year, 9, 21), datetime.date(datetime.datetime.today().year, 12, 31)),
-        (datetime.date(datetime.datetime.today().year, 1, 1), datetime.date(datetime.datetime.today().year, 12, 31))
-    ]
+    path, failed_response = get_wmf_report_file(wmf_report_etag(request))
+    if failed_response:
+        return failed_response
+
+    try:
+        pdf_file = open(path, "rb")
+    except FileNotFoundError:
+        # Removed in the meantime by a request rendering a newer version
+        path, failed_response = get_wmf_report_file(wmf_report_etag(request), force=True)
+        if failed_response:
+            return failed_response
+        pdf_file = open(path, "rb")
+
+    response = FileResponse(pdf_file, content_type="application/pdf", filename="wmf_report.pdf")
+    response.headers["Last-Modified"] = http_date(os.path.getmtime(path))
+    return response
+
+
+def build_wmf_report():
+    """
+    Renders the PDF report of the metrics of the main funding in the current year.
+
+    :return: HttpResponse with the PDF file.
+    """
+    timespan_array = trimester_timespans(datetime.datetime.today().year)
     main_project = Project.objects.get(main_funding=True)
     main_results = get_results_for_timespan(timespan_array,
                                             Q(project=main_project),
@@ -90,7 +215,7 @@ def prepare_pdf(request, *args, **kwargs):
     refs = sorted(list(set(refs)))
     context = {"project":str(main_project), "metrics": metrics, "references": refs}
 
-    return render_to_pdf('metrics/wmf_report.html', context)
+    return render_to_pdf(WMF_REPORT_TEMPLATE, context)
 
 
 def process_all_references(input_string):
@@ -150,66 +275,20 @@ def replace_with_links(input_string):
     return result
 
 
-INVERTED_PATTERNS = {
-    r"^toolforge:([^\/]+)\/(.+)": "https://$1.toolforge.org/$2",
-    r"^b:(.*):(.*)":    "https://$1.wikibooks.org/wiki/$2",
-    r"^n:(.*):(.*)":    "https://$1.wikinews.org/wiki/$2",
-    r"^w:(.*):(.*)":    "https://$1.wikipedia.org/wiki/$2",
-    r"^q:(.*):(.*)":    "https://$1.wikiquote.org/wiki/$2",
-    r"^s:(.*):(.*)":    "https://$1.wikisource.org/wiki/$2",
-    r"^v:(.*):(.*)":    "https://$1.wikiversity.org/wiki/$2",
-    r"^voy:(.*):(.*)":  "https://$1.wikivoyage.org/wiki/$2",
-    r"^wikt:(.*):(.*)": "https://$1.wiktionary.org/wiki/$2",
-    r"^c:(.*)":         "https://commons.wikimedia.org/wiki/$2",
-    r"^outreach:(.*)":  "https://outreach.wikimedia.org/wiki/$2",
-    r"^species:(.*)":   "https://species.wikimedia.org/wiki/$2",
-    r"^wikitech:(.*)":  "https://wikitech.wikimedia.org/wiki/$2",
-    r"^mw:(.*)":        "https://www.mediawiki.org/wiki/$2",
-    r"^d:(.*)":         "https://www.wikidata.org/wiki/$2",
-    r"^wmbr:(.*)":      "https://br.wikimedia.org/wiki/$2",
-    r"^phab:(.*)":      "https://phabricator.wikimedia.org/$2",
-}
-
-
-def dewikify_url(link, meta=False):
-    for pattern, prefix in INVERTED_PATTERNS.items():
-        match = re.match(pattern, link)
-        if match:
-            number_of_groups = len(match.groups())
-            lang = ""
-            if number_of_groups == 2:
-                lang = match.group(1)
-                page = match.group(2)
-            else:
-                page = match.group(1)
-
-            page = ur.unquote(page)
-            clean_page = page.replace("_", " ")
-            clean_page = clean_page[:-1] if clean_page.endswith("/") else clean_page
-
-            return prefix.replace("$1",f"{lang}").replace("$2",f"{clean_page}")
-
-    # The link is a meta link, so no prefix
-    if meta:
-        return f"https://meta.wikimedia.org/wiki/{link}"
-    else: # The link is not a proper Wiki link
-        return f"{link}" if link != "-" else ""
-
-
 @login_required
 @permission_required("metrics.view_metric")
 def show_metrics_per_project(request):
     current_language = get_language()
     poa_project = Project.objects.get(current_poa=True)
-    operational_dataset = get_metrics_and_aggregate_per_project(Q(current_poa=True), Q(is_operation=True), lang=current_language)
+    operational_dataset = get_cached_metrics_per_project(Q(current_poa=True), Q(is_operation=True), lang=current_language)
 
-    poa_dataset = get_metrics_and_aggregate_per_project(Q(current_poa=True), Q(boolean_type=True), "Occurrence", lang=current_language)
+    poa_dataset = get_cached_metrics_per_project(Q(current_poa=True), Q(boolean_type=True), "Occurrence", lang=current_language)
     if poa_dataset and operational_dataset:
         poa_dataset[poa_project.id]["project_metrics"] += operational_dataset[poa_project.id]["project_metrics"]
 
     context = {
         "poa_dataset": poa_dataset,
-        "dataset": get_metrics_and_aggregate_per_project(Q(active=True, current_poa=False), lang=current_language),
+        "dataset": get_cached_metrics_per_project(Q(active=True, current_poa=False), lang=current_language),
         "title": _("Show metrics per project")
     }
 
@@ -223,15 +302,15 @@ def show_metrics_for_specific_project(request, project_id):
     project = Project.objects.get(pk=project_id)
 
     if project.current_poa:
-        operational_dataset = get_metrics_and_aggregate_per_project(Q(current_poa=True), Q(is_operation=True),
-                                                                    lang=current_language)
+        operational_dataset = get_cached_metrics_per_project(Q(current_poa=True), Q(is_operation=True),
+                                                             lang=current_language)
 
-        metrics_aggregated = get_metrics_and_aggregate_per_project(Q(current_poa=True), Q(boolean_type=True),
-                                                                   "Occurrence", lang=current_language)
+        metrics_aggregated = get_cached_metrics_per_project(Q(current_poa=True), Q(boolean_type=True),
+                                                            "Occurrence", lang=current_language)
         if metrics_aggregated and operational_dataset:
             metrics_aggregated[project.id]["project_metrics"] += operational_dataset[project.id]["project_metrics"]
     else:
-        metrics_aggregated = get_metrics_and_aggregate_per_project(Q(pk=project_id), lang=current_language)
+        metrics_aggregated = get_cached_metrics_per_project(Q(pk=project_id), lang=current_language)
 
     context = { "dataset": metrics_aggregated, "title": project.text }
 
@@ -243,12 +322,42 @@ def show_metrics_for_specific_project(request, project_id):
 def show_detailed_metrics_per_project(request):
     context = {
         "poa_dataset": {},
-        "dataset": get_metrics_and_aggregate_per_project(Q(active=True)),
+        "dataset": get_cached_metrics_per_project(Q(active=True)),
         "title": _("Show metrics per project")
     }
     return render(request, "metrics/list_metrics_per_project.html", context)
 
 
+@login_required
+@permission_required("admin.delete_logentry")
+def show_metrics_cache_stats(request):
+    return JsonResponse(get_cache_stats())
+
+
+@login_required
+@permission_required("admin.delete_logentry")
+def show_view_stats(request):
+    """
+    Shows the number of queries, SQL time and Python time of the latest requests of each view of this process.
+
+    :param request: The HTTP request object.
+    :return: HttpResponse: Renders the statistics of the views.
+    """
+    stats = view_stats.summary()
+    context = {"stats": stats,
+               "query_buckets": QUERY_BUCKETS,
+               "over_budget": [view_name for view_name, view in stats.items()
+                               if view["budget"] is not None and view["queries"]["max"] > view["budget"]],
+               "title": _("Statistics of the views")}
+    return render(request, "metrics/view_stats.html", context)
+
+
+@login_required
+@permission_required("admin.delete_logentry")
+def show_view_stats_json(request):
+    return JsonResponse({"query_buckets": QUERY_BUCKETS, "time_buckets": TIME_BUCKETS, "views": view_stats.summary()})
+
+
 @login_required
 @permission_required("metrics.view_metric")
 def metrics_reports(request, metric_id):
@@ -289,11 +398,7 @@ def metrics_reports(request, metric_id):
 @login_required
 @permission_required("metrics.view_metric")
 def export_trimester_report(request):
-    buffer = StringIO()
-
-    get_results_divided_by_trimester(buffer, None, False)
-
-    response = HttpResponse(buffer.getvalue())
+    response = HttpResponse(build_trimester_report())
     response['Content-Type'] = 'text/plain; charset=UTF-8'
     response['Content-Disposition'] = 'attachment; filename="trimester_report.txt"'
 
@@ -303,46 +408,79 @@ def export_trimester_report(request):
 @login_required
 @permission_required("metrics.view_metric")
 def export_trimester_report_by_by_area_responsible(request):
-    buffer = StringIO()
-
-    for area in TeamArea.objects.all():
-        get_results_divided_by_trimester(buffer, area, False)
-
-    response = HttpResponse(buffer.getvalue())
+    response = HttpResponse(build_trimester_report(per_area=True))
     response['Content-Type'] = 'text/plain; charset=UTF-8'
     response['Content-Disposition'] = 'attachment; filename="trimester_report.txt"'
 
     return response
 
 
+def build_trimester_report(per_area=False, progress=None):
+    """
+    Wikitext of the trimester report, for every report or divided by area responsible.
+
+    :param per_area: Whether to write a table for each area responsible.
+    :param progress: Function called with the number of tables written and the number of tables, if any.
+    :return: String.
+    """
+    buffer = StringIO()
+    if per_area:
+        # Every area is computed by the same grouped queries, then written from that single dataset
+        areas = list(TeamArea.objects.all())
+        results = get_results_for_timespan_per_area(trimester_timespans(datetime.datetime.today().year),
+                                                    trimester_metric_queries(), areas)
+        for index, area in enumerate(areas, start=1):
+            write_trimester_table(buffer, area, *results[area.id])
+            if progress:
+                progress(index, len(areas))
+    else:
+        get_results_divided_by_trimester(buffer, None, False)
+        if progress:
+            progress(1, 1)
+
+    return buffer.getvalue()
+
+
+def trimester_metric_queries():
+    """
+    Metrics of the two tables of the trimester report: the operational metrics of the current plan of activities
+    and the metrics of the main funding.
+
+    :return: List of Q objects.
+    """
+    return [Q(project=Project.objects.get(current_poa=True), is_operation=True),
+            Q(project=Project.objects.get(main_funding=True))]
+
+
 def get_results_divided_by_trimester(buffer, area=None, with_goal=False):
-    timespan_array = [
-        (datetime.date(datetime.datetime.today().year, 1, 1), datetime.date(datetime.datetime.today().year, 3, 31)),
-        (datetime.date(datetime.datetime.today().year, 4, 1), datetime.date(datetime.datetime.today().year, 6, 18)),
-        (datetime.date(datetime.datetime.today().year, 6, 19), datetime.date(datetime.datetime.today().year, 9, 20)),
-        (datetime.date(datetime.datetime.today().year, 9, 21), datetime.date(datetime.datetime.today().year, 12, 31)),
-        (datetime.date(datetime.datetime.today().year, 1, 1), datetime.date(datetime.datetime.today().year, 12, 31))
-    ]
+    timespan_array = trimester_timespans(datetime.datetime.today().year)
+    report_query = Q(area_responsible=area) if area else Q()
+    poa_query, main_query = trimester_metric_queries()
+
+    poa_results = get_results_for_timespan(timespan_array, poa_query, report_query, with_goal)
+    main_results = get_results_for_timespan(timespan_array, main_query, report_query, with_goal)
+    write_trimester_table(buffer, area, poa_results, main_results)
+
+
+def write_trimester_table(buffer, area, poa_results, main_results):
+    """
+    Writes the wikitext table of the trimester report of an area responsible, or of every report.
+
+    :param buffer: Text buffer.
+    :param area: Team area of the table. If None, the table has no title.
+    :param poa_results: Results of the metrics of the current plan of activities.
+    :param main_results: Results of the metrics of the main funding.
+    :return: None
+    """
     if area:
-        report_query = Q(area_responsible=area)
         header = ("==" + area.text + "==\n<div class='wmb_report_table_container bd-" + area.color_code +
                   "'>\n{| class='wikitable wmb_report_table'\n! colspan='8' class='bg-" + area.color_code +
                   " co-" + area.color_code + "' | <h5 id='Metrics'>Operational and General metrics</h5>\n|-\n")
         footer = "|}\n</div>\n"
     else:
-        report_query = Q()
         header = "{| class='wikitable wmb_report_table'\n"
         footer = "|}\n"
 
-    poa_results = get_results_for_timespan(timespan_array,
-                                           Q(project=Project.objects.get(current_poa=True), is_operation=True),
-                                           report_query,
-                                           with_goal)
-    main_results = get_results_for_timespan(timespan_array,
-                                            Q(project=Project.objects.get(main_funding=True)),
-                                            report_query,
-                                            with_goal)
-
     poa_wikitext = construct_wikitext(poa_results, header +
                                       "!Activity !! Metrics !! Q1 !! Q2 !! Q3 !! Q4 !! Total !! References\n|-\n")
     main_wikitext = construct_wikitext(main_results, "")
@@ -356,20 +494,59 @@ def get_results_divided_by_trimester(buffer, area=None, with_goal=False):
 
 
 def get_results_for_timespan(timespan_array, metric_query=Q(), report_query=Q(), with_goal=False, lang="pt"):
+    metrics = list(Metric.objects.filter(metric_query).select_related("activity").order_by("activity_id", "id"))
+    if report_query:
+        done_matrix = get_done_for_metrics(metrics, report_query, timespan_array)
+    else:
+        done_matrix = get_done_from_rollups(metrics, timespan_array)
+
+    time_ini, time_end = timespan_array[-1]
+    supplementary_query = Q(end_date__gte=time_ini) & Q(end_date__lte=time_end) & report_query
+    refs_of_metrics = build_wiki_refs_for_metrics(metrics, supplementary_query=supplementary_query)
+    return build_results(metrics, done_matrix, refs_of_metrics, with_goal, lang)
+
+
+def get_results_for_timespan_per_area(timespan_array, metric_queries, areas, with_goal=False, lang="pt"):
+    """
+    Results of get_results_for_timespan for the reports of each area responsible, computed for every area and every
+    metric query by the same grouped queries.
+
+    :param timespan_array: List of (initial date, end date) tuples.
+    :param metric_queries: List of Q objects selecting the metrics of each table.
+    :param areas: List of team areas.
+    :param with_goal: Whether to add the goal of each metric to its row.
+    :param lang: Language of the text of the metrics.
+    :return: Dictionary of area id to a list, aligned with metric_queries, of results.
+    """
+    metrics_per_query = [list(Metric.objects.filter(metric_query).select_related("activity").order_by(
+        "activity_id", "id")) for metric_query in metric_queries]
+    metrics = list({metric.id: metric for query_metrics in metrics_per_query for metric in query_metrics}.values())
+    area_ids = [area.id for area in areas]
+
+    done_matrices = get_done_for_metrics(metrics, Q(area_responsible__in=area_ids), timespan_array,
+                                         group_by="area_responsible", groups=area_ids)
+    time_ini, time_end = timespan_array[-1]
+    refs_per_area = build_wiki_refs_for_metrics(metrics, Q(end_date__gte=time_ini) & Q(end_date__lte=time_end),
+                                                group_by="area_responsible", groups=area_ids)
+
+    return {area_id: [build_results(query_metrics, done_matrices[area_id], refs_per_area[area_id], with_goal, lang)
+                      for query_metrics in metrics_per_query] for area_id in area_ids}
+
+
+def build_results(metrics, done_matrix, refs_of_metrics, with_goal=False, lang="pt"):
     results = []
-    for metric in Metric.objects.filter(metric_query).order_by("activity_id", "id"):
+    for metric in metrics:
         done_row = []
         refs = []
         goal_value = 0
-        for time_ini, time_end in timespan_array:
-            supplementary_query = Q(end_date__gte=time_ini) & Q(end_date__lte=time_end) & report_query
-            goal, done, final = get_goal_and_done_for_metric(metric, supplementary_query=supplementary_query)
+        goal = get_goal_for_metric(metric)
+        for done, final in done_matrix[metric.id]:
             for key, value in goal.items():
                 if value != 0:
                     done_row.append(done[key]) if done[key] else done_row.append("-")
                     goal_value = value
 
-        refs.append(build_wiki_ref_for_reports(metric, supplementary_query=supplementary_query))
+        refs.append(refs_of_metrics[metric.id])
         refs = list(dict.fromkeys(refs))
         done_row.append(" ".join(filter(None, refs)))
 
@@ -425,16 +602,29 @@ def construct_wikitext(results, wikitext):
 def get_metrics_and_aggregate_per_project(project_query=Q(active=True), metric_query=Q(), field=None, lang=""):
     aggregated_metrics_and_results = {}
 
+    # Collect the metrics of every activity first, so what was done is computed for all of them at once
+    projects = []
     for project in Project.objects.filter(project_query).order_by("-current_poa", "-main_funding"):
-        project_metrics = []
+        activities = []
         for activity in Activity.objects.filter(area__project=project):
-            activity_metrics = {}
             if activity.id != 1:
                 q_filter = Q(project=project, activity=activity) & metric_query
             else:
                 q_filter = Q(project=project) & metric_query
-            for metric in Metric.objects.filter(q_filter):
-                goal, done, final = get_goal_and_done_for_metric(metric)
+            activities.append((activity, list(Metric.objects.filter(q_filter))))
+        projects.append((project, activities))
+
+    all_metrics = {metric.id: metric for project, activities in projects for activity, metrics in activities
+                   for metric in metrics}
+    done_matrix = get_done_from_rollups(all_metrics.values())
+
+    for project, activities in projects:
+        project_metrics = []
+        for activity, metrics in activities:
+            activity_metrics = {}
+            for metric in metrics:
+                goal = get_goal_for_metric(metric)
+                done, final = done_matrix[metric.id][0]
 
                 if field and goal[field] != 0:
                     result_metrics = {field: {"goal": goal[field], "done": done[field], "final": final}}
@@ -463,6 +653,16 @@ def get_metrics_and_aggregate_per_project(project_query=Q(active=True), metric_q
     return aggregated_metrics_and_results
 
 
+def get_cached_metrics_per_project(project_query=Q(active=True), metric_query=Q(), field=None, lang=""):
+    project_ids = list(Project.objects.filter(project_query).order_by("-current_poa", "-main_funding").values_list(
+        "id", flat=True))
+
+    def compute(missing_ids):
+        return get_metrics_and_aggregate_per_project(Q(pk__in=missing_ids), metric_query, field, lang)
+
+    return get_cached_datasets(project_ids, (str(metric_query), field, lang), compute)
+
+
 def get_goal_and_done_for_metric(metric, supplementary_query=Q()):
     query = Q(metrics_related__in=[metric]) & supplementary_query
     reports = Report.objects.filter(query)
@@ -510,49 +710,54 @@ def get_goal_for_metric(metric):
     }
 
 
-def wikifi_link(link):
-    for pattern, prefix in PATTERNS.items():
-        match = re.match(pattern, link)
-        if match:
-            number_of_groups = len(match.groups())
-            project = ""
-            lang = ""
-            if number_of_groups == 3:
-                project = match.group(1)
-                page = match.group(3)
-            elif number_of_groups == 2:
-                lang = match.group(1)
-                page = match.group(2)
-            else:
-                page = match.group(1)
+def build_wiki_ref_for_reports(metric, supplementary_query=Q()):
+    return build_wiki_refs_for_metrics([metric], supplementary_query)[metric.id]
+
+
+def build_wiki_refs_for_metrics(metrics, supplementary_query=Q(), group_by=None, groups=()):
+    """
+    Builds the wikitext references of the reports of many metrics with a single query.
+
+    The links of each report are wikified once, no matter how many of the metrics it is related to.
+
+    :param metrics: Iterable of metrics.
+    :param supplementary_query: Q object applied to the reports.
+    :param group_by: Name of a field of the reports, such as "area_responsible", to group the references by.
+    :param groups: Values of group_by to return, including the ones without reports.
+    :return: Dictionary of metric id to the references of its reports. With group_by, a dictionary of group to such
+             a dictionary.
+    """
+    metric_ids = [metric.id for metric in metrics]
+    groups = list(groups) if group_by else [None]
+    refs = {group: {metric_id: [] for metric_id in metric_ids} for group in groups}
+    relations = MetricRelation.objects.filter(
+        metric__in=metric_ids, report__in=Report.objects.filter(supplementary_query)
+    ).order_by("report_id")
+    if group_by:
+        relations = relations.annotate(group=F("report__" + group_by))
+    else:
+        relations = relations.annotate(group=Value(None, output_field=IntegerField()))
+    relations = relations.values_list("metric_id", "report_id", "report__links", "report__reference_text", "group")
 
-            page = ur.unquote(page)
-            clean_page = page.replace("_", " ")
-            clean_page = clean_page[:-1] if clean_page.endswith("/") else clean_page
+    fragments = {}
+    for metric_id, report_id, links, reference_text, group in relations:
+        if report_id not in fragments:
+            fragments[report_id] = build_wiki_ref_for_report(report_id, links, reference_text)
+        if fragments[report_id] and group in refs:
+            refs[group][metric_id].append(fragments[report_id])
 
-            return f"[[{prefix}{project}/{page}|{clean_page}]]" if project\
-                else f"[[{prefix}{lang}:{page}|{clean_page}]]"
-    # The link is not a proper Wiki link
-    return f"[{link}]" if link != "-" else ""
+    refs = {group: {metric_id: "".join(metric_refs) for metric_id, metric_refs in refs_of_group.items()}
+            for group, refs_of_group in refs.items()}
+    return refs if group_by else refs[None]
 
 
-def build_wiki_ref_for_reports(metric, supplementary_query=Q()):
-    query = Q(metrics_related__in=[metric]) & supplementary_query
-    reports = Report.objects.filter(query)
-    refs_set = []
-    for report in reports:
-        if not report.reference_text:
-            links = report.links.replace("\\r\\n", "\r\n").splitlines()
-            formatted_links = []
-            for link in links:
-                formatted_links.append(wikifi_link(link))
-
-            ref_content = ", ".join(formatted_links)
-            if ref_content:
-                refs_set.append(f"<ref name=\"sara-{report.id}\">{ref_content}</ref>")
-        else:
-            refs_set.append(report.reference_text)
-    return "".join(refs_set)
+def build_wiki_ref_for_report(report_id, links, reference_text):
+    if reference_text:
+        return reference_text
+
+    formatted_links = [wikifi_link(link) for link in links.replace("\\r\\n", "\r\n").splitlines()]
+    ref_content = ", ".join(formatted_links)
+    return f"<ref name=\"sara-{report_id}\">{ref_content}</ref>" if ref_content else ""
 
 
 def is_there_a_final_report(reports):
@@ -560,58 +765,7 @@ def is_there_a_final_report(reports):
 
 
 def get_done_for_report(reports, metric):
-    operation_reports = OperationReport.objects.filter(report__in=reports, metric=metric)
-    alt_operation_reports = OperationReport.objects.filter(report__in=reports)
-    return {
-        # Content metrics
-        "Wikipedia": reports.aggregate(total=Sum(F("wikipedia_created") + F("wikipedia_edited")))["total"] or 0,
-        "Wikimedia Commons": reports.aggregate(total=Sum(F("commons_created") + F("commons_edited")))["total"] or 0,
-        "Wikidata": reports.aggregate(total=Sum(F("wikidata_created") + F("wikidata_edited")))["total"] or 0,
-        "Wikiversity": reports.aggregate(total=Sum(F("wikiversity_created") + F("wikiversity_edited")))["total"] or 0,
-        "Wikibooks": reports.aggregate(total=Sum(F("wikibooks_created") + F("wikibooks_edited")))["total"] or 0,
-        "Wikisource": reports.aggregate(total=Sum(F("wikisource_created") + F("wikisource_edited")))["total"] or 0,
-        "Wikinews": reports.aggregate(total=Sum(F("wikinews_created") + F("wikinews_edited")))["total"] or 0,
-        "Wikiquote": reports.aggregate(total=Sum(F("wikiquote_created") + F("wikiquote_edited")))["total"] or 0,
-        "Wiktionary": reports.aggregate(total=Sum(F("wiktionary_created") + F("wiktionary_edited")))["total"] or 0,
-        "Wikivoyage": reports.aggregate(total=Sum(F("wikivoyage_created") + F("wikivoyage_edited")))["total"] or 0,
-        "Wikispecies": reports.aggregate(total=Sum(F("wikispecies_created") + F("wikispecies_edited")))["total"] or 0,
-        "MetaWiki": reports.aggregate(total=Sum(F("metawiki_created") + F("metawiki_edited")))["total"] or 0,
-        "MediaWiki": reports.aggregate(total=Sum(F("mediawiki_created") + F("mediawiki_edited")))["total"] or 0,
-        # Community metrics
-        "Number of editors": Editor.objects.filter(editors__in=reports).distinct().count() or 0,
-        "Number of editors retained": Editor.objects.filter(retained=True, editors__in=reports).distinct().count() or 0,
-        "Number of new editors": Editor.objects.filter(editors__in=reports, account_creation_date__gte=F(
-            'editors__initial_date')).count() or 0,
-        "Number of participants": reports.aggregate(total=Sum("participants"))["total"] or 0,
-        "Number of partnerships activated": Partner.objects.filter(partners__in=reports).distinct().count() or 0,
-        "Number of new partnerships": operation_reports.aggregate(total=Sum("number_of_new_partnerships"))[
-                                          "total"] or 0,
-        "Number of organizers": Organizer.objects.filter(organizers__in=reports).distinct().count() or 0,
-        "Number of organizers retained": Organizer.objects.filter(retained=True,
-                                                                  organizers__in=reports).distinct().count() or 0,
-        "Number of resources": operation_reports.aggregate(
-            total=Sum("number_of_resources"))["total"] or alt_operation_reports.aggregate(
-            total=Sum("number_of_resources"))["total"] or 0,
-        "Number of feedbacks": reports.aggregate(total=Sum("feedbacks"))["total"] or 0,
-        "Number of events": operation_reports.aggregate(
-            total=Sum("number_of_events"))["total"] or alt_operation_reports.aggregate(
-            total=Sum("number_of_events"))["total"] or 0,
-        # Communication metrics
-        "Number of new followers": operation_reports.aggregate(
-            total=Sum("number_of_new_followers"))["total"] or alt_operation_reports.aggregate(
-            total=Sum("number_of_new_followers"))["total"] or 0,
-        "Number of mentions": operation_reports.aggregate(
-            total=Sum("number_of_mentions"))["total"] or alt_operation_reports.aggregate(
-            total=Sum("number_of_mentions"))["total"] or 0,
-        "Number of community communications": operation_reports.aggregate(
-            total=Sum("number_of_community_communications"))["total"] or alt_operation_reports.aggregate(
-            total=Sum("number_of_community_communications"))["total"] or 0,
-        "Number of people reached through social media": operation_reports.aggregate(
-            total=Sum("number_of_people_reached_through_social_media"))["total"] or alt_operation_reports.aggregate(
-            total=Sum("number_of_people_reached_through_social_media"))["total"] or 0,
-        # Other metrics
-        "Occurrence": reports.filter(metrics_related__boolean_type=True).exists() or False,
-    }
+    return get_done_for_reports(reports, metric)
 
 
 def update_metrics_relations(request):
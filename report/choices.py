@@ -0,0 +1,130 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from metrics.models import Area, Activity, Project, Metric
+from report.models import LearningArea, StrategicLearningQuestion
+from strategy.models import StrategicAxis, Direction
+
+CACHE_PREFIX = "report_form_choices"
+CACHE_TIMEOUT = 60 * 60 * 24
+ACTIVITIES = "activities"
+DIRECTIONS = "directions"
+LEARNING_QUESTIONS = "learning_questions"
+OPERATION_METRICS = "operation_metrics"
+
+
+# TREES
+def activities_associated_as_choices():
+    areas = []
+    for area in Area.objects.filter(project__active=True).distinct().order_by("text").prefetch_related("activities"):
+        activities = []
+        for activity in area.activities.all():
+            activities.append((activity.id, activity.text + " (" + activity.code + ")"))
+        areas.append((area.text, tuple(activities)))
+    return tuple(areas)
+
+
+def directions_associated_as_choices():
+    axes = []
+    for axis in StrategicAxis.objects.prefetch_related("directions"):
+        directions = []
+        for direction in axis.directions.all():
+            directions.append((direction.id, direction.text))
+        axes.append((axis.text, tuple(directions)))
+
+    return tuple(axes)
+
+
+def learning_questions_as_choices():
+    learning_areas = []
+    for learning_area in LearningArea.objects.prefetch_related("strategic_question"):
+        learning_questions = []
+        for learning_question in learning_area.strategic_question.all():
+            learning_questions.append((learning_question.id, learning_question.text))
+        learning_areas.append((learning_area.text, tuple(learning_questions)))
+
+    return tuple(learning_areas)
+
+
+def operation_metrics():
+    """
+    Operation metrics, each with its activity, in the order of the operation forms of a new report.
+
+    :return: List of metrics.
+    """
+    return list(Metric.objects.filter(is_operation=True).select_related("activity").order_by("pk"))
+
+
+CHOICE_TREES = {
+    ACTIVITIES: activities_associated_as_choices,
+    DIRECTIONS: directions_associated_as_choices,
+    LEARNING_QUESTIONS: learning_questions_as_choices,
+    OPERATION_METRICS: operation_metrics,
+}
+
+
+# CACHE
+def cache_key(name):
+    return "{}:{}".format(CACHE_PREFIX, name)
+
+
+def get_choice_trees(*names):
+    """
+    Grouped choices and operation metrics of the report form, built once and then read from the cache until what
+    they list changes.
+
+    :param names: Names of the trees, in CHOICE_TREES.
+    :return: List of the trees, in the order of the names.
+    """
+    keys = [cache_key(name) for name in names]
+    cached = cache.get_many(keys)
+    missing = {key: CHOICE_TREES[name]() for name, key in zip(names, keys) if key not in cached}
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+        cached.update(missing)
+    return [cached[key] for key in keys]
+
+
+def invalidate_choice_trees(*names):
+    cache.delete_many([cache_key(name) for name in names or CHOICE_TREES])
+
+
+# SIGNALS
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(m2m_changed, sender=Area.project.through)
+def invalidate_activities(sender, **kwargs):
+    # Only the areas of active projects are listed
+    invalidate_choice_trees(ACTIVITIES)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def invalidate_activities_and_operation_metrics(sender, **kwargs):
+    # The operation forms show the activity of their metric
+    invalidate_choice_trees(ACTIVITIES, OPERATION_METRICS)
+
+
+@receiver(post_save, sender=Metric)
+@receiver(post_delete, sender=Metric)
+def invalidate_operation_metrics(sender, **kwargs):
+    invalidate_choice_trees(OPERATION_METRICS)
+
+
+@receiver(post_save, sender=StrategicAxis)
+@receiver(post_delete, sender=StrategicAxis)
+@receiver(post_save, sender=Direction)
+@receiver(post_delete, sender=Direction)
+def invalidate_directions(sender, **kwargs):
+    invalidate_choice_trees(DIRECTIONS)
+
+
+@receiver(post_save, sender=LearningArea)
+@receiver(post_delete, sender=LearningArea)
+@receiver(post_save, sender=StrategicLearningQuestion)
+@receiver(post_delete, sender=StrategicLearningQuestion)
+def invalidate_learning_questions(sender, **kwargs):
+    invalidate_choice_trees(LEARNING_QUESTIONS)
@@ -0,0 +1,16 @@
+from importlib import import_module
+from django.apps import apps
+from django.db import transaction
+
+# The migration making the names unique merges the rows the same way, so the code lives there only
+merge_migration = import_module("report.migrations.0042_merge_duplicate_names")
+
+
+def merge_duplicates():
+    """
+    Merges the editors, organizers, partners, technologies and areas activated sharing the same name.
+
+    :return: (dictionary of model name to number of rows deleted, set of the ids of the reports affected) tuple.
+    """
+    with transaction.atomic():
+        return merge_migration.merge_names(apps)
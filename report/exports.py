@@ -0,0 +1,115 @@
+import csv
+import datetime
+import functools
+import io
+from django.db.models import Q
+
+
+def export_table(key=None):
+    """
+    Turns a function returning the header and the rows of a table into an export function returning a DataFrame.
+
+    The function itself stays reachable as the "table" attribute of the export function, so the rows can be written
+    to CSV without building a DataFrame.
+
+    :param key: Indexes of the columns identifying a row, used to drop duplicates. If None, the whole row is used.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def export(report_id=None, custom_query=Q()):
+            header, rows = function(report_id, custom_query)
+            return to_dataframe(header, unique_rows(rows, key))
+
+        export.table = function
+        export.key = key
+        return export
+    return decorator
+
+
+def unique_rows(rows, key=None):
+    """
+    Drops the rows already seen, keeping the order of the first occurrences.
+
+    :param rows: Iterable of rows.
+    :param key: Indexes of the columns identifying a row. If None, the whole row is used.
+    :return: Generator of rows.
+    """
+    seen = set()
+    for row in rows:
+        identifier = tuple(row) if key is None else tuple(row[index] for index in key)
+        if identifier not in seen:
+            seen.add(identifier)
+            yield row
+
+
+def write_csv(csv_file, export, report_id=None, custom_query=Q(), sheet=None):
+    """
+    Writes a table straight from its rows to a binary file, with the same format as DataFrame.to_csv.
+
+    :param csv_file: File opened for writing bytes.
+    :param export: Export function decorated with export_table.
+    :param report_id: ID of the report to export, if any.
+    :param custom_query: Q object applied to the reports.
+    :param sheet: ExcelSheet the header and the rows are also written to, if any.
+    :return: Header of the table.
+    """
+    header, rows = export.table(report_id, custom_query)
+    text_file = io.TextIOWrapper(csv_file, encoding="utf-8", newline="")
+    writer = csv.writer(text_file, lineterminator="\n")
+    writer.writerow(header)
+    if sheet is not None:
+        sheet.write_header(header)
+
+    for row in unique_rows(rows, export.key):
+        writer.writerow(row)
+        if sheet is not None:
+            sheet.write_row(row)
+
+    text_file.flush()
+    text_file.detach()
+    return header
+
+
+def to_dataframe(header, rows):
+    # pandas is only needed for the Excel workbook, so it is not loaded with the views
+    import pandas as pd
+
+    return pd.DataFrame(list(rows), columns=header)
+
+
+class ExcelWorkbook:
+    """
+    Excel workbook written a row at a time, keeping in memory only the row being written.
+
+    The rows of each sheet must be written in order, and the cells are formatted as DataFrame.to_excel formats them.
+    """
+    def __init__(self, file):
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(file, {"constant_memory": True})
+        self.header_format = self.workbook.add_format({"bold": True, "border": 1, "align": "center",
+                                                       "valign": "top"})
+        self.formats = {datetime.datetime: self.workbook.add_format({"num_format": "YYYY-MM-DD HH:MM:SS"}),
+                        datetime.date: self.workbook.add_format({"num_format": "YYYY-MM-DD"})}
+
+    def add_sheet(self, name):
+        return ExcelSheet(self, self.workbook.add_worksheet(name))
+
+    def close(self):
+        self.workbook.close()
+
+
+class ExcelSheet:
+    def __init__(self, workbook, worksheet):
+        self.workbook = workbook
+        self.worksheet = worksheet
+        self.row = 0
+
+    def write_header(self, header):
+        self.worksheet.write_row(self.row, 0, header, self.workbook.header_format)
+        self.row += 1
+
+    def write_row(self, values):
+        for column, value in enumerate(values):
+            self.worksheet.write(self.row, column, value, self.workbook.formats.get(type(value)))
+        self.row += 1
@@ -1,18 +1,18 @@
+import functools
 from django.utils import timezone
 from django import forms
-from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as _
-from django.db.models import fields, Q
-from django.db.models.functions import Lower
+from django.core import signing
+from django.db.models import fields, Q, F
+from django.db.models.functions import Lower, Coalesce
 from .models import Report, StrategicLearningQuestion, LearningArea, AreaActivated, Funding, Partner, Technology,\
-    Editor, Organizer, OperationReport
-from metrics.models import Area, Metric, Project
-from strategy.models import StrategicAxis
-from users.models import TeamArea, UserProfile
-
-from urllib.parse import quote
-import requests
-from datetime import datetime
+    OperationReport
+from .choices import ACTIVITIES, DIRECTIONS, LEARNING_QUESTIONS, get_choice_trees
+from .persistence import save_report
+from .participants import split_lines, parse_organizers, resolve_editors, resolve_organizers
+from metrics.models import Metric, Project, Activity
+from users.models import TeamArea
+
 from django.forms import inlineformset_factory
 
 
@@ -28,9 +28,10 @@ class NewReportForm(forms.ModelForm):
         user = kwargs.pop("user", None)
         self.is_update = kwargs.pop("is_update", False)
         super(NewReportForm, self).__init__(*args, **kwargs)
-        self.fields["activity_associated"].choices = activities_associated_as_choices()
-        self.fields["directions_related"].choices = directions_associated_as_choices()
-        self.fields["learning_questions_related"].choices = learning_questions_as_choices()
+        activities, directions, learning_questions = get_choice_trees(ACTIVITIES, DIRECTIONS, LEARNING_QUESTIONS)
+        self.fields["activity_associated"].choices = activities
+        self.fields["directions_related"].choices = directions
+        self.fields["learning_questions_related"].choices = learning_questions
         self.fields["area_responsible"].queryset = TeamArea.objects.order_by(Lower("text"))
         self.fields["funding_associated"].queryset = Funding.objects.filter(project__active=True).order_by(Lower("name"))
         self.fields["area_activated"].queryset = AreaActivated.objects.order_by(Lower("text"))
@@ -42,58 +43,27 @@ class NewReportForm(forms.ModelForm):
         self.fields["technologies_used"].queryset = Technology.objects.order_by(Lower("name"))
 
     def clean_editors(self):
-        editors_string = self.data.get("editors_string", "")
-        editors_list = editors_string.split("\r\n") if editors_string else []
-        editors = []
-        for editor in editors_list:
-            editor_object, created = Editor.objects.get_or_create(username=editor)
-
-            # Store the editor account date of registration
-            if created:
-                user_creation_date = get_user_date_of_registration(editor)
-                if user_creation_date:
-                    editor_object.account_creation_date = user_creation_date
-            # Which means that the user is already on the database and is returning = retained
-            else:
-                if not self.is_update:
-                    editor_object.retained = 1
-
-            editor_object.save()
-            editors.append(editor_object)
-        return editors
+        # Editors already registered are returning, so they are retained. New editors take the registration date
+        # already known for their username, the others are looked up later by the resolve_editor_registrations
+        # command, so saving the report does not wait for MediaWiki
+        return resolve_editors(split_lines(self.data.get("editors_string", "")), retain_existing=not self.is_update)
 
     def clean_organizers(self):
-        organizers_string = self.data.get("organizers_string", "")
-        organizers_list = organizers_string.split("\r\n") if organizers_string else []
-        organizers = []
-        for organizer in organizers_list:
-            organizer_name, institution_name = (organizer + ";").split(";", maxsplit=1)
-            organizer_object, created = Organizer.objects.get_or_create(name=organizer_name.strip())
-            if not created and not self.is_update:
-                organizer_object.retained = True
-                organizer_object.save()
-            if institution_name:
-                for partner_name in institution_name.split(";"):
-                    if partner_name:
-                        partner, partner_created = Partner.objects.get_or_create(name=partner_name.strip())
-                        organizer_object.institution.add(partner)
-                organizer_object.save()
-            organizers.append(organizer_object)
+        organizers, institutions = self.resolve_organizers()
         return organizers
 
     def clean_partners_activated(self):
-        organizers_string = self.data.get("organizers_string", "")
-        organizers_list = organizers_string.split("\r\n") if organizers_string else []
-
         partners = self.data.getlist("partners_activated", []) if "partners_activated" in self.data else []
-        for organizer in organizers_list:
-            organizer_name, institution_name = (organizer + ";").split(";", maxsplit=1)
-            if institution_name:
-                for partner_name in institution_name.split(";"):
-                    if partner_name:
-                        partner, partner_created = Partner.objects.get_or_create(name=partner_name.strip())
-                        partners.append(partner.id)
-        return partners
+        organizers, institutions = self.resolve_organizers()
+        return partners + [partner.id for partner in institutions]
+
+    def resolve_organizers(self):
+        # The organizers and the partners activated both need the institutions of the organizers, so the textarea
+        # is only read once
+        if not hasattr(self, "_organizers"):
+            self._organizers = resolve_organizers(parse_organizers(self.data.get("organizers_string", "")),
+                                                  retain_existing=not self.is_update)
+        return self._organizers
 
     def clean_initial_date(self):
         initial_date = self.cleaned_data.get('initial_date')
@@ -175,23 +145,9 @@ class NewReportForm(forms.ModelForm):
         return metrics_related
 
     def save(self, commit=True, user=None, *args, **kwargs):
-        report = super(NewReportForm, self).save(commit=False)
-        if commit:
-            user_profile = get_object_or_404(UserProfile, user=user)
-            report.created_by = user_profile
-            report.modified_by = user_profile
-            report.save()
-            report.editors.clear()
-            report.organizers.clear()
-            report.editors.set(self.cleaned_data['editors'])
-            report.organizers.set(self.cleaned_data['organizers'])
-            report.partners_activated.set(self.cleaned_data['partners_activated'])
-            report.technologies_used.set(self.cleaned_data['technologies_used'])
-            report.area_activated.set(self.cleaned_data['area_activated'])
-            report.directions_related.set(self.cleaned_data['directions_related'])
-            report.learning_questions_related.set(self.cleaned_data['learning_questions_related'])
-            report.metrics_related.set(self.add_metrics_related_depending_on_values())
-        return report
+        if not commit:
+            return super(NewReportForm, self).save(commit=False)
+        return save_report(self, user=user)
 
 
 def area_responsible_of_user(user):
@@ -202,38 +158,6 @@ def area_responsible_of_user(user):
         return ""
 
 
-def activities_associated_as_choices():
-    areas = []
-    for area in Area.objects.filter(project__active=True).distinct().order_by("text"):
-        activities = []
-        for activity in area.activities.all():
-            activities.append((activity.id, activity.text + " (" + activity.code + ")"))
-        areas.append((area.text, tuple(activities)))
-    return tuple(areas)
-
-
-def directions_associated_as_choices():
-    axes = []
-    for axis in StrategicAxis.objects.all():
-        directions = []
-        for direction in axis.directions.all():
-            directions.append((direction.id, direction.text))
-        axes.append((axis.text, tuple(directions)))
-
-    return tuple(axes)
-
-
-def learning_questions_as_choices():
-    learning_areas = []
-    for learning_area in LearningArea.objects.all():
-        learning_questions = []
-        for learning_question in learning_area.strategic_question.all():
-            learning_questions.append((learning_question.id, learning_question.text))
-        learning_areas.append((learning_area.text, tuple(learning_questions)))
-
-    return tuple(learning_areas)
-
-
 def learning_areas_as_choices():
     areas = []
     for area in LearningArea.objects.all():
@@ -247,18 +171,6 @@ def learning_areas_as_choices():
     return areas
 
 
-def get_user_date_of_registration(user):
-    url = "https://www.mediawiki.org/w/api.php?action=query&meta=globaluserinfo&format=json&guiuser=" + quote(user, safe="")
-    result = requests.get(url)
-    data = result.json()
-    try:
-        date_obj = datetime.strptime(data["query"]["globaluserinfo"]["registration"], "%Y-%m-%dT%H:%M:%SZ")
-        date_str = date_obj.strftime("%Y-%m-%d %H:%M:%S")
-        return date_str
-    except:
-        return None
-
-
 class OperationForm(forms.ModelForm):
     class Meta:
         model = OperationReport
@@ -290,22 +202,39 @@ class OperationForm(forms.ModelForm):
         return number_of_new_partnerships if number_of_new_partnerships else 0
 
 
-OperationUpdateFormSet = inlineformset_factory(
-    Report,
-    OperationReport,
-    form=OperationForm,
-    fields=('metric',
-            'number_of_people_reached_through_social_media',
-            'number_of_new_followers',
-            'number_of_mentions',
-            'number_of_community_communications',
-            'number_of_events',
-            'number_of_resources',
-            'number_of_partnerships_activated',
-            'number_of_new_partnerships'), extra=0,
-    can_delete=False)
-
-class AreaActivatedForm(forms.ModelForm):
+@functools.lru_cache(maxsize=8)
+def operation_formset(extra):
+    """
+    Formset class of the operation reports of a report, built once for each number of extra forms.
+
+    :param extra: Number of empty forms, one for each operation metric on a new report.
+    :return: Formset class.
+    """
+    return inlineformset_factory(
+        Report,
+        OperationReport,
+        form=OperationForm,
+        fields=('metric',
+                'number_of_people_reached_through_social_media',
+                'number_of_new_followers',
+                'number_of_mentions',
+                'number_of_community_communications',
+                'number_of_events',
+                'number_of_resources',
+                'number_of_partnerships_activated',
+                'number_of_new_partnerships'), extra=extra,
+        can_delete=False)
+
+
+OperationUpdateFormSet = operation_formset(0)
+
+class GetOrCreateForm(forms.ModelForm):
+    # The views reuse the row already registered with the same name, so an existing name is not an error
+    def validate_unique(self):
+        pass
+
+
+class AreaActivatedForm(GetOrCreateForm):
     class Meta:
         model = AreaActivated
         fields = "__all__"
@@ -331,7 +260,7 @@ class FundingForm(forms.ModelForm):
             return 0
 
 
-class PartnerForm(forms.ModelForm):
+class PartnerForm(GetOrCreateForm):
     class Meta:
         model = Partner
         fields = "__all__"
@@ -341,11 +270,95 @@ class PartnerForm(forms.ModelForm):
         }
 
 
-class TechnologyForm(forms.ModelForm):
+class TechnologyForm(GetOrCreateForm):
     class Meta:
         model = Technology
         fields = "__all__"
         widgets = {
             "name": forms.TextInput(attrs={'required': True}),
             "value": forms.NumberInput()
-        }
\ No newline at end of file
+        }
+
+class ReportListForm(forms.Form):
+    SORTS = {
+        "created_at": F("created_at"),
+        "initial_date": F("initial_date"),
+        # Reports saved without an end date end on their initial date
+        "end_date": Coalesce("end_date", "initial_date"),
+        "description": F("description"),
+        "area": F("area_responsible__text"),
+    }
+
+    area = forms.ModelChoiceField(queryset=TeamArea.objects.all(), required=False)
+    activity = forms.ModelChoiceField(queryset=Activity.objects.all(), required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    search = forms.CharField(required=False, max_length=420)
+    sort = forms.ChoiceField(choices=[(sort, sort) for sort in SORTS], required=False)
+    order = forms.ChoiceField(choices=[("asc", "asc"), ("desc", "desc")], required=False)
+    after = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=200)
+
+    def clean_after(self):
+        after = self.cleaned_data.get("after")
+        if not after:
+            return None
+        try:
+            return signing.loads(after, salt="report.list")
+        except signing.BadSignature:
+            raise forms.ValidationError(_("Invalid page"))
+
+    def filter(self, reports):
+        """
+        Applies the filters to a queryset of reports.
+
+        :param reports: Queryset of reports.
+        :return: Queryset of the reports matching the filters.
+        """
+        data = self.cleaned_data
+        if data["area"]:
+            reports = reports.filter(area_responsible=data["area"])
+        if data["activity"]:
+            reports = reports.filter(activity_associated=data["activity"])
+        if data["start"]:
+            reports = reports.filter(Q(end_date__gte=data["start"]) | Q(end_date__isnull=True,
+                                                                        initial_date__gte=data["start"]))
+        if data["end"]:
+            reports = reports.filter(initial_date__lte=data["end"])
+        if data["search"]:
+            reports = reports.filter(description__icontains=data["search"])
+        return reports
+
+    def page(self, reports, page_size):
+        """
+        Reads one page of reports, ordered on the sort chosen and then on their ids.
+
+        The page starts right after the last report of the previous one, whose position is in the after field, so
+        reading any page costs the same as reading the first one.
+
+        :param reports: Queryset of reports.
+        :param page_size: Number of reports of a page when no limit is given.
+        :return: (list of reports, cursor of the next page or None) tuple.
+        """
+        data = self.cleaned_data
+        sort = data["sort"] or "created_at"
+        descending = data["order"] != "asc"
+        limit = data["limit"] or page_size
+
+        reports = reports.annotate(sort_key=self.SORTS[sort])
+        if data["after"]:
+            value, pk = data["after"]
+            if descending:
+                reports = reports.filter(Q(sort_key__lt=value) | Q(sort_key=value, pk__lt=pk))
+            else:
+                reports = reports.filter(Q(sort_key__gt=value) | Q(sort_key=value, pk__gt=pk))
+        ordering = ["-sort_key", "-pk"] if descending else ["sort_key", "pk"]
+        reports = list(reports.order_by(*ordering)[:limit + 1])
+
+        if len(reports) <= limit:
+            return reports, None
+        last = reports[limit - 1]
+        value = last.sort_key
+        if hasattr(value, "isoformat"):
+            value = value.isoformat()
+        return reports[:limit], signing.dumps([value, last.pk], salt="report.list")
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone, translation
+from django.utils.text import get_valid_filename
+
+from report.models import ExportJob
+
+DEFAULT_TIMEOUT = 60 * 60
+DEFAULT_RETENTION = 60 * 60 * 24 * 7
+
+
+# RUNNERS
+# The builders live in the views, which import this module, so they are imported when a job runs
+def run_report_export(parameters, progress):
+    from report.views import build_report_export
+
+    file_name, content = build_report_export(parameters.get("report_id"), parameters.get("year"),
+                                             parameters.get("format") != "csv", progress)
+    return file_name, "application/x-zip-compressed", content
+
+
+def run_trimester_report(parameters, progress, per_area=False):
+    from metrics.views import build_trimester_report
+
+    content = build_trimester_report(per_area, progress)
+    return "trimester_report.txt", "text/plain; charset=UTF-8", [content.encode("utf-8")]
+
+
+def run_trimester_report_per_area(parameters, progress):
+    return run_trimester_report(parameters, progress, per_area=True)
+
+
+def run_wmf_report(parameters, progress):
+    from metrics.views import get_wmf_report_file
+
+    path, failed_response = get_wmf_report_file()
+    if failed_response:
+        raise ValueError(failed_response.content.decode("utf-8"))
+    with open(path, "rb") as pdf_file:
+        return "wmf_report.pdf", "application/pdf", [pdf_file.read()]
+
+
+def run_bugs_export(parameters, progress):
+    from bug.views import build_bugs_export
+
+    file_name, content = build_bugs_export()
+    return file_name, "application/x-zip-compressed", [content]
+
+
+# Permission needed to ask for each kind of export and the function building its file
+EXPORT_JOBS = {
+    ExportJob.Kind.REPORT: ("report.view_report", run_report_export),
+    ExportJob.Kind.TRIMESTER: ("metrics.view_metric", run_trimester_report),
+    ExportJob.Kind.TRIMESTER_PER_AREA: ("metrics.view_metric", run_trimester_report_per_area),
+    ExportJob.Kind.WMF_REPORT: ("metrics.view_metric", run_wmf_report),
+    ExportJob.Kind.BUGS: ("bug.view_bug", run_bugs_export),
+}
+
+
+# QUEUE
+def job_key(kind, parameters):
+    return hashlib.sha256(json.dumps([kind, parameters], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def fail_stale_jobs(jobs):
+    """
+    Marks as failed the jobs running for longer than EXPORT_JOB_TIMEOUT seconds, whose worker most likely stopped, so
+    identical requests queue a new job instead of waiting for them.
+
+    :param jobs: Queryset of ExportJob.
+    :return: Number of jobs marked as failed.
+    """
+    timeout = getattr(settings, "EXPORT_JOB_TIMEOUT", DEFAULT_TIMEOUT)
+    return jobs.filter(status=ExportJob.Status.RUNNING,
+                       started_at__lt=timezone.now() - timedelta(seconds=timeout)).update(
+        status=ExportJob.Status.FAILED, active_key=None, finished_at=timezone.now(),
+        error="The job did not finish in {} seconds".format(timeout))
+
+
+def enqueue_export(kind, parameters, requested_by=None):
+    """
+    Queues an export, or returns the job of an identical export still queued or running.
+
+    The job found is locked while it is checked, so it cannot be reused and marked as failed at the same time. Two
+    identical jobs cannot be active at once, as they would share their active_key.
+
+    :param kind: Kind of the export, one of ExportJob.Kind.
+    :param parameters: Dictionary of JSON values the export depends on, such as the report and the language.
+    :param requested_by: UserProfile asking for the export, if any.
+    :return: (job, created) tuple.
+    """
+    key = job_key(kind, parameters)
+    with transaction.atomic():
+        job = ExportJob.objects.select_for_update().filter(active_key=key).first()
+        if job and not fail_stale_jobs(ExportJob.objects.filter(pk=job.pk)):
+            return job, False
+
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(kind=kind, parameters=parameters, key=key, active_key=key,
+                                            requested_by=requested_by), True
+    except IntegrityError:
+        # The same export was queued by another request in the meantime, unless it already finished
+        job = ExportJob.objects.filter(active_key=key).first()
+        if job:
+            return job, False
+
+    with transaction.atomic():
+        return ExportJob.objects.create(kind=kind, parameters=parameters, key=key, active_key=key,
+                                        requested_by=requested_by), True
+
+
+def claim_next_job():
+    """
+    Marks the oldest queued job as running and returns it, after failing the stale ones.
+
+    The job is only taken if it is still queued when it is updated, so many workers can share the queue.
+
+    :return: ExportJob or None if the queue is empty.
+    """
+    fail_stale_jobs(ExportJob.objects.all())
+    while True:
+        job = ExportJob.objects.filter(status=ExportJob.Status.QUEUED).order_by("created_at", "pk").first()
+        if job is None:
+            return None
+        if ExportJob.objects.filter(pk=job.pk, status=ExportJob.Status.QUEUED).update(
+                status=ExportJob.Status.RUNNING, started_at=timezone.now()):
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job):
+    """
+    Builds the file of a running job in EXPORT_ROOT and records whether it succeeded.
+
+    :param job: ExportJob claimed by the worker.
+    :return: The job, done or failed.
+    """
+    def progress(done, total):
+        # 100 is only reached once the file is complete
+        ExportJob.objects.filter(pk=job.pk).update(progress=min(99, 100 * done // total))
+
+    try:
+        with translation.override(job.parameters.get("language")):
+            file_name, content_type, content = EXPORT_JOBS[job.kind][1](job.parameters, progress)
+            file_path = os.path.join(str(job.pk), get_valid_filename(file_name))
+            absolute_path = os.path.join(settings.EXPORT_ROOT, file_path)
+            os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+            with open(absolute_path, "wb") as export_file:
+                for chunk in content:
+                    export_file.write(chunk)
+    except Exception:
+        job.status = ExportJob.Status.FAILED
+        job.error = traceback.format_exc()
+        fields = ["status", "error", "finished_at"]
+    else:
+        job.status = ExportJob.Status.DONE
+        job.progress = 100
+        job.file_name = file_name
+        job.file_path = file_path
+        job.content_type = content_type
+        fields = ["status", "progress", "file_name", "file_path", "content_type", "finished_at"]
+
+    job.active_key = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=fields + ["active_key"])
+    return job
+
+
+def export_file_path(job):
+    return os.path.join(settings.EXPORT_ROOT, job.file_path)
+
+
+def remove_old_jobs():
+    """
+    Deletes the jobs finished more than EXPORT_RETENTION seconds ago, along with their files in EXPORT_ROOT.
+
+    :return: Number of jobs deleted.
+    """
+    retention = getattr(settings, "EXPORT_RETENTION", DEFAULT_RETENTION)
+    jobs = ExportJob.objects.filter(status__in=[ExportJob.Status.DONE, ExportJob.Status.FAILED],
+                                    finished_at__lt=timezone.now() - timedelta(seconds=retention))
+    job_ids = list(jobs.values_list("pk", flat=True))
+    for job_id in job_ids:
+        shutil.rmtree(os.path.join(settings.EXPORT_ROOT, str(job_id)), ignore_errors=True)
+    return ExportJob.objects.filter(pk__in=job_ids).delete()[0]
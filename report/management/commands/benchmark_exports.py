@@ -0,0 +1,86 @@
+import datetime
+import time
+import tracemalloc
+from io import BytesIO
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from metrics.models import Activity, Metric
+from report.exports import write_csv, unique_rows, ExcelWorkbook
+from report.models import Report, OperationReport, Editor
+from report.views import export_report_instance, export_operation_report, export_editors
+from users.models import TeamArea, UserProfile
+
+TABLES = {
+    "Report": export_report_instance,
+    "Operation report": export_operation_report,
+    "Editors": export_editors,
+}
+
+
+class Command(BaseCommand):
+    help = ("Measures the rows per second and the peak memory of the exports written as CSV alone and as CSV with "
+            "the Excel workbook, as the export views write them, on reports created for the benchmark and rolled "
+            "back at the end")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reports", type=int, default=50000, help="Number of reports of the fixture")
+        parser.add_argument("--table", action="append", choices=list(TABLES), help="Tables to export")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_fixture(options["reports"])
+            for name in options["table"] or ["Report", "Operation report"]:
+                export = TABLES[name]
+                header, rows = export.table(None, Q())
+                number_of_rows = sum(1 for row in unique_rows(rows, export.key))
+                self.measure(name, "csv", number_of_rows, lambda: write_csv(BytesIO(), export))
+                self.measure(name, "csv and xlsx", number_of_rows, lambda: self.export_with_excel(export))
+            transaction.set_rollback(True)
+
+    def create_fixture(self, number_of_reports):
+        user = User.objects.create_user(username="benchmark_exports")
+        user_profile = UserProfile.objects.get(user=user)
+        area = TeamArea.objects.create(text="Benchmark area")
+        activity = Activity.objects.create(text="Benchmark activity")
+        metric = Metric.objects.create(text="Benchmark metric", activity=activity)
+        editors = Editor.objects.bulk_create([Editor(username="Benchmark editor {}".format(index))
+                                              for index in range(100)])
+
+        today = datetime.date.today()
+        reports = Report.objects.bulk_create([
+            Report(created_by=user_profile, modified_by=user_profile, activity_associated=activity,
+                   area_responsible=area, initial_date=today, end_date=today,
+                   description="Benchmark report {}".format(index),
+                   links="https://pt.wikipedia.org/wiki/Página_{}\r\nhttps://example.com".format(index),
+                   learning="Learning " * 60, participants=index % 50, wikipedia_created=index % 7)
+            for index in range(number_of_reports)], batch_size=1000)
+        OperationReport.objects.bulk_create([OperationReport(report=report, metric=metric, number_of_events=1)
+                                             for report in reports], batch_size=1000)
+        Report.editors.through.objects.bulk_create([
+            Report.editors.through(report_id=report.id, editor_id=editors[index % len(editors)].id)
+            for index, report in enumerate(reports)], batch_size=1000)
+        self.stdout.write("{} reports created".format(number_of_reports))
+
+    @staticmethod
+    def export_with_excel(export):
+        workbook = ExcelWorkbook(BytesIO())
+        header = write_csv(BytesIO(), export, sheet=workbook.add_sheet("Benchmark"))
+        workbook.close()
+        return header
+
+    def measure(self, name, backend, number_of_rows, function):
+        # Time and memory are measured in separate runs, since tracing the allocations slows the export down
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        function()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write("{} ({}): {} rows in {:.2f}s, {:,.0f} rows/s, peak memory {:.1f} MB".format(
+            name, backend, number_of_rows, elapsed, number_of_rows / elapsed, peak / 2 ** 20))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from metrics.rollups import defer_rollup_updates, mark_reports
+from report.duplicates import merge_duplicates
+
+
+class Command(BaseCommand):
+    help = ("Merges the editors, organizers, partners, technologies and areas activated sharing the same name into "
+            "the oldest of them and refreshes the rollups of their reports. Run it before migrating to the unique "
+            "names")
+
+    def handle(self, *args, **options):
+        with defer_rollup_updates():
+            merged, report_ids = merge_duplicates()
+            mark_reports(report_ids)
+
+        for model_name, total in merged.items():
+            self.stdout.write("{}: {} duplicates merged".format(model_name, total))
+        self.stdout.write(self.style.SUCCESS("{} reports affected".format(len(report_ids))))
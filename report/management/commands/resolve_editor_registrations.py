@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+
+from report.registrations import LOOKUP_BATCH_SIZE, LOOKUP_TIMEOUT, LOOKUP_WORKERS, resolve_editor_registrations
+
+
+class Command(BaseCommand):
+    help = ("Fills in the account creation date of the editors without one, asking MediaWiki for the usernames not "
+            "in the cache yet, and keeps waiting for new editors unless --once is given")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Stop after asking for every pending username once")
+        parser.add_argument("--interval", type=float, default=60, help="Seconds between two passes")
+        parser.add_argument("--workers", type=int, default=LOOKUP_WORKERS, help="Simultaneous calls to the API")
+        parser.add_argument("--timeout", type=float, default=LOOKUP_TIMEOUT, help="Seconds to wait for each call")
+        parser.add_argument("--batch-size", type=int, default=LOOKUP_BATCH_SIZE,
+                            help="Usernames asked before their answers are saved")
+
+    def handle(self, *args, **options):
+        while True:
+            updated, asked = resolve_editor_registrations(options["workers"], options["timeout"],
+                                                          options["batch_size"])
+            if updated or asked:
+                self.stdout.write("{} usernames asked, {} editors updated".format(asked, updated))
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
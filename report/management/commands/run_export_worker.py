@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+
+from report.jobs import claim_next_job, remove_old_jobs, run_job
+from report.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = ("Builds the queued export jobs, waiting for new ones unless --once is given. Whenever the queue is empty, "
+            "the jobs finished more than EXPORT_RETENTION seconds ago are deleted with their files")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Stop when the queue is empty")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds between two checks of an empty queue")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                removed = remove_old_jobs()
+                if removed:
+                    self.stdout.write("{} old export jobs removed".format(removed))
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+                continue
+
+            self.stdout.write("Running export job {} ({})".format(job.pk, job.kind))
+            job = run_job(job)
+            if job.status == ExportJob.Status.DONE:
+                self.stdout.write(self.style.SUCCESS("Export job {} done: {}".format(job.pk, job.file_name)))
+            else:
+                self.stderr.write("Export job {} failed\n{}".format(job.pk, job.error))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0040_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EditorRegistration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=420, unique=True)),
+                ('registration', models.DateTimeField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Editor registration',
+                'verbose_name_plural': 'Editor registrations',
+            },
+        ),
+    ]
@@ -0,0 +1,115 @@
+from django.db import migrations
+from django.db.models import Count
+
+# Rows the reports get or create by name, which become unique in the next migration. The merge_duplicates command
+# runs this same code with the current models, so it only relies on what both have.
+UNIQUE_NAMES = [
+    ("Editor", "username"),
+    ("Organizer", "name"),
+    ("Partner", "name"),
+    ("Technology", "name"),
+    ("AreaActivated", "text"),
+]
+
+
+def move_links(through, source, target, keep, duplicate_ids):
+    """
+    Moves the rows of a many-to-many table from the duplicates to the row kept, without repeating a link.
+
+    :param through: Model of the many-to-many table.
+    :param source: Name of the column pointing to the merged model.
+    :param target: Name of the column pointing to the other side of the relation.
+    :param keep: Primary key of the row kept.
+    :param duplicate_ids: Primary keys of the duplicates.
+    :return: Set of the ids of the other side whose links changed.
+    """
+    source, target = source + "_id", target + "_id"
+    linked = set(through.objects.filter(**{source: keep}).values_list(target, flat=True))
+    moved = set(through.objects.filter(**{source + "__in": duplicate_ids}).values_list(target, flat=True))
+    through.objects.filter(**{source + "__in": duplicate_ids}).delete()
+    through.objects.bulk_create([through(**{source: keep, target: other}) for other in moved - linked])
+    return moved
+
+
+def merge_rows(model, keep, duplicates):
+    """
+    Merges duplicated rows into the oldest one, moving every relation to it.
+
+    Empty fields of the row kept take the first value filled in a duplicate, so a person retained in any of the rows
+    stays retained.
+
+    :param model: Model class.
+    :param keep: Row kept.
+    :param duplicates: Rows deleted.
+    :return: Set of the ids of the reports linked to the merged rows.
+    """
+    duplicate_ids = [duplicate.pk for duplicate in duplicates]
+    report_ids = set()
+
+    changed = []
+    for field in model._meta.concrete_fields:
+        if field.primary_key or getattr(keep, field.attname):
+            continue
+        value = next((getattr(row, field.attname) for row in duplicates if getattr(row, field.attname)), None)
+        if value:
+            setattr(keep, field.attname, value)
+            changed.append(field.attname)
+    if changed:
+        keep.save(update_fields=changed)
+
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            field = relation.field
+            moved = move_links(relation.through, field.m2m_reverse_field_name(), field.m2m_field_name(), keep.pk,
+                               duplicate_ids)
+            if relation.related_model._meta.label == "report.Report":
+                report_ids.update(moved)
+        else:
+            relation.related_model.objects.filter(**{relation.field.name + "__in": duplicate_ids}).update(
+                **{relation.field.name: keep.pk})
+
+    for field in model._meta.many_to_many:
+        move_links(field.remote_field.through, field.m2m_field_name(), field.m2m_reverse_field_name(), keep.pk,
+                   duplicate_ids)
+
+    model.objects.filter(pk__in=duplicate_ids).delete()
+    return report_ids
+
+
+def merge_names(apps):
+    """
+    Merges the editors, organizers, partners, technologies and areas activated sharing the same name.
+
+    :param apps: Registry of the models, historical or current.
+    :return: (dictionary of model name to number of rows deleted, set of the ids of the reports affected) tuple.
+    """
+    merged = {}
+    report_ids = set()
+    for model_name, field in UNIQUE_NAMES:
+        model = apps.get_model("report", model_name)
+        names = model.objects.values(field).annotate(rows=Count("pk")).filter(rows__gt=1).values_list(field, flat=True)
+        merged[model_name] = 0
+        for name in list(names):
+            keep, *duplicates = model.objects.filter(**{field: name}).order_by("pk")
+            report_ids.update(merge_rows(model, keep, duplicates))
+            merged[model_name] += len(duplicates)
+    return merged, report_ids
+
+
+def merge_duplicate_names(apps, schema_editor):
+    merged, report_ids = merge_names(apps)
+    if report_ids:
+        # Dropped rollups are built again from the reports once the database is migrated
+        apps.get_model("metrics", "MetricRollup").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0017_metricrollup'),
+        ('report', '0041_editorregistration'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
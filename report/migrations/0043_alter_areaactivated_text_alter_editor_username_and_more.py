@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0018_project_project_current_poa_idx_and_more'),
+        ('report', '0042_merge_duplicate_names'),
+        ('strategy', '0002_strategicaxis_intentionality'),
+        ('users', '0012_alter_userprofile_position'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='areaactivated',
+            name='text',
+            field=models.CharField(max_length=420, unique=True, verbose_name='Name of the area activated'),
+        ),
+        migrations.AlterField(
+            model_name='editor',
+            name='username',
+            field=models.CharField(max_length=420, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='organizer',
+            name='name',
+            field=models.CharField(max_length=420, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='partner',
+            name='name',
+            field=models.CharField(max_length=420, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='technology',
+            name='name',
+            field=models.CharField(max_length=420, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['initial_date'], name='report_initial_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['end_date', 'area_responsible'], name='report_end_date_area_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['created_at'], name='report_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['created_by', 'created_at'], name='report_created_by_at_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:35
+
+from django.db import migrations, models
+
+
+def set_active_keys(apps, schema_editor):
+    # Only the oldest of the identical jobs still active takes the new requests
+    ExportJob = apps.get_model("report", "ExportJob")
+    active_keys = set()
+    for job in ExportJob.objects.filter(status__in=["queued", "running"]).order_by("pk"):
+        if job.key not in active_keys:
+            active_keys.add(job.key)
+            ExportJob.objects.filter(pk=job.pk).update(active_key=job.key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0043_alter_areaactivated_text_alter_editor_username_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='exportjob',
+            name='unique_active_export_job',
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='active_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(set_active_keys, migrations.RunPython.noop),
+    ]
@@ -24,7 +24,7 @@ class Funding(models.Model):
 
 
 class Editor(models.Model):
-    username = models.CharField(max_length=420)
+    username = models.CharField(max_length=420, unique=True)
     retained = models.BooleanField(default=False)
     account_creation_date = models.DateTimeField(null=True, blank=True)
 
@@ -36,8 +36,22 @@ class Editor(models.Model):
         return self.username
 
 
+class EditorRegistration(models.Model):
+    # Registration dates already asked to MediaWiki, so each username is only looked up once
+    username = models.CharField(max_length=420, unique=True)
+    registration = models.DateTimeField(null=True, blank=True)
+    checked_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Editor registration")
+        verbose_name_plural = _("Editor registrations")
+
+    def __str__(self):
+        return self.username
+
+
 class Partner(models.Model):
-    name = models.CharField(max_length=420)
+    name = models.CharField(max_length=420, unique=True)
     website = models.URLField(null=True, blank=True)
 
     class Meta:
@@ -49,7 +63,7 @@ class Partner(models.Model):
 
 
 class Organizer(models.Model):
-    name = models.CharField(max_length=420)
+    name = models.CharField(max_length=420, unique=True)
     retained = models.BooleanField(default=False)
     institution = models.ManyToManyField(Partner, related_name="organizer_institution")
 
@@ -62,7 +76,7 @@ class Organizer(models.Model):
 
 
 class Technology(models.Model):
-    name = models.CharField(max_length=420)
+    name = models.CharField(max_length=420, unique=True)
 
     class Meta:
         verbose_name = _("Technology")
@@ -73,7 +87,7 @@ class Technology(models.Model):
 
 
 class AreaActivated (models.Model):
-    text = models.TextField(_("Name of the area activated"), max_length=420)
+    text = models.CharField(_("Name of the area activated"), max_length=420, unique=True)
     contact = models.TextField(max_length=420, null=True, blank=True)
 
     class Meta:
@@ -92,7 +106,7 @@ class AreaActivated (models.Model):
 def save_team_area_as_area_activated(sender, instance, created, **kwargs):
     if created:
         contact = ""
-        AreaActivated.objects.create(text=instance.text, contact=contact)
+        AreaActivated.objects.get_or_create(text=instance.text, defaults={"contact": contact})
 
 
 class LearningArea(models.Model):
@@ -221,6 +235,13 @@ class Report(models.Model):
     class Meta:
         verbose_name = _("Report")
         verbose_name_plural = _("Reports")
+        indexes = [
+            # Reports are listed and exported by year and the metrics sum them by end date, often per area
+            models.Index(fields=["initial_date"], name="report_initial_date_idx"),
+            models.Index(fields=["end_date", "area_responsible"], name="report_end_date_area_idx"),
+            models.Index(fields=["created_at"], name="report_created_at_idx"),
+            models.Index(fields=["created_by", "created_at"], name="report_created_by_at_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         super(Report, self).save(*args, **kwargs)
@@ -248,4 +269,45 @@ class OperationReport(models.Model):
     number_of_new_partnerships = models.IntegerField(blank=True, default=0)
 
     def __str__(self):
-        return self.report.description + " - " + self.metric.text
\ No newline at end of file
+        return self.report.description + " - " + self.metric.text
+
+class ExportJob(models.Model):
+    class Kind(models.TextChoices):
+        REPORT = "report", _("Reports")
+        TRIMESTER = "trimester", _("Trimester report")
+        TRIMESTER_PER_AREA = "trimester_per_area", _("Trimester report per area")
+        WMF_REPORT = "wmf_report", _("WMF report")
+        BUGS = "bugs", _("Bugs")
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", _("Queued")
+        RUNNING = "running", _("Running")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    ACTIVE = [Status.QUEUED, Status.RUNNING]
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    parameters = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=64)
+    # The key while the job is queued or running, so identical requests share it. Finished jobs have none, and a
+    # plain unique index is enforced by every database, unlike a conditional one
+    active_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    requested_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name="export_jobs")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    file_name = models.CharField(max_length=255, blank=True)
+    file_path = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = _("Export job")
+        verbose_name_plural = _("Export jobs")
+
+    def __str__(self):
+        return "{} - {}".format(self.kind, self.status)
@@ -0,0 +1,144 @@
+from metrics.rollups import mark_reports
+from report.models import Editor, EditorRegistration, Organizer, Partner, Report
+
+
+def split_lines(text):
+    return text.split("\r\n") if text else []
+
+
+def parse_organizers(organizers_string):
+    """
+    Reads the organizers textarea, where each line has the name of an organizer followed by the names of its
+    institutions, separated by semicolons.
+
+    :param organizers_string: Content of the textarea.
+    :return: List of (organizer name, list of institution names) tuples, in the order of the lines.
+    """
+    organizers = []
+    for line in split_lines(organizers_string):
+        name, institutions = (line + ";").split(";", maxsplit=1)
+        organizers.append((name.strip(), [partner.strip() for partner in institutions.split(";") if partner]))
+    return organizers
+
+
+def rows_by_value(model, field, values):
+    """
+    Rows of a model whose field has one of the values, the oldest one when many rows share a value.
+
+    :param model: Model class.
+    :param field: Name of the field holding the values.
+    :param values: List of values.
+    :return: (dictionary of value to object, dictionary of casefolded value to object) tuple.
+    """
+    exact, folded = {}, {}
+    for obj in model.objects.filter(**{field + "__in": values}).order_by("-pk"):
+        exact[getattr(obj, field)] = obj
+        folded[getattr(obj, field).casefold()] = obj
+    return exact, folded
+
+
+def bulk_get_or_create(model, field, values, create=None):
+    """
+    Finds the rows of a model by the value of one of its fields, creating the missing ones with a single insert.
+
+    The values are stripped. When many rows share a value, the oldest one is used. A database comparing the values
+    regardless of case or trailing spaces, as MySQL does, matches a row spelled some other way instead of inserting a
+    new one, so the rows are then matched regardless of case, and at last asked one by one to the database.
+
+    :param model: Model class.
+    :param field: Name of the field holding the values.
+    :param values: Iterable of values.
+    :param create: Function receiving the list of missing values and returning the unsaved objects to insert. By
+                   default, the objects only have the field set.
+    :return: (dictionary of value to object, in the order of the values, set of the values created) tuple.
+    """
+    create = create or (lambda missing: [model(**{field: value}) for value in missing])
+    values = list(dict.fromkeys(value.strip() for value in values))
+    if not values:
+        return {}, set()
+
+    exact, folded = rows_by_value(model, field, values)
+    missing = [value for value in values if value not in exact and value.casefold() not in folded]
+    if missing:
+        model.objects.bulk_create(create(missing), ignore_conflicts=True)
+        # The primary keys are not set on the inserted objects when conflicts are ignored, so they are read back
+        missing_exact, missing_folded = rows_by_value(model, field, missing)
+        exact.update(missing_exact)
+        folded.update(missing_folded)
+
+    objects = {}
+    for value in values:
+        obj = exact.get(value) or folded.get(value.casefold())
+        if obj is None:
+            # Matched by the collation of the database in some other way, such as without accents
+            obj = model.objects.filter(**{field: value}).order_by("pk").first()
+        if obj is None:
+            obj = create([value])[0]
+            obj.save()
+        objects[value] = obj
+    return objects, {value for value in missing if getattr(objects[value], field) == value}
+
+
+def retain(model, objects, related_name):
+    """
+    Marks as retained the people already registered who come back in a new report, with a single update.
+
+    :param model: Editor or Organizer.
+    :param objects: List of the people already registered.
+    :param related_name: Name of the relation from the reports to the people.
+    :return: None
+    """
+    returning = [obj.pk for obj in objects if not obj.retained]
+    if returning:
+        model.objects.filter(pk__in=returning).update(retained=True)
+        for obj in objects:
+            obj.retained = True
+        # The update sends no signal, so the reports counting the retained people are marked here
+        mark_reports(Report.objects.filter(**{related_name + "__in": returning}).values_list("pk", flat=True))
+
+
+def resolve_editors(usernames, retain_existing=False):
+    """
+    Editors with the given usernames, created in bulk when they are not registered yet.
+
+    New editors take the registration date already cached for their username.
+
+    :param usernames: Iterable of usernames.
+    :param retain_existing: Whether the editors already registered are marked as retained.
+    :return: List of editors in the order of the usernames, without duplicates.
+    """
+    def create(missing):
+        registrations = dict(EditorRegistration.objects.filter(username__in=missing).values_list(
+            "username", "registration"))
+        return [Editor(username=username, account_creation_date=registrations.get(username)) for username in missing]
+
+    editors, created = bulk_get_or_create(Editor, "username", usernames, create)
+    if retain_existing:
+        retain(Editor, [editor for username, editor in editors.items() if username not in created], "editors")
+    return list(editors.values())
+
+
+def resolve_partners(names):
+    partners, created = bulk_get_or_create(Partner, "name", names)
+    return partners
+
+
+def resolve_organizers(organizers, retain_existing=False):
+    """
+    Organizers and the partners of their institutions, created in bulk when they are not registered yet.
+
+    :param organizers: List of (organizer name, list of institution names) tuples, as returned by parse_organizers.
+    :param retain_existing: Whether the organizers already registered are marked as retained.
+    :return: (list of organizers, list of partners) tuple, both in the order of the textarea and without duplicates.
+    """
+    found, created = bulk_get_or_create(Organizer, "name", [name for name, institutions in organizers])
+    partners = resolve_partners(partner for name, institutions in organizers for partner in institutions)
+
+    Institution = Organizer.institution.through
+    links = dict.fromkeys((found[name].pk, partners[partner].pk)
+                          for name, institutions in organizers for partner in institutions)
+    Institution.objects.bulk_create([Institution(organizer_id=organizer_id, partner_id=partner_id)
+                                     for organizer_id, partner_id in links], ignore_conflicts=True)
+    if retain_existing:
+        retain(Organizer, [organizer for name, organizer in found.items() if name not in created], "organizers")
+    return list(found.values()), list(partners.values())
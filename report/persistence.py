@@ -0,0 +1,119 @@
+import datetime
+from django.db import transaction
+
+from metrics.rollups import mark_reports
+from report.models import Report, OperationReport
+from users.models import UserProfile
+
+OPERATION_FIELDS = ["number_of_people_reached_through_social_media", "number_of_new_followers", "number_of_mentions",
+                    "number_of_community_communications", "number_of_events", "number_of_resources",
+                    "number_of_partnerships_activated", "number_of_new_partnerships"]
+RELATIONS = ["editors", "organizers", "partners_activated", "technologies_used", "area_activated",
+             "funding_associated", "directions_related", "learning_questions_related", "metrics_related"]
+
+
+def operation_metric_ids(operations):
+    """
+    Metrics of the operation reports with some value, which the report is then related to.
+
+    :param operations: Iterable of OperationReport instances, saved or not.
+    :return: Set of metric ids.
+    """
+    return {operation.metric_id for operation in operations
+            if operation.metric_id and sum(getattr(operation, field) or 0 for field in OPERATION_FIELDS) > 0}
+
+
+def save_operations(report, operation_formset):
+    """
+    Writes the operation reports of a formset, creating the new ones and updating the changed ones in bulk.
+
+    :param report: Saved report.
+    :param operation_formset: Valid formset of OperationReport, or None.
+    :return: List of the operation reports created or changed.
+    """
+    if operation_formset is None:
+        return []
+
+    changed = operation_formset.save(commit=False)
+    for operation in changed:
+        operation.report = report
+    OperationReport.objects.bulk_create([operation for operation in changed if operation.pk is None])
+    OperationReport.objects.bulk_update([operation for operation in changed if operation.pk is not None],
+                                        ["metric"] + OPERATION_FIELDS)
+    return changed
+
+
+def set_relations(report, values, created):
+    """
+    Sets the many-to-many relations of a report, writing to each table only the links that changed.
+
+    No m2m_changed signal is sent, so the caller refreshes the rollups of the report.
+
+    :param report: Saved report.
+    :param values: Dictionary of relation name to the iterable of related objects or ids.
+    :param created: Whether the report is new, so it has no link to read first.
+    :return: Set of the ids of the metrics the report is no longer related to.
+    """
+    removed_metric_ids = set()
+    for name, related in values.items():
+        field = Report._meta.get_field(name)
+        through = field.remote_field.through
+        source, target = field.m2m_field_name() + "_id", field.m2m_reverse_field_name() + "_id"
+        wanted = {getattr(item, "pk", item) for item in related}
+        current = set() if created else set(through.objects.filter(**{source: report.pk}).values_list(target,
+                                                                                                     flat=True))
+        if current - wanted:
+            through.objects.filter(**{source: report.pk, target + "__in": current - wanted}).delete()
+        if wanted - current:
+            through.objects.bulk_create([through(**{source: report.pk, target: pk}) for pk in wanted - current])
+        if name == "metrics_related":
+            removed_metric_ids = current - wanted
+    return removed_metric_ids
+
+
+@transaction.atomic
+def save_report(report_form, operation_formset=None, user=None):
+    """
+    Saves a valid report form with its operation reports and relations in a single transaction.
+
+    The report is related to the metrics chosen in the form and to the operation metrics given some value in the
+    operation reports created or changed, so an unchanged operation report does not bring back its metric. A new
+    report also gets the metrics of the main funding matching the numbers it filled in. The rollups of the report
+    are refreshed once at the end.
+
+    :param report_form: Valid NewReportForm.
+    :param operation_formset: Valid formset of the operation reports of the report, or None.
+    :param user: User saving the report.
+    :return: Saved report.
+    """
+    report = report_form.save(commit=False)
+    created = report.pk is None
+    user_profile = UserProfile.objects.get(user=user)
+    if created:
+        report.created_by = user_profile
+    else:
+        report.modified_at = datetime.datetime.now()
+    report.modified_by = user_profile
+    report.save()
+
+    operations = save_operations(report, operation_formset)
+    cleaned_data = report_form.cleaned_data
+    if report_form.is_update:
+        metrics_related = set(map(int, report_form.data.getlist("metrics_related", [])))
+    else:
+        metrics_related = {metric.pk for metric in report_form.add_metrics_related_depending_on_values()}
+
+    removed_metric_ids = set_relations(report, {
+        "editors": cleaned_data["editors"],
+        "organizers": cleaned_data["organizers"],
+        "partners_activated": cleaned_data["partners_activated"],
+        "technologies_used": cleaned_data["technologies_used"],
+        "area_activated": cleaned_data["area_activated"],
+        "funding_associated": cleaned_data["funding_associated"],
+        "directions_related": cleaned_data["directions_related"],
+        "learning_questions_related": cleaned_data["learning_questions_related"],
+        "metrics_related": metrics_related | operation_metric_ids(operations),
+    }, created)
+
+    mark_reports([report.pk], removed_metric_ids | {operation.metric_id for operation in operations})
+    return report
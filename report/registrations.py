@@ -0,0 +1,124 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+
+from metrics.rollups import defer_rollup_updates, mark_reports
+from report.models import Editor, EditorRegistration, Report
+
+LOOKUP_WORKERS = 8
+LOOKUP_TIMEOUT = 10
+LOOKUP_BATCH_SIZE = 200
+# Seconds before an account MediaWiki did not find is asked again, as it may not have been global yet
+MISSING_TTL = 60 * 60
+
+
+def fetch_registration(session, username, timeout=LOOKUP_TIMEOUT):
+    """
+    Asks MediaWiki for the global registration date of an account.
+
+    :param session: requests.Session used for the call.
+    :param username: Username of the account.
+    :param timeout: Seconds to wait for the API.
+    :return: Naive datetime, or None if there is no such account.
+    :raises requests.RequestException: If the API could not be reached.
+    :raises ValueError: If the API did not answer the query.
+    """
+    response = session.get(settings.MEDIAWIKI_API_URL, timeout=timeout, params={
+        "action": "query", "meta": "globaluserinfo", "format": "json", "guiuser": username})
+    response.raise_for_status()
+    data = response.json()
+    if "query" not in data:
+        raise ValueError(data.get("error", data))
+
+    info = data["query"].get("globaluserinfo", {})
+    if "registration" not in info:
+        return None
+    return datetime.datetime.strptime(info["registration"], "%Y-%m-%dT%H:%M:%SZ")
+
+
+def lookup_registrations(usernames, workers=LOOKUP_WORKERS, timeout=LOOKUP_TIMEOUT):
+    """
+    Looks up the registration dates of many accounts and stores the answers in the cache table.
+
+    globaluserinfo only takes one user per call, so the calls are spread over a bounded pool of threads sharing
+    one HTTP session. Usernames whose lookup failed are left out, to be asked again later.
+
+    :param usernames: Iterable of usernames.
+    :param workers: Maximum number of simultaneous calls.
+    :param timeout: Seconds to wait for each call.
+    :return: Dictionary of username to registration date, or None if there is no such account.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        futures = {username: executor.submit(fetch_registration, session, username, timeout)
+                   for username in usernames}
+
+    registrations = {}
+    for username, future in futures.items():
+        try:
+            registrations[username] = future.result()
+        except (requests.RequestException, ValueError):
+            continue
+
+    # MySQL updates on any unique conflict and does not accept the fields naming it
+    unique_fields = ["username"] if connection.features.supports_update_conflicts_with_target else None
+    EditorRegistration.objects.bulk_create(
+        [EditorRegistration(username=username, registration=registration)
+         for username, registration in registrations.items()],
+        update_conflicts=True, unique_fields=unique_fields, update_fields=["registration", "checked_at"])
+    return registrations
+
+
+def resolve_editor_registrations(workers=LOOKUP_WORKERS, timeout=LOOKUP_TIMEOUT, batch_size=LOOKUP_BATCH_SIZE):
+    """
+    Fills in the account creation date of the editors still without one, from the cache table or from MediaWiki.
+
+    Each username missing from the cache is asked once per call, in batches, as well as the accounts not found more
+    than MISSING_TTL seconds ago. The rollups of the reports of the updated editors are refreshed, since they count
+    the new editors.
+
+    :param workers: Maximum number of simultaneous calls to the API.
+    :param timeout: Seconds to wait for each call.
+    :param batch_size: Number of usernames asked before their answers are saved.
+    :return: (number of editors updated, number of usernames asked to the API) tuple.
+    """
+    pending = Editor.objects.filter(account_creation_date__isnull=True)
+    cached = EditorRegistration.objects.filter(username__in=pending.values("username")).exclude(
+        registration__isnull=True, checked_at__lt=timezone.now() - datetime.timedelta(seconds=MISSING_TTL))
+    registrations = dict(cached.values_list("username", "registration"))
+    missing = list(pending.exclude(username__in=list(registrations)).order_by("username").values_list(
+        "username", flat=True).distinct())
+
+    updated = apply_registrations(registrations)
+    for start in range(0, len(missing), batch_size):
+        updated += apply_registrations(lookup_registrations(missing[start:start + batch_size], workers, timeout))
+    return updated, len(missing)
+
+
+def apply_registrations(registrations):
+    """
+    Saves the registration dates on the editors without one, in a single update.
+
+    :param registrations: Dictionary of username to registration date or None.
+    :return: Number of editors updated.
+    """
+    found = {username: registration for username, registration in registrations.items() if registration}
+    if not found:
+        return 0
+
+    editors = Editor.objects.filter(account_creation_date__isnull=True, username__in=list(found))
+    editor_ids = list(editors.values_list("pk", flat=True))
+    with defer_rollup_updates(), transaction.atomic():
+        Editor.objects.filter(pk__in=editor_ids).update(account_creation_date=Case(
+            *[When(username=username, then=Value(registration)) for username, registration in found.items()],
+            output_field=DateTimeField()))
+        # A bulk update sends no signal, so the reports counting these editors are marked here
+        mark_reports(Report.objects.filter(editors__in=editor_ids).values_list("pk", flat=True))
+    return len(editor_ids)
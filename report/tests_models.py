@@ -1,10 +1,16 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import skipUnless
+from django.test import TestCase, TransactionTestCase
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
 from .models import Funding, Editor, Organizer, Partner, Technology, AreaActivated, LearningArea,\
     StrategicLearningQuestion, EvaluationObjective, Report, StrategicAxis, Project, OperationReport
 from users.models import TeamArea, UserProfile, User
-from metrics.models import Activity, Metric
+from metrics.models import Activity, Metric, MetricRollup
+from agenda.models import Event
 from strategy.models import Direction
 from datetime import datetime, timedelta
 
@@ -239,4 +245,112 @@ class OperationReportModelTest(TestCase):
 
     def test_operation_report_without_metric_fails(self):
         with self.assertRaises(IntegrityError):
-            OperationReport.objects.create(report = self.report)
\ No newline at end of file
+            OperationReport.objects.create(report = self.report)
+
+class DuplicateNamesTest(TransactionTestCase):
+    before_unique_names = [("report", "0042_merge_duplicate_names")]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.user_profile = UserProfile.objects.get(user=self.user)
+        self.team_area = TeamArea.objects.create(text="Area")
+
+        # The duplicates can only exist before the names are unique
+        self.executor = MigrationExecutor(connection)
+        self.leaf = self.executor.loader.graph.leaf_nodes("report")
+        self.executor.migrate(self.before_unique_names)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.leaf)
+
+    def create_report(self, description):
+        return Report.objects.create(created_by=self.user_profile, modified_by=self.user_profile,
+                                     area_responsible=self.team_area, initial_date=datetime(2023, 1, 1).date(),
+                                     description=description, links="https://testlink.com")
+
+    def test_merge_duplicates_command_moves_every_link_to_the_oldest_row(self):
+        report_1 = self.create_report("Report 1")
+        report_2 = self.create_report("Report 2")
+        editor_1 = Editor.objects.create(username="Editor")
+        editor_2 = Editor.objects.create(username="Editor", retained=True)
+        partner_1 = Partner.objects.create(name="Partner")
+        partner_2 = Partner.objects.create(name="Partner", website="https://partner.org")
+        organizer_1 = Organizer.objects.create(name="Organizer")
+        organizer_2 = Organizer.objects.create(name="Organizer")
+        organizer_1.institution.add(partner_1)
+        organizer_2.institution.add(partner_2)
+        report_1.editors.add(editor_1)
+        report_2.editors.add(editor_1, editor_2)
+        report_2.organizers.add(organizer_2)
+        report_2.partners_activated.add(partner_2)
+
+        output = StringIO()
+        call_command("merge_duplicates", stdout=output)
+
+        self.assertIn("Editor: 1 duplicates merged", output.getvalue())
+        self.assertEqual(list(Editor.objects.values_list("pk", "retained")), [(editor_1.pk, True)])
+        self.assertEqual(list(report_1.editors.all()), [editor_1])
+        self.assertEqual(list(report_2.editors.all()), [editor_1])
+        self.assertEqual(list(Organizer.objects.all()), [organizer_1])
+        self.assertEqual(list(report_2.organizers.all()), [organizer_1])
+        self.assertEqual(list(Partner.objects.values_list("pk", "website")), [(partner_1.pk, "https://partner.org")])
+        self.assertEqual(list(report_2.partners_activated.all()), [partner_1])
+        self.assertEqual(list(organizer_1.institution.all()), [partner_1])
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.leaf)
+        with self.assertRaises(IntegrityError):
+            Editor.objects.create(username="Editor")
+
+    def test_merge_migration_merges_the_duplicates_and_the_rollups_are_rebuilt_after_it(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate([("report", "0041_editorregistration")])
+        metric = Metric.objects.create(text="Metric", activity=Activity.objects.create(text="Activity"))
+        report = self.create_report("Report")
+        report.metrics_related.add(metric)
+        report.editors.add(Editor.objects.create(username="Editor"), Editor.objects.create(username="Editor"))
+        self.assertEqual(MetricRollup.objects.get(metric=metric, bucket="total", key="Number of editors").value, 2)
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.before_unique_names)
+        self.assertEqual(Editor.objects.count(), 1)
+        self.assertFalse(MetricRollup.objects.exists())
+
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+        self.assertEqual(MetricRollup.objects.get(metric=metric, bucket="total", key="Number of editors").value, 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "The query plans are read in the format of SQLite")
+class IndexUsageTest(TestCase):
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertRegex(plan, "USING (COVERING )?INDEX {}".format(index_name or ""), plan)
+
+    def test_lookups_by_name_use_an_index(self):
+        self.assertUsesIndex(Editor.objects.filter(username__in=["Editor 1", "Editor 2"]))
+        self.assertUsesIndex(Organizer.objects.filter(name__in=["Organizer 1", "Organizer 2"]))
+        self.assertUsesIndex(Partner.objects.filter(name="Partner"))
+        self.assertUsesIndex(Technology.objects.filter(name="Technology"))
+        self.assertUsesIndex(AreaActivated.objects.filter(text="Area"))
+
+    def test_report_queries_use_an_index(self):
+        start, end = datetime(2023, 1, 1).date(), datetime(2023, 12, 31).date()
+        self.assertUsesIndex(Report.objects.filter(end_date__gte=start, end_date__lte=end), "report_end_date_area_idx")
+        self.assertUsesIndex(Report.objects.filter(initial_date__year=2023), "report_initial_date_idx")
+        self.assertUsesIndex(Report.objects.order_by("-created_at"), "report_created_at_idx")
+        self.assertUsesIndex(Report.objects.filter(created_by=1, description="Report", created_at__gte=start),
+                             "report_created_by_at_idx")
+
+    def test_event_queries_use_an_index(self):
+        start, end = datetime(2023, 1, 1).date(), datetime(2023, 1, 31).date()
+        self.assertUsesIndex(Event.objects.filter(initial_date__lte=end, end_date__gte=start),
+                             "event_initial_end_date_idx")
+        self.assertUsesIndex(Event.objects.filter(area_responsible=1, end_date__gte=start, end_date__lte=end),
+                             "event_area_end_date_idx")
+        self.assertUsesIndex(Event.objects.filter(area_responsible=1, initial_date__gte=start, initial_date__lte=end),
+                             "event_area_initial_date_idx")
+
+    def test_main_projects_use_an_index(self):
+        self.assertUsesIndex(Project.objects.filter(main_funding=True), "project_main_funding_idx")
+        self.assertUsesIndex(Project.objects.filter(current_poa=True), "project_current_poa_idx")
@@ -1,25 +1,42 @@
 import json
+import os
+import re
+import tempfile
+import threading
 import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from wsgiref.validate import assert_
 
 import pandas as pd
-from io import BytesIO
+from io import BytesIO, StringIO
+from django.core.management import call_command
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from metrics.testing import QueryBudgetMixin
+from django.db import IntegrityError, connection
 from django.http import JsonResponse
 from django.urls import reverse
 from unittest.mock import patch
 from django.utils.translation import gettext as _
 from .models import Funding, Partner, Technology, AreaActivated, StrategicLearningQuestion, Report, Editor, \
-    LearningArea, Organizer, Project, OperationReport
-from metrics.models import Metric, StrategicAxis
+    LearningArea, Organizer, Project, OperationReport, ExportJob, EditorRegistration
+from metrics.models import Metric, StrategicAxis, MetricRollup
 from users.models import TeamArea, UserProfile, User
 from metrics.models import Activity, Area
 from strategy.models import Direction
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from django.utils import timezone
 from django.contrib.auth.models import Permission
-from .forms import NewReportForm, AreaActivatedForm, FundingForm, PartnerForm, TechnologyForm, activities_associated_as_choices, learning_areas_as_choices
+from .forms import NewReportForm, AreaActivatedForm, FundingForm, PartnerForm, TechnologyForm, learning_areas_as_choices
+from .choices import activities_associated_as_choices
 from .views import export_report_instance, export_metrics, export_user_profile, export_area_activated, export_directions_related, export_editors, export_learning_questions_related, export_organizers, export_partners_activated, export_technologies_used, get_or_create_editors, get_or_create_organizers, export_operation_report, export_funding
 from django.core.exceptions import ValidationError
+from .exports import write_csv
+from .jobs import EXPORT_JOBS, enqueue_export, claim_next_job, export_file_path
+from .registrations import resolve_editor_registrations
+from .persistence import OPERATION_FIELDS
+from .participants import bulk_get_or_create
 
 
 class ReportAddViewTest(TestCase):
@@ -52,6 +69,24 @@ class ReportAddViewTest(TestCase):
         self.assertEqual(response.context["directions_related_set"], [])
         self.assertEqual(response.context["learning_questions_related_set"], [])
 
+    def test_add_report_view_get_reuses_the_operation_formset_and_metrics(self):
+        self.client.login(username=self.username, password=self.password)
+        activity = Activity.objects.create(text="Activity")
+        metric = Metric.objects.create(text="Metric", activity=activity, number_of_events=1, is_operation=True)
+        url = reverse("report:add_report")
+        first = self.client.get(url).context["operation_metrics"]
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url).context["operation_metrics"]
+        self.assertIs(type(first), type(second))
+        self.assertEqual([form.initial["metric"] for form in second.forms], [metric])
+        self.assertFalse([query for query in queries.captured_queries if "is_operation" in query["sql"]])
+
+        metric_2 = Metric.objects.create(text="Metric 2", activity=activity, number_of_events=1, is_operation=True)
+        third = self.client.get(url).context["operation_metrics"]
+        self.assertEqual([form.initial["metric"] for form in third.forms], [metric, metric_2])
+        self.assertEqual(third.forms[1].initial["metric"].activity.text, "Activity")
+
     def test_add_report_view_post_associates_metrics_based_on_values(self):
         self.client.login(username=self.username, password=self.password)
         url = reverse("report:add_report")
@@ -217,7 +252,7 @@ class ReportAddViewTest(TestCase):
         self.client.post(url, data=data)
         self.assertFalse(Report.objects.filter(description=data["description"]).exists())
 
-    def test_add_report_fails_if_it_is_a_duplicate(self):
+    def test_add_report_submitted_twice_redirects_to_the_first_report(self):
         self.client.login(username=self.username, password=self.password)
         url = reverse("report:add_report")
 
@@ -279,11 +314,13 @@ class ReportAddViewTest(TestCase):
         }
 
         data.update(operation_data)
+        data["submission_token"] = "0" * 32
         response_1 = self.client.post(url, data=data)
         self.assertEqual(Report.objects.count(), 1)
         response_2 = self.client.post(url, data=data)
         self.assertEqual(Report.objects.count(), 1)
-        self.assertIn(_("It seems that you already submitted this report!"), response_2.content.decode('utf-8'))
+        self.assertEqual(response_2.status_code, 302)
+        self.assertEqual(response_2["Location"], response_1["Location"])
 
 
     def test_delete_report_fails_if_user_doesnt_have_permission(self):
@@ -369,6 +406,30 @@ class ReportAddViewTest(TestCase):
 
         self.assertEqual(Editor.objects.count(), 2)
 
+    def test_bulk_get_or_create_strips_the_values(self):
+        partner = Partner.objects.create(name="Partner")
+        partners, created = bulk_get_or_create(Partner, "name", [" Partner", "New partner  "])
+        self.assertEqual(list(partners), ["Partner", "New partner"])
+        self.assertEqual(partners["Partner"], partner)
+        self.assertEqual(created, {"New partner"})
+        self.assertEqual(Partner.objects.filter(name="New partner").count(), 1)
+
+    def test_bulk_get_or_create_uses_the_rows_matched_regardless_of_case(self):
+        def case_insensitive_rows(model, field, values):
+            # Matches the rows as the case insensitive collations of MySQL do
+            exact, folded = {}, {}
+            for obj in model.objects.filter(**{field + "__iregex": "^(" + "|".join(map(re.escape, values)) + ")$"}):
+                exact[getattr(obj, field)] = obj
+                folded[getattr(obj, field).casefold()] = obj
+            return exact, folded
+
+        partner = Partner.objects.create(name="Partner")
+        with patch("report.participants.rows_by_value", side_effect=case_insensitive_rows):
+            partners, created = bulk_get_or_create(Partner, "name", ["partner ", "PARTNER"])
+        self.assertEqual(partners, {"partner": partner, "PARTNER": partner})
+        self.assertEqual(created, set())
+        self.assertEqual(Partner.objects.count(), 1)
+
     def test_get_or_create_organizers_with_empty_string(self):
         organizers_string = ""
         result = get_or_create_organizers(organizers_string)
@@ -595,7 +656,7 @@ class ReportAddViewTest(TestCase):
         self.assertEqual(response.json()["objects"], None)
 
 
-class ReportViewViewTest(TestCase):
+class ReportViewViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.username = "testuser"
         self.password = "testpass"
@@ -645,7 +706,78 @@ class ReportViewViewTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'report/list_reports.html')
-        self.assertQuerySetEqual(response.context['dataset'], Report.objects.order_by('-created_at'))
+        self.assertContains(response, reverse("report:list_reports_data", kwargs={"year": datetime.now().year}))
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.get(reverse("report:list_reports_data", kwargs={"year": datetime.now().year}))
+        self.assertEqual([row["id"] for row in response.json()["rows"]],
+                         list(Report.objects.order_by("-created_at", "-id").values_list("id", flat=True)))
+        self.assertIsNone(response.json()["next"])
+
+    def create_reports_of_2023(self, total, area):
+        return [Report.objects.create(description="Report of 2023 {}".format(number),
+                                      created_by=self.user_profile,
+                                      modified_by=self.user_profile,
+                                      initial_date=date(2023, 1 + number % 3, 1),
+                                      end_date=date(2023, 1 + number % 3, 2),
+                                      activity_associated=self.activity_associated,
+                                      area_responsible=area,
+                                      links="Links") for number in range(total)]
+
+    def test_list_reports_data_walks_through_the_pages_after_each_other(self):
+        self.client.login(username=self.username, password=self.password)
+        reports = self.create_reports_of_2023(7, self.area_reponsible)
+        url = reverse("report:list_reports_data", kwargs={"year": 2023})
+
+        ids = []
+        pages = 0
+        parameters = {"sort": "initial_date", "order": "asc", "limit": 3}
+        while True:
+            data = self.client.get(url, parameters).json()
+            ids += [row["id"] for row in data["rows"]]
+            pages += 1
+            if not data["next"]:
+                break
+            parameters["after"] = data["next"]
+
+        expected = sorted(reports, key=lambda report: (report.initial_date, report.id))
+        self.assertEqual(ids, [report.id for report in expected])
+        self.assertEqual(pages, 3)
+
+    def test_list_reports_data_filters_and_sorts_in_the_database(self):
+        self.client.login(username=self.username, password=self.password)
+        other_area = TeamArea.objects.create(text="Other area")
+        self.create_reports_of_2023(3, self.area_reponsible)
+        reports = self.create_reports_of_2023(3, other_area)
+        url = reverse("report:list_reports_data", kwargs={"year": 2023})
+
+        data = self.client.get(url, {"area": other_area.id, "sort": "end_date"}).json()
+        self.assertEqual([row["id"] for row in data["rows"]], [reports[2].id, reports[1].id, reports[0].id])
+        self.assertEqual(data["rows"][0]["area_responsible"], "Other area")
+        self.assertEqual(data["rows"][0]["urls"]["view"], reverse("report:detail_report",
+                                                                  kwargs={"report_id": reports[2].id}))
+
+        data = self.client.get(url, {"search": "2023 1", "start": "2023-02-01", "end": "2023-02-28"}).json()
+        self.assertEqual(len(data["rows"]), 2)
+
+        response = self.client.get(url, {"after": "forged"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("after", response.json()["errors"])
+
+    def test_list_reports_data_reads_any_page_with_the_same_queries(self):
+        self.client.login(username=self.username, password=self.password)
+        self.create_reports_of_2023(20, self.area_reponsible)
+        url = reverse("report:list_reports_data", kwargs={"year": 2023})
+        with CaptureQueriesContext(connection) as first_queries:
+            page = self.client.get(url, {"limit": 5}).json()
+        for number in range(3):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {"limit": 5, "after": page["next"]})
+            page = response.json()
+            self.assertEqual(len(queries), len(first_queries))
+            self.assertWithinQueryBudget(response)
+            self.assertEqual(len(page["rows"]), 5)
+        self.assertIsNone(page["next"])
 
     def test_detail_report_is_only_possible_for_users_with_permissions(self):
         self.user.user_permissions.remove(self.view_permission)
@@ -725,6 +857,85 @@ class ReportViewViewTest(TestCase):
         self.assertEqual(self.report_1.editors.count(), 2)
         self.assertEqual(self.report_1.organizers.count(), 2)
 
+    def update_operation_data(self, operation, **values):
+        data = {
+            "activity_associated": self.activity_associated.id,
+            "area_responsible": self.area_reponsible.id,
+            "initial_date": self.report_1.initial_date,
+            "description": "Updated Test Report",
+            "learning": "Learnings!!" * 49,
+            "links": self.report_1.links,
+            "directions_related": [self.directions_related.id],
+            "learning_questions_related": [self.learning_questions_related.id],
+            "metrics_related": [self.metrics_related.id],
+            "donors": 0,
+            "submissions": 0,
+            "Operation-TOTAL_FORMS": 1,
+            "Operation-INITIAL_FORMS": 1,
+            "Operation-MIN_NUM_FORMS": 0,
+            "Operation-MAX_NUM_FORMS": 1000,
+            "Operation-0-id": operation.id,
+            "Operation-0-report": self.report_1.id,
+            "Operation-0-metric": operation.metric_id,
+        }
+        for field in OPERATION_FIELDS:
+            data["Operation-0-" + field] = values.get(field, 0)
+        return data
+
+    def test_update_report_post_updates_the_operation_reports_in_place(self):
+        Project.objects.create(text="Wikimedia Community Fund", main_funding=True)
+        operation_metric = Metric.objects.create(text="Operation metric", activity=self.activity_associated,
+                                                 number_of_events=1, is_operation=True)
+        operation = OperationReport.objects.create(report=self.report_1, metric=operation_metric)
+        self.client.login(username=self.username, password=self.password)
+        url = reverse("report:update_report", kwargs={"report_id": self.report_1.id})
+
+        response = self.client.post(url, data=self.update_operation_data(operation, number_of_events=3))
+        self.assertRedirects(response, reverse("report:detail_report", kwargs={"report_id": self.report_1.id}))
+        self.assertEqual(list(self.report_1.operation_report.values_list("id", "number_of_events")),
+                         [(operation.id, 3)])
+        self.assertEqual(set(self.report_1.metrics_related.all()), {self.metrics_related, operation_metric})
+        self.assertEqual(list(self.report_1.directions_related.all()), [self.directions_related])
+
+        self.client.post(url, data=self.update_operation_data(operation))
+        self.assertEqual(self.report_1.operation_report.get().number_of_events, 0)
+        self.assertEqual(list(self.report_1.metrics_related.all()), [self.metrics_related])
+
+    def test_update_report_post_relates_only_the_operation_metrics_changed(self):
+        Project.objects.create(text="Wikimedia Community Fund", main_funding=True)
+        operation_metric = Metric.objects.create(text="Operation metric", activity=self.activity_associated,
+                                                 number_of_events=1, is_operation=True)
+        operation = OperationReport.objects.create(report=self.report_1, metric=operation_metric, number_of_events=3)
+        self.report_1.metrics_related.add(operation_metric)
+        self.client.login(username=self.username, password=self.password)
+        url = reverse("report:update_report", kwargs={"report_id": self.report_1.id})
+
+        # The operation metric left out of the metrics chosen stays out while its operation report is unchanged
+        self.client.post(url, data=self.update_operation_data(operation, number_of_events=3))
+        self.assertEqual(list(self.report_1.metrics_related.all()), [self.metrics_related])
+
+        self.client.post(url, data=self.update_operation_data(operation, number_of_events=4))
+        self.assertEqual(set(self.report_1.metrics_related.all()), {self.metrics_related, operation_metric})
+
+    def test_update_report_post_writes_nothing_if_it_fails(self):
+        Project.objects.create(text="Wikimedia Community Fund", main_funding=True)
+        operation = OperationReport.objects.create(report=self.report_1, metric=self.metrics_related)
+        self.client.login(username=self.username, password=self.password)
+        url = reverse("report:update_report", kwargs={"report_id": self.report_1.id})
+
+        with patch("report.persistence.set_relations", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(url, data=self.update_operation_data(operation, number_of_events=3))
+
+        self.report_1.refresh_from_db()
+        self.assertEqual(self.report_1.description, "Report 1")
+        self.assertEqual(self.report_1.operation_report.get().number_of_events, 0)
+
+
+def write_test_csv(csv_file, *args):
+    csv_file.write(b'test csv data')
+    return []
+
 
 class ReportExportViewTest(TestCase):
     def setUp(self):
@@ -786,18 +997,66 @@ class ReportExportViewTest(TestCase):
         content_type = response.headers['Content-Type']
         self.assertEqual(content_type, 'application/x-zip-compressed')
 
-    @patch('report.views.add_csv_file')
-    @patch('report.views.add_excel_file')
-    def test_export_report_generates_a_zip_file_with_a_specific_structure(self, mock_add_excel_file, mock_add_csv_file):
+    def test_export_report_streams_each_table_as_csv(self):
+        self.client.login(username=self.username, password=self.password)
+
+        response = self.client.get(reverse("report:export_report", kwargs={"report_id": self.report_1.id}))
+        self.assertTrue(response.streaming)
+        buffer = BytesIO(b"".join(response.streaming_content))
+        postfix = datetime.today().strftime('%Y-%m-%d')
+        with zipfile.ZipFile(buffer) as zip_file:
+            csv_content = zip_file.read('csv/Report {} - {}.csv'.format(self.report_1.id, postfix))
+        expected_content = export_report_instance(self.report_1.id).to_csv(index=False).encode("utf-8")
+        self.assertEqual(csv_content, expected_content)
+
+    def test_export_report_without_excel_file(self):
         self.client.login(username=self.username, password=self.password)
-        mock_add_csv_file.return_value = BytesIO(b'test csv data')
-        mock_add_excel_file.return_value = BytesIO(b'test excel data')
+
+        response = self.client.get(reverse("report:export_all_reports") + "?format=csv")
+        buffer = BytesIO(b"".join(response.streaming_content))
+        with zipfile.ZipFile(buffer) as zip_file:
+            self.assertEqual(len(zip_file.namelist()), 12)
+            self.assertTrue(all(name.endswith(".csv") for name in zip_file.namelist()))
+
+    def test_write_csv_has_the_same_content_as_the_dataframe(self):
+        self.report_1.editors.add(self.editors)
+        self.report_2.editors.add(self.editors)
+        for export in [export_report_instance, export_editors, export_area_activated]:
+            csv_file = BytesIO()
+            write_csv(csv_file, export)
+            self.assertEqual(csv_file.getvalue(), export().to_csv(index=False).encode("utf-8"))
+
+    def test_export_report_writes_the_rows_to_the_excel_workbook(self):
+        self.client.login(username=self.username, password=self.password)
+
+        response = self.client.get(reverse("report:export_report", kwargs={"report_id": self.report_1.id}))
+        postfix = datetime.today().strftime('%Y-%m-%d')
+        with zipfile.ZipFile(BytesIO(b"".join(response.streaming_content))) as zip_file:
+            excel_content = zip_file.read('Export {} - {}.xlsx'.format(self.report_1.id, postfix))
+        with zipfile.ZipFile(BytesIO(excel_content)) as excel_file:
+            sheets = [name for name in excel_file.namelist() if name.startswith("xl/worksheets/sheet")]
+            report_sheet = excel_file.read("xl/worksheets/sheet1.xml").decode("utf-8")
+        self.assertEqual(len(sheets), 12)
+        self.assertIn(self.report_1.description, report_sheet)
+        self.assertNotIn(self.report_2.description, report_sheet)
+
+    def test_benchmark_exports_command(self):
+        out = StringIO()
+        call_command("benchmark_exports", reports=10, table=["Report", "Editors"], stdout=out)
+        self.assertIn("Report (csv): 12 rows", out.getvalue())
+        self.assertIn("Editors (csv and xlsx): 10 rows", out.getvalue())
+        self.assertEqual(Report.objects.count(), 2)
+
+    @patch('report.views.write_csv')
+    def test_export_report_generates_a_zip_file_with_a_specific_structure(self, mock_write_csv):
+        self.client.login(username=self.username, password=self.password)
+        mock_write_csv.side_effect = write_test_csv
         response = self.client.get(reverse("report:export_report", kwargs={"report_id": self.report_1.id}))
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/x-zip-compressed')
         self.assertEqual(response['Content-Disposition'], 'attachment; filename=Report 1 - {}.zip'.format(datetime.today().strftime('%Y-%m-%d')))
-        buffer = BytesIO(response.content)
+        buffer = BytesIO(b"".join(response.streaming_content))
         with zipfile.ZipFile(buffer) as zip_file:
             expected_files = [
                 'csv/Report 1 - {}.csv'.format(datetime.today().strftime('%Y-%m-%d')),
@@ -816,21 +1075,20 @@ class ReportExportViewTest(TestCase):
             ]
             self.assertEqual(sorted(zip_file.namelist()), sorted(expected_files))
             self.assertEqual(zip_file.read(expected_files[0]), b'test csv data')
-            self.assertEqual(zip_file.read(expected_files[-1]), b'test excel data')
+            with zipfile.ZipFile(BytesIO(zip_file.read(expected_files[-1]))) as excel_file:
+                self.assertIn(b'name="Learning questions"', excel_file.read("xl/workbook.xml"))
 
-    @patch('report.views.add_csv_file')
-    @patch('report.views.add_excel_file')
-    def test_export_report_generates_a_zip_file_with_a_specific_structure_without_report_id(self, mock_add_excel_file, mock_add_csv_file):
+    @patch('report.views.write_csv')
+    def test_export_report_generates_a_zip_file_with_a_specific_structure_without_report_id(self, mock_write_csv):
         self.client.login(username=self.username, password=self.password)
-        mock_add_csv_file.return_value = BytesIO(b'test csv data')
-        mock_add_excel_file.return_value = BytesIO(b'test excel data')
+        mock_write_csv.side_effect = write_test_csv
         response = self.client.get(reverse("report:export_all_reports"))
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/x-zip-compressed')
         postfix = datetime.today().strftime('%Y-%m-%d')
         self.assertEqual(response['Content-Disposition'], 'attachment; filename=SARA - Reports - {}.zip'.format(postfix))
-        buffer = BytesIO(response.content)
+        buffer = BytesIO(b"".join(response.streaming_content))
         with zipfile.ZipFile(buffer) as zip_file:
             expected_files = [
                 'csv/Report - {}.csv'.format(postfix),
@@ -849,15 +1107,13 @@ class ReportExportViewTest(TestCase):
             ]
             self.assertEqual(sorted(zip_file.namelist()), sorted(expected_files))
             self.assertEqual(zip_file.read(expected_files[0]), b'test csv data')
-            self.assertEqual(zip_file.read(expected_files[-1]), b'test excel data')
+            with zipfile.ZipFile(BytesIO(zip_file.read(expected_files[-1]))) as excel_file:
+                self.assertIn(b'name="Learning questions"', excel_file.read("xl/workbook.xml"))
 
-    @patch('report.views.add_csv_file')
-    @patch('report.views.add_excel_file')
-    def test_export_report_generates_a_zip_file_with_a_specific_structure_with_year(self, mock_add_excel_file,
-                                                                                    mock_add_csv_file):
+    @patch('report.views.write_csv')
+    def test_export_report_generates_a_zip_file_with_a_specific_structure_with_year(self, mock_write_csv):
         self.client.login(username=self.username, password=self.password)
-        mock_add_csv_file.return_value = BytesIO(b'test csv data')
-        mock_add_excel_file.return_value = BytesIO(b'test excel data')
+        mock_write_csv.side_effect = write_test_csv
         response = self.client.get(reverse("report:export_year_reports", kwargs={"year": datetime.now().year}))
 
         self.assertEqual(response.status_code, 200)
@@ -865,7 +1121,7 @@ class ReportExportViewTest(TestCase):
         postfix = datetime.today().strftime('%Y-%m-%d')
         self.assertEqual(response['Content-Disposition'],
                          'attachment; filename=SARA - Reports - {}.zip'.format(postfix))
-        buffer = BytesIO(response.content)
+        buffer = BytesIO(b"".join(response.streaming_content))
         with zipfile.ZipFile(buffer) as zip_file:
             expected_files = [
                 'csv/Report - {}.csv'.format(postfix),
@@ -884,7 +1140,8 @@ class ReportExportViewTest(TestCase):
             ]
             self.assertEqual(sorted(zip_file.namelist()), sorted(expected_files))
             self.assertEqual(zip_file.read(expected_files[0]), b'test csv data')
-            self.assertEqual(zip_file.read(expected_files[-1]), b'test excel data')
+            with zipfile.ZipFile(BytesIO(zip_file.read(expected_files[-1]))) as excel_file:
+                self.assertIn(b'name="Learning questions"', excel_file.read("xl/workbook.xml"))
 
     def test_export_report_instance(self):
         expected_header = [_('ID'), _('Created by'), _('Created at'), _('Modified by'), _('Modified at'),
@@ -1045,6 +1302,16 @@ class ReportExportViewTest(TestCase):
         result = export_report_instance()
         self.assertTrue(result[result.isin(expected_df)].equals(expected_df))
 
+    def test_export_report_instance_takes_the_same_number_of_queries_for_any_number_of_reports(self):
+        for report in [self.report_1, self.report_2]:
+            report.editors.add(self.editors)
+            report.metrics_related.add(self.metrics_related)
+
+        with self.assertNumQueries(10):
+            result = export_report_instance()
+        self.assertEqual(list(result[_('Editors')]), [str(self.editors.id)] * 2)
+        self.assertEqual(list(result[_('Metrics related')]), [str(self.metrics_related.id)] * 2)
+
     def test_export_report_instance_without_many_to_many_relations(self):
         expected_header = [_('ID'), _('Created by'), _('Created at'), _('Modified by'), _('Modified at'),
                            _('Activity associated'), _('Name of the activity'), _('Area responsible'),
@@ -1264,10 +1531,10 @@ class ReportExportViewTest(TestCase):
     def test_export_area_activated_without_report_id_returns_areas_activated_from_all_reports(self):
         expected_header = [_('ID'), _('Area activated'), _('Contact')]
 
-        area_activated_1 = AreaActivated.objects.create(text="Area activated")
+        area_activated_1 = AreaActivated.objects.create(text="Area activated 1")
         self.report_1.area_activated.add(area_activated_1)
 
-        area_activated_2 = AreaActivated.objects.create(text="Area activated")
+        area_activated_2 = AreaActivated.objects.create(text="Area activated 2")
         self.report_2.area_activated.add(area_activated_2)
 
         expected_row_0 = [self.area_reponsible.id, self.area_reponsible.text, AreaActivated.objects.get(text=self.area_reponsible.text).contact]
@@ -1315,7 +1582,7 @@ class ReportExportViewTest(TestCase):
     def test_export_editors(self):
         expected_header = [_('ID'), _('Username'), _('Number of reports including this editor')]
 
-        editor = Editor.objects.create(username="Editor")
+        editor = Editor.objects.create(username="Editor 1")
         self.report_1.editors.add(editor)
         expected_row = [editor.id,
                         editor.username,
@@ -1375,8 +1642,8 @@ class ReportExportViewTest(TestCase):
     def test_export_organizers(self):
         expected_header = [_('ID'), _("Organizer's name"), _("Organizer's institution ID"), _("Organizer institution's name"), _('Number of reports including this organizer')]
 
-        partner = Partner.objects.create(name="Partner")
-        organizer = Organizer.objects.create(name="Organizer")
+        partner = Partner.objects.create(name="Partner 1")
+        organizer = Organizer.objects.create(name="Organizer 1")
         organizer.institution.add(partner)
         self.report_1.organizers.add(organizer)
         expected_row = [organizer.id,
@@ -1392,10 +1659,10 @@ class ReportExportViewTest(TestCase):
     def test_export_organizers_without_report_id_returns_organizers_from_all_reports(self):
         expected_header = [_('ID'), _("Organizer's name"), _("Organizer's institution ID"), _("Organizer institution's name"), _('Number of reports including this organizer')]
 
-        partner = Partner.objects.create(name="Partner")
-        organizer_1 = Organizer.objects.create(name="Organizer")
+        partner = Partner.objects.create(name="Partner 1")
+        organizer_1 = Organizer.objects.create(name="Organizer 1")
         organizer_1.institution.add(partner)
-        organizer_2 = Organizer.objects.create(name="Organizer")
+        organizer_2 = Organizer.objects.create(name="Organizer 2")
         organizer_2.institution.add(partner)
         self.report_1.organizers.add(organizer_1)
         self.report_2.organizers.add(organizer_2)
@@ -1410,7 +1677,7 @@ class ReportExportViewTest(TestCase):
     def test_partners_activated(self):
         expected_header = [_('ID'), _("Partners"), _("Partner's website"), _('Number of reports including this partner')]
 
-        partner = Partner.objects.create(name="Partner")
+        partner = Partner.objects.create(name="Partner 1")
         self.report_1.partners_activated.add(partner)
         expected_row = [partner.id, partner.name, partner.website, partner.partners.count()]
 
@@ -1436,7 +1703,7 @@ class ReportExportViewTest(TestCase):
     def test_export_technologies_used(self):
         expected_header = [_('ID'), _("Technology"), _('Number of reports including this technology')]
 
-        technology_used = Technology.objects.create(name="Technology")
+        technology_used = Technology.objects.create(name="Technology 1")
         self.report_1.technologies_used.add(technology_used)
         expected_row = [technology_used.id, technology_used.name, technology_used.tecnologies.count()]
 
@@ -1640,6 +1907,128 @@ class ReportExportViewTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response,f"{reverse('report:list_reports')}")
 
+    def test_queue_export_merges_identical_requests_while_the_job_is_not_finished(self):
+        self.client.login(username=self.username, password=self.password)
+        url = reverse("report:queue_export", kwargs={"kind": "report"})
+
+        first = self.client.post(url, {"report_id": self.report_1.id, "format": "csv"})
+        second = self.client.post(url, {"report_id": self.report_1.id, "format": "csv"})
+        other = self.client.post(url, {"report_id": self.report_2.id, "format": "csv"})
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json()["id"], second.json()["id"])
+        self.assertNotEqual(first.json()["id"], other.json()["id"])
+        self.assertEqual(ExportJob.objects.count(), 2)
+
+    def test_queue_export_is_only_possible_for_users_with_permissions(self):
+        self.client.login(username=self.username, password=self.password)
+
+        response = self.client.post(reverse("report:queue_export", kwargs={"kind": "bugs"}))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse("report:queue_export", kwargs={"kind": "unknown"}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_export_worker_builds_the_file_of_the_queued_job(self):
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.post(reverse("report:queue_export", kwargs={"kind": "report"}),
+                                    {"report_id": self.report_1.id, "format": "csv"})
+        job_url = response.json()["url"]
+        self.assertEqual(response.json()["status"], "queued")
+
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root):
+            call_command("run_export_worker", "--once", stdout=StringIO())
+
+            status = self.client.get(job_url).json()
+            self.assertEqual(status["status"], "done")
+            self.assertEqual(status["progress"], 100)
+
+            response = self.client.get(status["download_url"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["Content-Type"], "application/x-zip-compressed")
+            zipped_file = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)), "r")
+            self.assertEqual(len(zipped_file.namelist()), 12)
+
+        # A finished job no longer takes the new requests
+        response = self.client.post(reverse("report:queue_export", kwargs={"kind": "report"}),
+                                    {"report_id": self.report_1.id, "format": "csv"})
+        self.assertEqual(response.status_code, 202)
+
+    def test_export_worker_records_failed_jobs(self):
+        def failing_export(parameters, progress):
+            raise ValueError("Export failed")
+
+        job, created = enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_1.id})
+        with patch.dict(EXPORT_JOBS, {ExportJob.Kind.REPORT: ("report.view_report", failing_export)}):
+            call_command("run_export_worker", "--once", stdout=StringIO(), stderr=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.Status.FAILED)
+        self.assertIn("Export failed", job.error)
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.get(reverse("report:download_export_job", kwargs={"job_id": job.id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_jobs_of_stopped_workers_do_not_take_new_requests(self):
+        job, created = enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_1.id})
+        self.assertEqual(claim_next_job(), job)
+        self.assertEqual(enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_1.id}), (job, False))
+
+        ExportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=2))
+        with self.settings(EXPORT_JOB_TIMEOUT=60 * 60):
+            new_job, created = enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_1.id})
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.Status.FAILED)
+        self.assertIsNone(job.active_key)
+        self.assertEqual(new_job.active_key, job.key)
+
+    def test_export_is_queued_again_if_the_identical_job_finished_while_it_was_queued(self):
+        create = ExportJob.objects.create
+        attempts = []
+
+        def create_after_a_conflict(**kwargs):
+            # The identical job held the key when the export was created, and finished right after
+            attempts.append(kwargs)
+            if len(attempts) == 1:
+                raise IntegrityError("UNIQUE constraint failed: report_exportjob.active_key")
+            return create(**kwargs)
+
+        with patch.object(ExportJob.objects, "create", side_effect=create_after_a_conflict):
+            job, created = enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_1.id})
+        self.assertTrue(created)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(job.active_key, job.key)
+
+    def test_export_worker_removes_the_old_finished_jobs_and_their_files(self):
+        old_job, created = enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_1.id})
+        recent_job, created = enqueue_export(ExportJob.Kind.REPORT, {"report_id": self.report_2.id})
+
+        with tempfile.TemporaryDirectory() as export_root, self.settings(EXPORT_ROOT=export_root,
+                                                                          EXPORT_RETENTION=60 * 60):
+            call_command("run_export_worker", "--once", stdout=StringIO())
+            ExportJob.objects.filter(pk=old_job.pk).update(finished_at=timezone.now() - timedelta(hours=2))
+            old_job.refresh_from_db()
+            self.assertTrue(os.path.exists(export_file_path(old_job)))
+
+            output = StringIO()
+            call_command("run_export_worker", "--once", stdout=output)
+            self.assertIn("1 old export jobs removed", output.getvalue())
+            self.assertFalse(os.path.exists(os.path.dirname(export_file_path(old_job))))
+            self.assertEqual(list(ExportJob.objects.all()), [recent_job])
+            recent_job.refresh_from_db()
+            self.assertTrue(os.path.exists(export_file_path(recent_job)))
+
+    def test_export_links_queue_the_export(self):
+        self.client.login(username=self.username, password=self.password)
+        queue_url = reverse("report:queue_export", kwargs={"kind": "report"})
+
+        response = self.client.get(reverse("report:detail_report", kwargs={"report_id": self.report_1.id}))
+        self.assertContains(response, 'data-export-url="{}"'.format(queue_url))
+        self.assertContains(response, 'data-export-parameters="report_id={}"'.format(self.report_1.id))
+        self.assertContains(response, "scripts/export_jobs.js")
+
 
 
 
@@ -1885,6 +2274,29 @@ class ReportFormTest(TestCase):
         self.assertTrue(cleaned_data[0].username, editor.username)
         self.assertTrue(cleaned_data[0].retained, 1)
 
+    def test_clean_editors_and_organizers_take_the_same_number_of_queries_for_any_number_of_lines(self):
+        Editor.objects.create(username="Editor 0")
+        Organizer.objects.create(name="Organizer 0")
+        editors_string = "\r\n".join("Editor {}".format(i) for i in range(200))
+        organizers_string = "\r\n".join("Organizer {};Institution {};Institution 0".format(i, i) for i in range(200))
+        form = NewReportForm(data={"editors_string": editors_string, "organizers_string": organizers_string},
+                             user=self.user)
+
+        with self.assertNumQueries(15):
+            editors = form.clean_editors()
+            organizers = form.clean_organizers()
+            partners = form.clean_partners_activated()
+
+        self.assertEqual([editor.username for editor in editors], ["Editor {}".format(i) for i in range(200)])
+        self.assertEqual([organizer.name for organizer in organizers], ["Organizer {}".format(i) for i in range(200)])
+        self.assertEqual(len(partners), 200)
+        self.assertTrue(editors[0].retained)
+        self.assertFalse(editors[1].retained)
+        self.assertTrue(Organizer.objects.get(name="Organizer 0").retained)
+        self.assertEqual(Organizer.institution.through.objects.count(), 399)
+        self.assertEqual(set(Organizer.objects.get(name="Organizer 7").institution.values_list("name", flat=True)),
+                         {"Institution 7", "Institution 0"})
+
     def test_get_or_create_editors_empty_string(self):
         editors_string = ""
         editors = get_or_create_editors(editors_string)
@@ -1932,6 +2344,36 @@ class ReportFormTest(TestCase):
         result = activities_associated_as_choices()
         self.assertEqual(expected_result, result)
 
+    def test_form_choice_trees_are_cached_until_they_change(self):
+        project = Project.objects.create(text="Project")
+        area = Area.objects.create(text="Area 1")
+        area.project.add(project)
+        activity = Activity.objects.create(text="Activity 1", code="Code 1", area=area)
+        strategic_axis = StrategicAxis.objects.create(text="Strategic axis")
+        Direction.objects.create(text="Direction 1", strategic_axis=strategic_axis)
+        learning_area = LearningArea.objects.create(text="Learning area 1")
+        StrategicLearningQuestion.objects.create(text="SLQ 1", learning_area=learning_area)
+        NewReportForm(user=self.user)
+
+        with self.assertNumQueries(1):
+            form = NewReportForm(user=self.user)
+        # Django 5 turns the nested choices into lists, older versions keep the tuples
+        self.assertEqual([(group, list(options)) for group, options in form.fields["activity_associated"].choices],
+                         [("Area 1", [(activity.id, "Activity 1 (Code 1)")])])
+
+        Activity.objects.create(text="Activity 2", code="Code 2", area=area)
+        Direction.objects.create(text="Direction 2", strategic_axis=strategic_axis)
+        learning_area.text = "Learning area 2"
+        learning_area.save()
+        form = NewReportForm(user=self.user)
+        self.assertEqual(len(form.fields["activity_associated"].choices[0][1]), 2)
+        self.assertEqual(len(form.fields["directions_related"].choices[0][1]), 2)
+        self.assertEqual(form.fields["learning_questions_related"].choices[0][0], "Learning area 2")
+
+        project.active = False
+        project.save()
+        self.assertEqual(NewReportForm(user=self.user).fields["activity_associated"].choices, [])
+
     def test_learning_areas_as_choices(self):
         learning_area_1 = LearningArea.objects.create(text="Learning area 1")
         learning_area_2 = LearningArea.objects.create(text="Learning area 2")
@@ -1975,4 +2417,106 @@ class ParterFormTest(TestCase):
         }
         form = PartnerForm(data=data)
         self.assertFalse(form.is_valid())
-        self.assertIn("website", form.errors)
\ No newline at end of file
+        self.assertIn("website", form.errors)
+
+
+class StubMediaWikiHandler(BaseHTTPRequestHandler):
+    """
+    Answers globaluserinfo queries like the MediaWiki API, from the registrations of the test.
+    """
+    registrations = {}
+    usernames_asked = []
+
+    def do_GET(self):
+        username = parse_qs(urlparse(self.path).query)["guiuser"][0]
+        self.usernames_asked.append(username)
+        if username == "Broken":
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        if username in self.registrations:
+            info = {"id": 1, "name": username, "registration": self.registrations[username]}
+        else:
+            info = {"missing": ""}
+        body = json.dumps({"batchcomplete": "", "query": {"globaluserinfo": info}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class EditorRegistrationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubMediaWikiHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = "http://127.0.0.1:{}/w/api.php".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubMediaWikiHandler.registrations = {"Alice": "2020-05-04T03:02:01Z"}
+        StubMediaWikiHandler.usernames_asked = []
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.user_profile = UserProfile.objects.get(user=self.user)
+        self.metric = Metric.objects.create(text="Metric", activity=Activity.objects.create(text="Activity"))
+        self.report = Report.objects.create(description="Report",
+                                            created_by=self.user_profile,
+                                            modified_by=self.user_profile,
+                                            initial_date=datetime(2020, 1, 1).date(),
+                                            end_date=datetime(2020, 1, 1).date(),
+                                            learning="Learnings!" * 51,
+                                            activity_associated=self.metric.activity,
+                                            area_responsible=TeamArea.objects.create(text="Area"),
+                                            links="Links")
+        self.report.metrics_related.add(self.metric)
+
+    def test_clean_editors_does_not_call_mediawiki(self):
+        EditorRegistration.objects.create(username="Cached", registration=datetime(2019, 1, 1))
+        with self.settings(MEDIAWIKI_API_URL=self.api_url):
+            form = NewReportForm(data={"editors_string": "Alice\r\nCached"}, user=self.user)
+            editors = form.clean_editors()
+
+        self.assertEqual(StubMediaWikiHandler.usernames_asked, [])
+        self.assertIsNone(editors[0].account_creation_date)
+        self.assertEqual(editors[1].account_creation_date, datetime(2019, 1, 1))
+
+    def test_resolve_editor_registrations_fills_in_the_dates_and_caches_them(self):
+        editors = [Editor.objects.create(username=username) for username in ["Alice", "Bob", "Broken"]]
+        self.report.editors.add(*editors)
+        self.assertEqual(MetricRollup.objects.filter(key="Number of new editors").count(), 0)
+
+        with self.settings(MEDIAWIKI_API_URL=self.api_url):
+            call_command("resolve_editor_registrations", "--once", stdout=StringIO())
+        self.assertEqual(sorted(StubMediaWikiHandler.usernames_asked), ["Alice", "Bob", "Broken"])
+        self.assertEqual(Editor.objects.get(username="Alice").account_creation_date, datetime(2020, 5, 4, 3, 2, 1))
+        self.assertIsNone(Editor.objects.get(username="Bob").account_creation_date)
+        self.assertTrue(EditorRegistration.objects.filter(username="Bob", registration__isnull=True).exists())
+        self.assertFalse(EditorRegistration.objects.filter(username="Broken").exists())
+        self.assertEqual(MetricRollup.objects.get(metric=self.metric, bucket="total", key="Number of new editors").value,
+                         1)
+
+        # Only the lookups that failed are asked again
+        StubMediaWikiHandler.usernames_asked = []
+        Editor.objects.filter(username="Alice").update(account_creation_date=None)
+        with self.settings(MEDIAWIKI_API_URL=self.api_url):
+            self.assertEqual(resolve_editor_registrations(), (1, 1))
+        self.assertEqual(StubMediaWikiHandler.usernames_asked, ["Broken"])
+
+        # The accounts not found are asked again after a while
+        StubMediaWikiHandler.usernames_asked = []
+        StubMediaWikiHandler.registrations["Bob"] = "2021-01-02T03:04:05Z"
+        EditorRegistration.objects.filter(username="Bob").update(checked_at=datetime(2020, 1, 1))
+        with self.settings(MEDIAWIKI_API_URL=self.api_url):
+            self.assertEqual(resolve_editor_registrations(), (1, 2))
+        self.assertEqual(sorted(StubMediaWikiHandler.usernames_asked), ["Bob", "Broken"])
+        self.assertEqual(Editor.objects.get(username="Bob").account_creation_date, datetime(2021, 1, 2, 3, 4, 5))
@@ -7,10 +7,14 @@ urlpatterns = [
     path("add", views.add_report, name="add_report"),
     path("list", views.list_reports, name="list_reports"),
     path("list/<int:year>", views.list_reports_of_year, name="list_reports_of_year"),
+    path("list/<int:year>/data", views.list_reports_data, name="list_reports_data"),
     path("<int:report_id>/view", views.detail_report, name="detail_report"),
     path("<int:report_id>/export", views.export_report, name="export_report"),
     path("list/<int:year>/export", views.export_report, name="export_year_reports"),
     path("all/export", views.export_report, name="export_all_reports"),
+    path("exports/<str:kind>/queue", views.queue_export, name="queue_export"),
+    path("exports/<int:job_id>", views.show_export_job, name="show_export_job"),
+    path("exports/<int:job_id>/download", views.download_export_job, name="download_export_job"),
     path("<int:report_id>/update", views.update_report, name="update_report"),
     path("<int:report_id>/delete", views.delete_report, name="delete_report"),
     path("add/area_activated", views.add_area_activated, name="add_area_activated"),
@@ -1,63 +1,54 @@
 import datetime
-import pandas as pd
+import tempfile
 import zipfile
-from django.utils import timezone
-from django.forms import inlineformset_factory
-from io import BytesIO
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, Http404, HttpResponseNotAllowed
 from django.shortcuts import render, get_object_or_404, redirect, reverse, HttpResponse
 from django.contrib.auth.decorators import login_required, permission_required
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext as _, get_language
 from django.contrib import messages
 from django.db.models import Q
 from django.utils.timezone import now
 
 from metrics.models import Metric, Project
-from report.models import Editor, Organizer, Partner, \
-    Funding, Technology, Report, AreaActivated, Activity, OperationReport
-from users.models import UserProfile
-from report.forms import NewReportForm, AreaActivatedForm, FundingForm, PartnerForm, TechnologyForm, OperationForm,\
-    OperationUpdateFormSet
+from metrics.rollups import defer_rollup_updates
+from report.exports import export_table, write_csv, ExcelWorkbook
+from report.jobs import EXPORT_JOBS, enqueue_export, export_file_path
+from report.participants import split_lines, parse_organizers, resolve_editors, resolve_organizers
+from report.models import Partner, \
+    Funding, Technology, Report, AreaActivated, Activity, OperationReport, ExportJob
+from users.models import TeamArea
+from report.forms import NewReportForm, AreaActivatedForm, FundingForm, PartnerForm, TechnologyForm, \
+    OperationUpdateFormSet, ReportListForm, operation_formset
+from report.choices import OPERATION_METRICS, get_choice_trees
+from report.persistence import save_report
+from users.idempotency import idempotent
 
 
 # CREATE
 @login_required
 @permission_required("report.add_report")
+@idempotent
+@defer_rollup_updates()
 def add_report(request):
     report_form = NewReportForm(request.POST or None, user=request.user)
     directions_related_set = list(map(int, report_form.data.getlist('directions_related', [])))
     learning_questions_related_set = list(map(int, report_form.data.getlist('learning_questions_related', [])))
     metrics_set = list(map(int, report_form.data.getlist('metrics_related', [])))
-    operation_formset = get_operation_formset()
+    operation_metrics_list, = get_choice_trees(OPERATION_METRICS)
+    operation_formset = get_operation_formset(operation_metrics_list)
     if request.method == "POST":
-        timediff = timezone.now() - datetime.timedelta(hours=24)
-        report_exists = Report.objects.filter(created_by__user=request.user, description=report_form.data.get("description"), created_at__gte=timediff).exists()
+        # Submitting the same form again is answered by idempotent with the redirect to the report already saved
         operation_metrics = operation_formset(request.POST, prefix='Operation')
-        if not report_exists:
-            if report_form.is_valid() and operation_metrics.is_valid():
-                report = report_form.save(user=request.user, is_update=False)
-                instances = operation_metrics.save(commit=False)
-
-                operation_metrics_related = []
-                for instance in instances:
-                    instance.report = report
-                    instance.save()
-                    numbers = instance.number_of_people_reached_through_social_media + instance.number_of_new_followers + instance.number_of_mentions + instance.number_of_community_communications + instance.number_of_events + instance.number_of_resources + instance.number_of_partnerships_activated + instance.number_of_new_partnerships
-                    if numbers > 0:
-                        operation_metrics_related.append(instance.metric)
-
-                report.metrics_related.add(*operation_metrics_related)
-                report.save()
-
-                messages.success(request, _("Report registered successfully!"))
-                return redirect(reverse("report:detail_report", kwargs={"report_id": report.id}))
-            else:
-                messages.error(request, _("Something went wrong!"))
-                for field, error in report_form.errors.items():
-                    messages.error(request, field + ": " + error[0])
+        if report_form.is_valid() and operation_metrics.is_valid():
+            report = save_report(report_form, operation_metrics, request.user)
+
+            messages.success(request, _("Report registered successfully!"))
+            return redirect(reverse("report:detail_report", kwargs={"report_id": report.id}))
         else:
-            messages.error(request, _("It seems that you already submitted this report!"))
-            messages.error(request, str(request.user) + ":" + report_form.data.get("description") + ":" + str(timediff))
+            messages.error(request, _("Something went wrong!"))
+            for field, error in report_form.errors.items():
+                messages.error(request, field + ": " + error[0])
 
         context = {
             "directions_related_set": directions_related_set,
@@ -69,7 +60,7 @@ def add_report(request):
         }
         return render(request, "report/add_report.html", context)
     else:
-        operation_metrics = operation_formset(prefix="Operation", initial=[{"metric": metric_object} for metric_object in Metric.objects.filter(is_operation=True)])
+        operation_metrics = operation_formset(prefix="Operation", initial=[{"metric": metric_object} for metric_object in operation_metrics_list])
         context = {"directions_related_set": directions_related_set,
                    "learning_questions_related_set": learning_questions_related_set,
                    "metrics_set": metrics_set,
@@ -80,25 +71,21 @@ def add_report(request):
         return render(request, "report/add_report.html", context)
 
 
-def get_operation_formset():
-    return inlineformset_factory(
-        Report,
-        OperationReport,
-        form=OperationForm,
-        fields=('metric',
-                'number_of_people_reached_through_social_media',
-                'number_of_new_followers',
-                'number_of_mentions',
-                'number_of_community_communications',
-                'number_of_events',
-                'number_of_resources',
-                'number_of_partnerships_activated',
-                'number_of_new_partnerships'), extra=Metric.objects.filter(is_operation=True).count(),
-        can_delete=False)
+def get_operation_formset(metrics=None):
+    """
+    Formset class of the operation reports of a new report, with one form for each operation metric.
+
+    :param metrics: Operation metrics. By default, the cached list.
+    :return: Formset class.
+    """
+    if metrics is None:
+        metrics, = get_choice_trees(OPERATION_METRICS)
+    return operation_formset(len(metrics))
 
 
 @login_required
 @permission_required("report.add_areaactivated")
+@idempotent
 def add_area_activated(request):
     area_form = AreaActivatedForm(request.POST or None)
     if request.method == "POST":
@@ -114,6 +101,7 @@ def add_area_activated(request):
 
 @login_required
 @permission_required("report.add_funding")
+@idempotent
 def add_funding(request):
     funding_associated_form = FundingForm(request.POST or None)
     if request.method == "POST":
@@ -129,6 +117,7 @@ def add_funding(request):
 
 @login_required
 @permission_required("report.add_partner")
+@idempotent
 def add_partner(request):
     partner_form = PartnerForm(request.POST or None)
     if request.method == "POST":
@@ -144,6 +133,7 @@ def add_partner(request):
 
 @login_required
 @permission_required("report.add_technology")
+@idempotent
 def add_technology(request):
     technology_form = TechnologyForm(request.POST or None)
     if request.method == "POST":
@@ -168,12 +158,52 @@ def list_reports(request):
 @login_required
 @permission_required("report.view_report")
 def list_reports_of_year(request, year):
-    custom_filter = Q(initial_date__year=year) | Q(end_date__year=year)
-    context = {"dataset": Report.objects.filter(custom_filter).order_by('-created_at'), "mine": False, "title": _("List reports of %(year)s") % {"year": year}, "year": year}
+    # The reports are loaded by the page from list_reports_data, one page at a time
+    context = {"areas": TeamArea.objects.order_by("text"),
+               "activities": Activity.objects.order_by("text"),
+               "page_size": REPORT_PAGE_SIZE,
+               "mine": False, "title": _("List reports of %(year)s") % {"year": year}, "year": year}
 
     return render(request, "report/list_reports.html", context)
 
 
+REPORT_PAGE_SIZE = 50
+
+
+@login_required
+@permission_required("report.view_report")
+def list_reports_data(request, year):
+    """
+    Lists one page of the reports of a year, filtered and sorted by the database.
+
+    :param request: The HTTP request object, with the filters area, activity, start, end and search, the sort and
+                    order of the reports, and the cursor after of the page to read.
+    :param year: Year the reports begin or end in.
+    :return: JsonResponse with the rows of the page and the cursor of the next one, or the errors of the filters.
+    """
+    form = ReportListForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    reports = Report.objects.filter(Q(initial_date__year=year) | Q(end_date__year=year)).select_related(
+        "area_responsible").only("description", "partial_report", "initial_date", "end_date", "created_at",
+                                 "area_responsible__text")
+    reports, next_page = form.page(form.filter(reports), REPORT_PAGE_SIZE)
+
+    rows = [{"id": report.id,
+             "description": report.description,
+             "partial": report.partial_report,
+             "initial_date": report.initial_date.isoformat(),
+             "end_date": (report.end_date or report.initial_date).isoformat(),
+             "area_responsible": report.area_responsible.text,
+             "urls": {"view": reverse("report:detail_report", kwargs={"report_id": report.id}),
+                      "update": reverse("report:update_report", kwargs={"report_id": report.id}),
+                      "delete": reverse("report:delete_report", kwargs={"report_id": report.id}),
+                      "export": reverse("report:export_report", kwargs={"report_id": report.id})}}
+            for report in reports]
+    return JsonResponse({"rows": rows, "next": next_page})
+
+
 @login_required
 @permission_required("report.view_report")
 def detail_report(request, report_id):
@@ -188,83 +218,226 @@ def detail_report(request, report_id):
     return render(request, "report/detail_report.html", context)
 
 
-def add_csv_file(function_name, report_id=None, custom_query=None):
-    csv_file = BytesIO()
-    function_name(report_id, custom_query).to_csv(path_or_buf=csv_file, index=False)
-
-    return csv_file
-
+EXPORT_SPOOL_SIZE = 10 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+
+class ZipStream:
+    """
+    Write-only file that hands over what was written to it, so a zip file can be sent while it is being built.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip_file(files, report_id, custom_query, sub_directory, posfix, with_excel=True, progress=None):
+    """
+    Builds the zip file of an export member by member, yielding its bytes as soon as each member is written.
+
+    Each table is written to its CSV member straight from its rows. When the Excel workbook is asked for, each row is
+    also written to its sheet as it goes, so no table is kept in memory, and the workbook is spooled to a temporary
+    file and added last.
+
+    :param files: List of (export function, name of the table) pairs.
+    :param report_id: ID of the report to export, if any.
+    :param custom_query: Q object applied to the reports.
+    :param sub_directory: Directory of the CSV files inside the zip file.
+    :param posfix: Suffix of the file names.
+    :param with_excel: Whether to add the Excel workbook.
+    :param progress: Function called with the number of tables written and the number of tables, if any.
+    :return: Generator of bytes.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode="w") as zip_file, \
+            tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as excel_file:
+        workbook = ExcelWorkbook(excel_file) if with_excel else None
+
+        for index, (function, name) in enumerate(files, start=1):
+            sheet = workbook.add_sheet(name) if with_excel else None
+            with zip_file.open(sub_directory + name + posfix + '.csv', mode="w", force_zip64=True) as csv_file:
+                write_csv(csv_file, function, report_id, custom_query, sheet)
+            yield stream.drain()
+            if progress:
+                progress(index, len(files))
+
+        if with_excel:
+            workbook.close()
+            excel_file.seek(0)
+            with zip_file.open('Export' + posfix + '.xlsx', mode="w", force_zip64=True) as zipped_excel_file:
+                for chunk in iter(lambda: excel_file.read(EXPORT_CHUNK_SIZE), b""):
+                    zipped_excel_file.write(chunk)
+                    yield stream.drain()
+    yield stream.drain()
+
+
+def build_report_export(report_id=None, year=None, with_excel=True, progress=None):
+    """
+    Name and content of the zip file exporting the reports.
+
+    :param report_id: ID of the report to export. If None, every report is exported.
+    :param year: Year of the reports to export, if any.
+    :param with_excel: Whether to add the Excel workbook.
+    :param progress: Function called with the number of tables written and the number of tables, if any.
+    :return: (file name, generator of bytes) tuple.
+    """
+    sub_directory = "csv/"
 
-def add_excel_file(report_id=None, custom_query=None):
-    excel_file = BytesIO()
-    writer = pd.ExcelWriter(excel_file, engine='xlsxwriter')
-
-    export_report_instance(report_id, custom_query).to_excel(writer, sheet_name='Report', index=False)
-    export_operation_report(report_id, custom_query).to_excel(writer, sheet_name='Operation report', index=False)
-    export_metrics(report_id, custom_query).to_excel(writer, sheet_name='Metrics', index=False)
-    export_user_profile(report_id, custom_query).to_excel(writer, sheet_name='Users', index=False)
-    export_area_activated(report_id, custom_query).to_excel(writer, sheet_name='Areas', index=False)
-    export_directions_related(report_id, custom_query).to_excel(writer, sheet_name='Directions', index=False)
-    export_editors(report_id, custom_query).to_excel(writer, sheet_name='Editors', index=False)
-    export_funding(report_id, custom_query).to_excel(writer, sheet_name='Fundings', index=False)
-    export_learning_questions_related(report_id, custom_query).to_excel(writer, sheet_name='Learning questions', index=False)
-    export_organizers(report_id, custom_query).to_excel(writer, sheet_name='Organizers', index=False)
-    export_partners_activated(report_id, custom_query).to_excel(writer, sheet_name='Partners', index=False)
-    export_technologies_used(report_id, custom_query).to_excel(writer, sheet_name='Technologies', index=False)
+    if report_id:
+        zip_name = _("Report")
+        identifier = " {}".format(report_id)
+    else:
+        zip_name = _("SARA - Reports")
+        identifier = ""
 
-    writer.close()
-    return excel_file
+    if year:
+        custom_query = Q(initial_date__year=year) | Q(end_date__year=year)
+    else:
+        custom_query = Q()
+
+    posfix = identifier + " - {}".format(datetime.datetime.today().strftime('%Y-%m-%d'))
+    files = [[export_report_instance, 'Report'],
+             [export_operation_report, 'Operation report'],
+             [export_metrics, 'Metrics'],
+             [export_user_profile, 'Users'],
+             [export_area_activated, 'Areas'],
+             [export_directions_related, 'Directions'],
+             [export_editors, 'Editors'],
+             [export_funding, 'Fundings'],
+             [export_learning_questions_related, 'Learning questions'],
+             [export_organizers, 'Organizers'],
+             [export_partners_activated, 'Partners'],
+             [export_technologies_used, 'Technologies']]
+
+    return zip_name + posfix + '.zip', stream_zip_file(files, report_id, custom_query, sub_directory, posfix,
+                                                        with_excel, progress)
 
 
 @login_required
 @permission_required("report.view_report")
 def export_report(request, report_id=None, year=None):
     if Report.objects.count():
-        buffer = BytesIO()
-        zip_file = zipfile.ZipFile(buffer, mode="w")
-        sub_directory = "csv/"
-
-        if report_id:
-            zip_name = _("Report")
-            identifier = " {}".format(report_id)
-        else:
-            zip_name = _("SARA - Reports")
-            identifier = ""
-
-        if year:
-            custom_query = Q(initial_date__year=year) | Q(end_date__year=year)
-        else:
-            custom_query = Q()
-
-        posfix = identifier + " - {}".format(datetime.datetime.today().strftime('%Y-%m-%d'))
-        files = [[export_report_instance, sub_directory + 'Report' + posfix],
-                 [export_operation_report, sub_directory + 'Operation report' + posfix],
-                 [export_metrics, sub_directory + 'Metrics' + posfix],
-                 [export_user_profile, sub_directory + 'Users' + posfix],
-                 [export_area_activated, sub_directory + 'Areas' + posfix],
-                 [export_directions_related, sub_directory + 'Directions' + posfix],
-                 [export_learning_questions_related, sub_directory + 'Learning questions' + posfix],
-                 [export_funding, sub_directory + 'Fundings' + posfix],
-                 [export_editors, sub_directory + 'Editors' + posfix],
-                 [export_organizers, sub_directory + 'Organizers' + posfix],
-                 [export_partners_activated, sub_directory + 'Partners' + posfix],
-                 [export_technologies_used, sub_directory + 'Technologies' + posfix]]
-
-        for file in files:
-            zip_file.writestr('{}.csv'.format(file[1]), add_csv_file(file[0], report_id, custom_query).getvalue())
-        zip_file.writestr('Export' + posfix + '.xlsx', add_excel_file(report_id, custom_query).getvalue())
-
-        zip_file.close()
-
-        response = HttpResponse(buffer.getvalue())
+        file_name, content = build_report_export(report_id, year, request.GET.get("format") != "csv")
+        response = StreamingHttpResponse(content)
         response['Content-Type'] = 'application/x-zip-compressed'
-        response['Content-Disposition'] = 'attachment; filename=' + zip_name + posfix + '.zip'
+        response['Content-Disposition'] = 'attachment; filename=' + file_name
 
         return response
     else:
         return redirect(reverse("report:list_reports"))
 
 
+def export_job_status(job):
+    status = {"id": job.pk,
+              "kind": job.kind,
+              "status": job.status,
+              "progress": job.progress,
+              "created_at": job.created_at,
+              "finished_at": job.finished_at,
+              "url": reverse("report:show_export_job", kwargs={"job_id": job.pk})}
+    if job.status == ExportJob.Status.DONE:
+        status["download_url"] = reverse("report:download_export_job", kwargs={"job_id": job.pk})
+    return status
+
+
+def check_export_permission(user, kind):
+    if kind not in EXPORT_JOBS:
+        raise Http404
+    if not user.has_perm(EXPORT_JOBS[kind][0]):
+        raise PermissionDenied
+
+
+@login_required
+def queue_export(request, kind):
+    """
+    Queues an export to be built by the export worker, merging it with an identical export not finished yet.
+
+    The reports export accepts the "report_id", "year" and "format" parameters of the synchronous export.
+
+    :param request: POST request.
+    :param kind: Kind of the export, one of ExportJob.Kind.
+    :return: JsonResponse with the status of the job.
+    """
+    check_export_permission(request.user, kind)
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    parameters = {"language": get_language()}
+    if kind == ExportJob.Kind.REPORT:
+        try:
+            parameters["report_id"] = int(request.POST["report_id"]) if request.POST.get("report_id") else None
+            parameters["year"] = int(request.POST["year"]) if request.POST.get("year") else None
+        except ValueError:
+            return JsonResponse({"error": _("Invalid parameters")}, status=400)
+        parameters["format"] = "csv" if request.POST.get("format") == "csv" else "xlsx"
+
+    job, created = enqueue_export(kind, parameters, getattr(request.user, "userprofile", None))
+    return JsonResponse(export_job_status(job), status=202 if created else 200)
+
+
+@login_required
+def show_export_job(request, job_id):
+    job = get_object_or_404(ExportJob, pk=job_id)
+    check_export_permission(request.user, job.kind)
+
+    return JsonResponse(export_job_status(job))
+
+
+@login_required
+def download_export_job(request, job_id):
+    job = get_object_or_404(ExportJob, pk=job_id, status=ExportJob.Status.DONE)
+    check_export_permission(request.user, job.kind)
+
+    try:
+        export_file = open(export_file_path(job), "rb")
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(export_file, as_attachment=True, filename=job.file_name, content_type=job.content_type)
+
+
+# Many-to-many fields of the reports exported as lists of ids
+REPORT_EXPORT_RELATIONS = ["area_activated", "funding_associated", "editors", "organizers", "partners_activated",
+                           "technologies_used", "directions_related", "learning_questions_related", "metrics_related"]
+
+REPORT_EXPORT_WIKIMEDIA_FIELDS = [project + suffix for project in
+                                  ["wikipedia", "commons", "wikidata", "wikiversity", "wikibooks", "wikisource",
+                                   "wikinews", "wikiquote", "wiktionary", "wikivoyage", "wikispecies", "metawiki",
+                                   "mediawiki"] for suffix in ["_created", "_edited"]]
+
+
+def related_ids_per_report(reports, field_name):
+    """
+    Ids of the objects related to many reports through a many-to-many field, with a single query.
+
+    :param reports: Queryset of reports.
+    :param field_name: Name of the many-to-many field of the reports.
+    :return: Dictionary of report id to the related ids joined by "; ".
+    """
+    field = Report._meta.get_field(field_name)
+    through = field.remote_field.through
+    report_column = through._meta.get_field(field.m2m_field_name()).attname
+    related_column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+    ids = {}
+    rows = through.objects.filter(**{report_column + "__in": reports.values("id")}).order_by(
+        report_column, related_column).values_list(report_column, related_column)
+    for report_id, related_id in rows:
+        ids.setdefault(report_id, []).append(str(related_id))
+    return {report_id: "; ".join(related) for report_id, related in ids.items()}
+
+
+@export_table(key=(0,))
 def export_report_instance(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Created by'), _('Created at'), _('Modified by'), _('Modified at'), _('Activity associated'),
               _('Name of the activity'), _('Area responsible'), _('Area activated'), _('Initial date'), _('End date'),
@@ -291,119 +464,30 @@ def export_report_instance(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        # Database
-        id_ = report.id
-        created_by = report.created_by.id
-        created_at = report.created_at
-        modified_by = report.modified_by.id
-        modified_at = report.modified_at
-
-        # Administrative
-        activity_associated = report.activity_associated.id
-        activity_name = report.activity_associated.text or ""
-        area_responsible = report.area_responsible.id
-        if report.area_activated.exists():
-            area_activated = "; ".join(map(str, report.area_activated.values_list("id", flat=True)))
-        else:
-            area_activated = ""
-        initial_date = report.initial_date
-        end_date = report.end_date
-        description = report.description
-        if report.funding_associated.exists():
-            funding_associated = "; ".join(map(str, report.funding_associated.values_list("id", flat=True)))
-        else:
-            funding_associated = ""
-        links = report.links.replace("\r\n", "; ")
-        public_communication = report.public_communication
-
-        # Quantitative
-        participants = report.participants
-        # resources = report.resources
-        feedbacks = report.feedbacks
-        if report.editors.exists():
-            editors = "; ".join(map(str, report.editors.values_list("id", flat=True)))
-        else:
-            editors = ""
-        if report.organizers.exists():
-            organizers = "; ".join(map(str, report.organizers.values_list("id", flat=True)))
-        else:
-            organizers = ""
-        if report.partners_activated.exists():
-            partners_activated = "; ".join(map(str, report.partners_activated.values_list("id", flat=True)))
-        else:
-            partners_activated = ""
-        if report.technologies_used.exists():
-            technologies_used = "; ".join(map(str, report.technologies_used.values_list("id", flat=True)))
-        else:
-            technologies_used = ""
-
-        # Wikimedia
-        wikipedia_created = report.wikipedia_created
-        wikipedia_edited = report.wikipedia_edited
-        commons_created = report.commons_created
-        commons_edited = report.commons_edited
-        wikidata_created = report.wikidata_created
-        wikidata_edited = report.wikidata_edited
-        wikiversity_created = report.wikiversity_created
-        wikiversity_edited = report.wikiversity_edited
-        wikibooks_created = report.wikibooks_created
-        wikibooks_edited = report.wikibooks_edited
-        wikisource_created = report.wikisource_created
-        wikisource_edited = report.wikisource_edited
-        wikinews_created = report.wikinews_created
-        wikinews_edited = report.wikinews_edited
-        wikiquote_created = report.wikiquote_created
-        wikiquote_edited = report.wikiquote_edited
-        wiktionary_created = report.wiktionary_created
-        wiktionary_edited = report.wiktionary_edited
-        wikivoyage_created = report.wikivoyage_created
-        wikivoyage_edited = report.wikivoyage_edited
-        wikispecies_created = report.wikispecies_created
-        wikispecies_edited = report.wikispecies_edited
-        metawiki_created = report.metawiki_created
-        metawiki_edited = report.metawiki_edited
-        mediawiki_created = report.mediawiki_created
-        mediawiki_edited = report.mediawiki_edited
-
-        # Strategy
-        if report.directions_related.exists():
-            directions_related = "; ".join(map(str, report.directions_related.values_list("id", flat=True)))
-        else:
-            directions_related = ""
-        learning = report.learning.replace("\r\n", "\n")
-
-        # Theory
-        if report.learning_questions_related.exists():
-            learning_questions_related = "; ".join(map(str, report.learning_questions_related.values_list("id", flat=True)))
-        else:
-            learning_questions_related = ""
-
-        # Metrics
-        if report.metrics_related.exists():
-            metrics_related = "; ".join(map(str, report.metrics_related.values_list("id", flat=True)))
-        else:
-            metrics_related = ""
-
-        rows.append([id_, created_by, created_at, modified_by, modified_at, activity_associated, activity_name,
-                     area_responsible, area_activated, initial_date, end_date, description, funding_associated, links,
-                     public_communication, participants, feedbacks, editors, organizers, partners_activated,
-                     technologies_used, wikipedia_created, wikipedia_edited, commons_created, commons_edited,
-                     wikidata_created, wikidata_edited, wikiversity_created, wikiversity_edited, wikibooks_created,
-                     wikibooks_edited, wikisource_created, wikisource_edited, wikinews_created, wikinews_edited,
-                     wikiquote_created, wikiquote_edited, wiktionary_created, wiktionary_edited, wikivoyage_created,
-                     wikivoyage_edited, wikispecies_created, wikispecies_edited, metawiki_created, metawiki_edited,
-                     mediawiki_created, mediawiki_edited, directions_related, learning, learning_questions_related,
-                     metrics_related])
-
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-
-    df[_('Created at')] = df[_('Created at')].dt.tz_localize(None)
-    df[_('Modified at')] = df[_('Modified at')].dt.tz_localize(None)
-    return df
-
-
+    related_ids = {field: related_ids_per_report(reports, field) for field in REPORT_EXPORT_RELATIONS}
+    fields = ["id", "created_by_id", "created_at", "modified_by_id", "modified_at", "activity_associated_id",
+              "activity_associated__text", "area_responsible_id", "initial_date", "end_date", "description", "links",
+              "public_communication", "participants", "feedbacks", "learning"] + REPORT_EXPORT_WIKIMEDIA_FIELDS
+
+    def rows():
+        for report in reports.values(*fields).iterator():
+            related = {field: ids.get(report["id"], "") for field, ids in related_ids.items()}
+            yield ([report["id"], report["created_by_id"], report["created_at"].replace(tzinfo=None),
+                    report["modified_by_id"], report["modified_at"].replace(tzinfo=None),
+                    report["activity_associated_id"], report["activity_associated__text"] or "",
+                    report["area_responsible_id"], related["area_activated"], report["initial_date"],
+                    report["end_date"], report["description"], related["funding_associated"],
+                    report["links"].replace("\r\n", "; "), report["public_communication"], report["participants"],
+                    report["feedbacks"], related["editors"], related["organizers"], related["partners_activated"],
+                    related["technologies_used"]]
+                   + [report[field] for field in REPORT_EXPORT_WIKIMEDIA_FIELDS]
+                   + [related["directions_related"], report["learning"].replace("\r\n", "\n"),
+                      related["learning_questions_related"], related["metrics_related"]])
+
+    return header, rows()
+
+
+@export_table(key=(0,))
 def export_operation_report(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Report ID'), _('Metric ID'), _('Metric'), _('Number of people reached through social media'),
               _('Number of new followers'), _('Number of mentions'), _('Number of community communications'),
@@ -416,25 +500,25 @@ def export_operation_report(report_id=None, custom_query=Q()):
         reports = Report.objects.filter(custom_query)
         operation_reports = OperationReport.objects.filter(report_id__in=reports.values_list("id", flat=True))
 
-    rows = []
-    for operation_report in operation_reports:
-        rows.append([operation_report.id,
-                     operation_report.report_id,
-                     operation_report.metric_id,
-                     operation_report.metric.text,
-                     operation_report.number_of_people_reached_through_social_media,
-                     operation_report.number_of_new_followers,
-                     operation_report.number_of_mentions,
-                     operation_report.number_of_community_communications,
-                     operation_report.number_of_events,
-                     operation_report.number_of_resources,
-                     operation_report.number_of_partnerships_activated,
-                     operation_report.number_of_new_partnerships])
-
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
-
-
+    def rows():
+        for operation_report in operation_reports.select_related("metric").iterator():
+            yield [operation_report.id,
+                   operation_report.report_id,
+                   operation_report.metric_id,
+                   operation_report.metric.text,
+                   operation_report.number_of_people_reached_through_social_media,
+                   operation_report.number_of_new_followers,
+                   operation_report.number_of_mentions,
+                   operation_report.number_of_community_communications,
+                   operation_report.number_of_events,
+                   operation_report.number_of_resources,
+                   operation_report.number_of_partnerships_activated,
+                   operation_report.number_of_new_partnerships]
+
+    return header, rows()
+
+
+@export_table(key=(0,))
 def export_metrics(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Metric'), _('Activity ID'), _('Activity'), _('Activity code'), _('Number of editors'),
               _('Number of participants'), _('Number of partnerships activated'), _('Number of feedbacks'),
@@ -452,28 +536,28 @@ def export_metrics(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        if report.activity_associated:
-            for instance in report.activity_associated.metrics.all():
-                rows.append([instance.id, instance.text, instance.activity_id, instance.activity.text,
-                             instance.activity.code, instance.number_of_editors, instance.number_of_participants,
-                             instance.number_of_partnerships_activated, instance.number_of_feedbacks,
-                             instance.number_of_events, instance.other_type, instance.observation,
-                             instance.wikipedia_created, instance.wikipedia_edited, instance.commons_created,
-                             instance.commons_edited, instance.wikidata_created, instance.wikidata_edited,
-                             instance.wikiversity_created, instance.wikiversity_edited, instance.wikibooks_created,
-                             instance.wikibooks_edited, instance.wikisource_created, instance.wikisource_edited,
-                             instance.wikinews_created, instance.wikinews_edited, instance.wikiquote_created,
-                             instance.wikiquote_edited, instance.wiktionary_created, instance.wiktionary_edited,
-                             instance.wikivoyage_created, instance.wikivoyage_edited, instance.wikispecies_created,
-                             instance.wikispecies_edited, instance.metawiki_created, instance.metawiki_edited,
-                             instance.mediawiki_created, instance.mediawiki_edited])
-
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
-
-
+    def rows():
+        for report in reports.select_related("activity_associated"):
+            if report.activity_associated:
+                for instance in report.activity_associated.metrics.select_related("activity"):
+                    yield [instance.id, instance.text, instance.activity_id, instance.activity.text,
+                           instance.activity.code, instance.number_of_editors, instance.number_of_participants,
+                           instance.number_of_partnerships_activated, instance.number_of_feedbacks,
+                           instance.number_of_events, instance.other_type, instance.observation,
+                           instance.wikipedia_created, instance.wikipedia_edited, instance.commons_created,
+                           instance.commons_edited, instance.wikidata_created, instance.wikidata_edited,
+                           instance.wikiversity_created, instance.wikiversity_edited, instance.wikibooks_created,
+                           instance.wikibooks_edited, instance.wikisource_created, instance.wikisource_edited,
+                           instance.wikinews_created, instance.wikinews_edited, instance.wikiquote_created,
+                           instance.wikiquote_edited, instance.wiktionary_created, instance.wiktionary_edited,
+                           instance.wikivoyage_created, instance.wikivoyage_edited, instance.wikispecies_created,
+                           instance.wikispecies_edited, instance.metawiki_created, instance.metawiki_edited,
+                           instance.mediawiki_created, instance.mediawiki_edited]
+
+    return header, rows()
+
+
+@export_table(key=(0,))
 def export_user_profile(report_id=None, custom_query=Q()):
     header = [_('ID'), _('First name'), _('Last Name'), _('Username on Wiki (WMB)'), _('Username on Wiki'),
               _('Photograph'), _('Position'), _('Twitter'), _('Facebook'), _('Instagram'), _('Email'),
@@ -484,30 +568,30 @@ def export_user_profile(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in [report.created_by, report.modified_by]:
-            rows.append([instance.id,
-                         instance.user.first_name or "",
-                         instance.user.last_name or "",
-                         instance.professional_wiki_handle or "",
-                         instance.personal_wiki_handle or "",
-                         instance.photograph or "",
-                         instance.position or "",
-                         instance.twitter or "",
-                         instance.facebook or "",
-                         instance.instagram or "",
-                         instance.user.email or "",
-                         instance.wikidata_item or "",
-                         instance.linkedin or "",
-                         instance.lattes or "",
-                         instance.orcid or "",
-                         instance.google_scholar or ""])
-
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
-
-
+    def rows():
+        for report in reports.select_related("created_by__user", "modified_by__user"):
+            for instance in [report.created_by, report.modified_by]:
+                yield [instance.id,
+                       instance.user.first_name or "",
+                       instance.user.last_name or "",
+                       instance.professional_wiki_handle or "",
+                       instance.personal_wiki_handle or "",
+                       instance.photograph or "",
+                       instance.position or "",
+                       instance.twitter or "",
+                       instance.facebook or "",
+                       instance.instagram or "",
+                       instance.user.email or "",
+                       instance.wikidata_item or "",
+                       instance.linkedin or "",
+                       instance.lattes or "",
+                       instance.orcid or "",
+                       instance.google_scholar or ""]
+
+    return header, rows()
+
+
+@export_table(key=(0,))
 def export_funding(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Funding'), _('Value'), _('Project ID'), _('Project'), _('Active?'), _('Type of project')]
 
@@ -517,25 +601,25 @@ def export_funding(report_id=None, custom_query=Q()):
         reports = Report.objects.filter(custom_query)
         fundings = Funding.objects.filter(funding_associated__in = reports.values_list("id", flat=True))
 
-    rows = []
-    for funding in fundings:
-        type_of_funding = _("Ordinary")
-        if funding.project.current_poa:
-            type_of_funding = _("Current Plan of Activities")
-        elif funding.project.main_funding:
-            type_of_funding = _("Main funding")
-        rows.append([funding.id,
-                     funding.name,
-                     funding.value,
-                     funding.project_id,
-                     funding.project.text,
-                     funding.project.active,
-                     type_of_funding])
-
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
-
-
+    def rows():
+        for funding in fundings.select_related("project"):
+            type_of_funding = _("Ordinary")
+            if funding.project.current_poa:
+                type_of_funding = _("Current Plan of Activities")
+            elif funding.project.main_funding:
+                type_of_funding = _("Main funding")
+            yield [funding.id,
+                   funding.name,
+                   funding.value,
+                   funding.project_id,
+                   funding.project.text,
+                   funding.project.active,
+                   type_of_funding]
+
+    return header, rows()
+
+
+@export_table(key=None)
 def export_area_activated(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Area activated'), _('Contact')]
 
@@ -544,16 +628,16 @@ def export_area_activated(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        rows.append([report.area_responsible.id, report.area_responsible.text, AreaActivated.objects.get(text=report.area_responsible.text).contact])
-        for instance in report.area_activated.all():
-            rows.append([instance.id, instance.text, instance.contact])
+    def rows():
+        for report in reports.select_related("area_responsible"):
+            yield [report.area_responsible.id, report.area_responsible.text, AreaActivated.objects.get(text=report.area_responsible.text).contact]
+            for instance in report.area_activated.all():
+                yield [instance.id, instance.text, instance.contact]
 
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    return header, rows()
 
 
+@export_table(key=(0,))
 def export_directions_related(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Direction related'), _('Strategic axis ID'), _('Strategic axis text')]
 
@@ -562,15 +646,15 @@ def export_directions_related(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in report.directions_related.all():
-            rows.append([instance.id, instance.text, instance.strategic_axis_id, instance.strategic_axis.text])
+    def rows():
+        for report in reports:
+            for instance in report.directions_related.select_related("strategic_axis"):
+                yield [instance.id, instance.text, instance.strategic_axis_id, instance.strategic_axis.text]
 
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    return header, rows()
 
 
+@export_table(key=(0,))
 def export_editors(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Username'), _('Number of reports including this editor')]
 
@@ -579,15 +663,15 @@ def export_editors(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in report.editors.all():
-            rows.append([instance.id, instance.username, instance.editors.count()])
+    def rows():
+        for report in reports:
+            for instance in report.editors.all():
+                yield [instance.id, instance.username, instance.editors.count()]
 
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    return header, rows()
 
 
+@export_table(key=(0,))
 def export_learning_questions_related(report_id=None, custom_query=Q()):
     header = [_('ID'), _('Learning question'), _('Learning area ID'), _('Learning area')]
 
@@ -596,15 +680,15 @@ def export_learning_questions_related(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in report.learning_questions_related.all():
-            rows.append([instance.id, instance.text, instance.learning_area_id, instance.learning_area.text])
+    def rows():
+        for report in reports:
+            for instance in report.learning_questions_related.select_related("learning_area"):
+                yield [instance.id, instance.text, instance.learning_area_id, instance.learning_area.text]
 
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    return header, rows()
 
 
+@export_table(key=(0,))
 def export_organizers(report_id=None, custom_query=Q()):
     header = [_('ID'), _("Organizer's name"), _("Organizer's institution ID"), _("Organizer institution's name"), _('Number of reports including this organizer')]
 
@@ -613,15 +697,15 @@ def export_organizers(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in report.organizers.all():
-            rows.append([instance.id, instance.name, ";".join(map(str, instance.institution.values_list("id", flat=True))), ";".join(map(str, instance.institution.values_list("name", flat=True))),instance.organizers.count()])
+    def rows():
+        for report in reports:
+            for instance in report.organizers.all():
+                yield [instance.id, instance.name, ";".join(map(str, instance.institution.values_list("id", flat=True))), ";".join(map(str, instance.institution.values_list("name", flat=True))),instance.organizers.count()]
 
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    return header, rows()
 
 
+@export_table(key=(0,))
 def export_partners_activated(report_id=None, custom_query=Q()):
     header = [_('ID'), _("Partners"), _("Partner's website"), _('Number of reports including this partner')]
 
@@ -630,15 +714,15 @@ def export_partners_activated(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in report.partners_activated.all():
-            rows.append([instance.id, instance.name, instance.website, instance.partners.count()])
+    def rows():
+        for report in reports:
+            for instance in report.partners_activated.all():
+                yield [instance.id, instance.name, instance.website, instance.partners.count()]
 
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    return header, rows()
 
 
+@export_table(key=(0,))
 def export_technologies_used(report_id=None, custom_query=Q()):
     header = [_('ID'), _("Technology"), _('Number of reports including this technology')]
 
@@ -647,78 +731,25 @@ def export_technologies_used(report_id=None, custom_query=Q()):
     else:
         reports = Report.objects.filter(custom_query)
 
-    rows = []
-    for report in reports:
-        for instance in report.technologies_used.all():
-            rows.append([instance.id, instance.name, instance.tecnologies.count()])
-
-    df = pd.DataFrame(rows, columns=header).drop_duplicates().reset_index(drop=True)
-    return df
+    def rows():
+        for report in reports:
+            for instance in report.technologies_used.all():
+                yield [instance.id, instance.name, instance.tecnologies.count()]
 
+    return header, rows()
 
 
 # UPDATE
 @login_required
 @permission_required("report.change_report")
+@defer_rollup_updates()
 def update_report(request, report_id):
     obj = get_object_or_404(Report, id=report_id)
     if request.method == "POST":
         report_form = NewReportForm(request.POST or None, instance=obj, user=request.user, is_update=True)
         operation_metrics = OperationUpdateFormSet(request.POST, instance=obj, prefix='Operation')
         if report_form.is_valid() and operation_metrics.is_valid():
-            report_instance = report_form.save(commit=False, is_update=True)
-
-            # Metrics
-            instances = operation_metrics.save()
-
-            metrics_related = list(map(int, report_form.data.getlist('metrics_related', [])))
-            for instance in instances:
-                instance.report = report_instance
-                instance.save()
-                numbers = instance.number_of_people_reached_through_social_media + instance.number_of_new_followers + instance.number_of_mentions + instance.number_of_community_communications + instance.number_of_events + instance.number_of_resources + instance.number_of_partnerships_activated + instance.number_of_new_partnerships
-                if numbers > 0:
-                    metrics_related.append(instance.metric)
-
-            report_instance.metrics_related.set(metrics_related)
-
-            # Editors
-            editors = get_or_create_editors(request.POST["editors_string"])
-            report_instance.editors.set(editors)
-
-            # Organizers
-            organizers = get_or_create_organizers(request.POST["organizers_string"])
-            report_instance.organizers.set(organizers)
-
-            # Modified by and Modified at
-            user_profile = UserProfile.objects.get(user=request.user)
-            report_instance.modified_by = user_profile
-            report_instance.modified_at = datetime.datetime.now()
-
-            # Fundings
-            fundings_associated = report_form.cleaned_data["funding_associated"]
-            report_instance.funding_associated.set(fundings_associated)
-
-            # Areas activated
-            areas_activated = report_form.cleaned_data["area_activated"]
-            report_instance.area_activated.set(areas_activated)
-
-            # Partners
-            partners_activated = report_form.cleaned_data["partners_activated"]
-            report_instance.partners_activated.set(partners_activated)
-
-            # Technologies
-            technologies_used = report_form.cleaned_data["technologies_used"]
-            report_instance.technologies_used.set(technologies_used)
-
-            # Directions
-            directions_related = list(map(int, report_form.data.getlist('directions_related', [])))
-            report_instance.directions_related.set(directions_related)
-
-            # Learning Questions
-            learning_questions_related = list(map(int, report_form.data.getlist('learning_questions_related', [])))
-            report_instance.learning_questions_related.set(learning_questions_related)
-
-            report_instance.save()
+            save_report(report_form, operation_metrics, request.user)
             return redirect(reverse("report:detail_report", kwargs={"report_id": report_id}))
     else:
         report_form = NewReportForm(instance=obj, user=request.user)
@@ -736,6 +767,7 @@ def update_report(request, report_id):
 # DELETE
 @login_required
 @permission_required("report.delete_report")
+@defer_rollup_updates()
 def delete_report(request, report_id):
     report = Report.objects.get(id=report_id)
     context = {"report": report,
@@ -750,31 +782,11 @@ def delete_report(request, report_id):
 
 # FUNCTIONS
 def get_or_create_editors(editors_string):
-    editors_list = editors_string.split("\r\n")
-    editors = []
-    if editors_string:
-        for editor in editors_list:
-            new_editor, created = Editor.objects.get_or_create(username=editor)
-            if new_editor not in editors:
-                editors.append(new_editor)
-
-    return editors
+    return resolve_editors(split_lines(editors_string))
 
 
 def get_or_create_organizers(organizers_string):
-    organizers_list = organizers_string.split("\r\n")
-    organizers = []
-    if organizers_string:
-        for organizer in organizers_list:
-            organizer_name, institution_name = (organizer + ";").split(";", maxsplit=1)
-            new_organizer, new_organizer_created = Organizer.objects.get_or_create(name=organizer_name)
-            if institution_name:
-                for partner_name in institution_name.split(";"):
-                    if partner_name:
-                        partner, partner_created = Partner.objects.get_or_create(name=partner_name)
-                        new_organizer.institution.add(partner)
-                new_organizer.save()
-            organizers.append(new_organizer)
+    organizers, institutions = resolve_organizers(parse_organizers(organizers_string))
     return organizers
 
 
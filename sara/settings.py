@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'metrics.instrumentation.ViewStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -121,6 +122,38 @@ STATIC_URL = 'static/'
 # STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'))
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# API asked for the global registration date of the editors of the reports
+MEDIAWIKI_API_URL = 'https://www.mediawiki.org/w/api.php'
+
+# Files produced by the export jobs, served by the download endpoint of each job
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+
+# Seconds an export job may run before it is taken for the job of a worker that stopped and marked as failed
+EXPORT_JOB_TIMEOUT = 60 * 60
+
+# Seconds the finished export jobs and their files are kept before the export worker deletes them
+EXPORT_RETENTION = 60 * 60 * 24 * 7
+
+# Number of latest requests of each view kept in memory by the instrumentation middleware, and the maximum number of
+# queries of some views. A view over its budget is logged, and fails the tests checking it with QueryBudgetMixin
+VIEW_STATS_WINDOW = 1000
+QUERY_BUDGETS = {
+    'agenda:show_specific_calendar': 4,
+    'agenda:events_feed': 3,
+    'report:list_reports': 8,
+    'report:list_reports_of_year': 8,
+    'report:list_reports_data': 6,
+    'report:detail_report': 20,
+}
+
+# Seconds the tokens of the submitted forms are kept, so a repeated submission gets the response of the first one.
+# The older ones are deleted by the clear_submission_tokens command
+SUBMISSION_TOKEN_TTL = 60 * 60 * 24
+
+# CACHES is left to settings_local. The cached datasets are invalidated by changing data versions kept in the cache,
+# so every worker must share it, as with memcached or redis, or with the database cache after running
+# createcachetable. The default local memory cache is only fit for a single process
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
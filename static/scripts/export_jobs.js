@@ -0,0 +1,58 @@
+// Links with a data-export-url queue their export for the export worker instead of building it while the request
+// waits. The data-export-parameters of the link are posted with it, and the file is downloaded once the job is done.
+// The href of the link is the synchronous export, left for browsers without JavaScript
+(function () {
+    const script = document.currentScript;
+    const pollInterval = 2000;
+
+    function finish(link) {
+        delete link.dataset.exportRunning;
+        link.removeAttribute("aria-busy");
+        link.style.cursor = "";
+    }
+
+    function follow(link, job) {
+        if (job.status === "done") {
+            finish(link);
+            window.location.href = job.download_url;
+        } else if (job.status === "failed") {
+            finish(link);
+            alert(script.dataset.failedMessage);
+        } else {
+            link.title = script.dataset.progressMessage + " " + job.progress + "%";
+            setTimeout(function () {
+                fetch(job.url, {credentials: "same-origin"})
+                    .then(function (response) { return response.json(); })
+                    .then(function (next) { follow(link, next); })
+                    .catch(function () { finish(link); });
+            }, pollInterval);
+        }
+    }
+
+    document.addEventListener("click", function (event) {
+        const link = event.target.closest("a[data-export-url]");
+        if (!link) return;
+        event.preventDefault();
+        // A second click waits for the same job
+        if (link.dataset.exportRunning) return;
+        link.dataset.exportRunning = "true";
+        link.setAttribute("aria-busy", "true");
+        link.style.cursor = "progress";
+
+        fetch(link.dataset.exportUrl, {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {"X-CSRFToken": script.dataset.csrfToken},
+            body: new URLSearchParams(link.dataset.exportParameters || ""),
+        })
+            .then(function (response) {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.json();
+            })
+            .then(function (job) { follow(link, job); })
+            .catch(function () {
+                finish(link);
+                alert(script.dataset.failedMessage);
+            });
+    });
+})();
@@ -0,0 +1,108 @@
+import functools
+import json
+import re
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils import timezone
+
+from users.models import SubmissionToken
+
+TOKEN_FIELD = "submission_token"
+TOKEN_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+DEFAULT_TTL = 60 * 60 * 24
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def submission_token(request):
+    """
+    Token sent with a form, or None if the request has none or it is malformed.
+
+    :param request: The HTTP request object.
+    :return: Token or None.
+    """
+    token = request.POST.get(TOKEN_FIELD, "")
+    return token if request.method == "POST" and TOKEN_PATTERN.match(token) else None
+
+
+def is_completed(response):
+    """
+    Whether a response ends a submission: a redirect after saving a form, or the JSON of the row created. Forms with
+    errors are not completed, so they can be submitted again with the same token once corrected.
+
+    :param response: Response of a view.
+    :return: Boolean.
+    """
+    if response.status_code in (301, 302, 303):
+        return True
+    if isinstance(response, JsonResponse) and response.status_code == 200:
+        return json.loads(response.content).get("id") is not None
+    return False
+
+
+def stored_response(record):
+    if record.location:
+        return HttpResponseRedirect(record.location)
+    return HttpResponse(record.content, status=record.status, content_type="application/json")
+
+
+def idempotent(view):
+    """
+    Answers the submissions of a form sharing its token with the response of the first one, without running the view
+    again.
+
+    The token is claimed in the same transaction as the view, so two submissions running at the same time cannot both
+    save the form: the unique index makes the second one wait for the first. Requests without a token run the view
+    as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = submission_token(request)
+        if token is None:
+            return view(request, *args, **kwargs)
+
+        record = SubmissionToken.objects.filter(user=request.user, token=token).first()
+        if record:
+            return stored_response(record)
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = SubmissionToken.objects.create(user=request.user, token=token, path=request.path)
+            except IntegrityError:
+                record = None
+
+            if record:
+                response = view(request, *args, **kwargs)
+                if is_completed(response):
+                    redirect = response.status_code != 200
+                    record.status = response.status_code
+                    record.location = response["Location"] if redirect else ""
+                    record.content = "" if redirect else response.content.decode("utf-8")
+                    record.save(update_fields=["status", "location", "content"])
+                else:
+                    record.delete()
+                return response
+
+        # Another submission with the same token was saved first, unless it failed in the meantime
+        record = SubmissionToken.objects.filter(user=request.user, token=token).first()
+        return stored_response(record) if record else HttpResponse(status=409)
+
+    return wrapper
+
+
+def clear_submission_tokens(ttl=None):
+    """
+    Deletes the tokens older than their time to live, SUBMISSION_TOKEN_TTL seconds by default.
+
+    :param ttl: Time to live in seconds.
+    :return: Number of tokens deleted.
+    """
+    ttl = ttl if ttl is not None else getattr(settings, "SUBMISSION_TOKEN_TTL", DEFAULT_TTL)
+    deleted, _ = SubmissionToken.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+    return deleted
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.idempotency import clear_submission_tokens
+
+
+class Command(BaseCommand):
+    help = "Deletes the tokens of the forms submitted longer ago than SUBMISSION_TOKEN_TTL seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl", type=int, help="Time to live of the tokens in seconds")
+
+    def handle(self, *args, **options):
+        deleted = clear_submission_tokens(options["ttl"])
+        self.stdout.write(self.style.SUCCESS("{} submission tokens deleted".format(deleted)))
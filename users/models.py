@@ -82,3 +82,24 @@ class UserProfile(models.Model):
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+
+class SubmissionToken(models.Model):
+    # Token of a form already submitted, with the response it got, so a repeated submission gets the same response
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="submission_tokens")
+    token = models.CharField(max_length=32)
+    path = models.CharField(max_length=255)
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    location = models.CharField(max_length=2048, blank=True)
+    content = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("Submission token")
+        verbose_name_plural = _("Submission tokens")
+        constraints = [
+            models.UniqueConstraint(fields=["user", "token"], name="unique_submission_token"),
+        ]
+
+    def __str__(self):
+        return "{} - {}".format(self.path, self.token)
@@ -0,0 +1,12 @@
+from django import template
+from django.utils.html import format_html
+
+from users.idempotency import TOKEN_FIELD, new_token
+
+register = template.Library()
+
+
+@register.simple_tag
+def submission_token():
+    # Each rendering of a form gets its own token, so submitting it twice saves it once
+    return format_html('<input type="hidden" name="{}" value="{}">', TOKEN_FIELD, new_token())
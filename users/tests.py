@@ -7,10 +7,14 @@ from django.contrib.auth.admin import User
 from django.test.client import RequestFactory
 from django.contrib.admin.sites import AdminSite
 from django.utils.translation import gettext as _
-from .models import TeamArea, Position, UserProfile
+from .models import TeamArea, Position, UserProfile, SubmissionToken
 from .admin import AccountUserAdmin, UserProfileInline
 from agenda.models import Event
 import datetime
+import re
+import uuid
+from io import StringIO
+from django.core.management import call_command
 from django.contrib.auth.models import Permission
 
 
@@ -242,4 +246,56 @@ class AccountUserAdminTest(TestCase):
         response = self.account_user_admin.change_view(request, object_id=str(user.pk))
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.account_user_admin.inlines, [UserProfileInline])
\ No newline at end of file
+        self.assertEqual(self.account_user_admin.inlines, [UserProfileInline])
+
+class SubmissionTokenTest(TestCase):
+    def setUp(self):
+        self.username = "testuser"
+        self.password = "testpass"
+        self.user = User.objects.create_user(username=self.username, password=self.password)
+        self.user.user_permissions.add(Permission.objects.get(codename="add_partner"))
+        self.team_area = TeamArea.objects.create(text="Area", code="area")
+        self.client.login(username=self.username, password=self.password)
+        self.event_data = {"name": "Event", "initial_date": datetime.date.today(),
+                           "end_date": datetime.date.today(), "area_responsible": self.team_area.pk}
+
+    def test_the_forms_carry_a_new_token_each_time(self):
+        tokens = [re.search(r'name="submission_token" value="([0-9a-f]{32})"',
+                            self.client.get(reverse("agenda:create_event")).content.decode()).group(1)
+                  for _ in range(2)]
+        self.assertNotEqual(tokens[0], tokens[1])
+
+    def test_a_form_submitted_twice_is_saved_once(self):
+        data = dict(self.event_data, submission_token=uuid.uuid4().hex)
+        response_1 = self.client.post(reverse("agenda:create_event"), data=data)
+
+        with self.assertNumQueries(3):
+            response_2 = self.client.post(reverse("agenda:create_event"), data=data)
+        self.assertEqual(Event.objects.count(), 1)
+        self.assertEqual(response_2.status_code, 302)
+        self.assertEqual(response_2["Location"], response_1["Location"])
+
+        self.client.post(reverse("agenda:create_event"), data=dict(data, submission_token=uuid.uuid4().hex))
+        self.assertEqual(Event.objects.count(), 2)
+
+    def test_a_form_with_errors_does_not_use_its_token(self):
+        token = uuid.uuid4().hex
+        response = self.client.post(reverse("report:add_partner"), data={"name": "", "submission_token": token})
+        self.assertEqual(response.json()["id"], None)
+        self.assertFalse(SubmissionToken.objects.exists())
+
+        response_1 = self.client.post(reverse("report:add_partner"), data={"name": "Partner", "submission_token": token})
+        response_2 = self.client.post(reverse("report:add_partner"), data={"name": "Other", "submission_token": token})
+        self.assertEqual(response_2.json(), response_1.json())
+        self.assertEqual(response_2.json()["text"], "Partner")
+
+    def test_clear_submission_tokens_deletes_the_expired_ones(self):
+        self.client.post(reverse("agenda:create_event"), data=dict(self.event_data, submission_token="a" * 32))
+        self.client.post(reverse("agenda:create_event"), data=dict(self.event_data, submission_token="b" * 32))
+        SubmissionToken.objects.filter(token="a" * 32).update(
+            created_at=datetime.datetime.now() - datetime.timedelta(days=2))
+
+        out = StringIO()
+        call_command("clear_submission_tokens", stdout=out)
+        self.assertEqual(list(SubmissionToken.objects.values_list("token", flat=True)), ["b" * 32])
+        self.assertIn("1 submission tokens deleted", out.getvalue())